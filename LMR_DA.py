@@ -7,6 +7,9 @@
 #
 #==========================================================================================
 
+import os
+import hashlib
+import zipfile
 import numpy as np
 import LMR_utils
 
@@ -24,7 +27,11 @@ def enkf_update_array(Xb, obvalue, Ye, ob_err, loc=None, inflate=None):
                     - changed varye = np.var(Ye) to varye = np.var(Ye,ddof=1) 
                     for an unbiased calculation of the variance. 
                     (G. Hakim - U. Washington)
-    
+    October 2026:
+                    - the data type of the state (e.g. float32) is preserved
+                    in the update, with the ensemble means and variances
+                    accumulated in float64.
+
     -----------------------------------------------------------------
      Inputs:
           Xb: background ensemble estimates of state (Nx x Nens) 
@@ -38,16 +45,17 @@ def enkf_update_array(Xb, obvalue, Ye, ob_err, loc=None, inflate=None):
     # Get ensemble size from passed array: Xb has dims [state vect.,ens. members]
     Nens = Xb.shape[1]
 
-    # ensemble mean background and perturbations
-    xbm = np.mean(Xb,axis=1)
+    # ensemble mean background and perturbations (means accumulated in
+    # float64, perturbations kept in the data type of the state)
+    xbm = np.mean(Xb,axis=1,dtype=np.float64).astype(Xb.dtype)
     Xbp = np.subtract(Xb,xbm[:,None])  # "None" means replicate in this dimension
 
     # ensemble mean and variance of the background estimate of the proxy 
-    mye   = np.mean(Ye)
-    varye = np.var(Ye,ddof=1)
+    mye   = np.mean(Ye,dtype=np.float64)
+    varye = np.var(Ye,ddof=1,dtype=np.float64)
 
     # lowercase ye has ensemble-mean removed 
-    ye = np.subtract(Ye, mye)
+    ye = np.subtract(Ye, mye).astype(Xb.dtype)
 
     # innovation
     try:
@@ -72,14 +80,14 @@ def enkf_update_array(Xb, obvalue, Ye, ob_err, loc=None, inflate=None):
         kcov = np.multiply(kcov,loc) 
    
     # Kalman gain
-    kmat = np.divide(kcov, kdenom)
+    kmat = np.divide(kcov, kdenom).astype(Xb.dtype)
 
     # update ensemble mean
-    xam = xbm + np.multiply(kmat,innov)
+    xam = xbm + np.multiply(kmat,innov).astype(Xb.dtype)
 
     # update the ensemble members using the square-root approach
     beta = 1./(1. + np.sqrt(ob_err/(varye+ob_err)))
-    kmat = np.multiply(beta,kmat)
+    kmat = np.multiply(beta,kmat).astype(Xb.dtype)
     ye   = np.array(ye)[np.newaxis]
     kmat = np.array(kmat)[np.newaxis]
     Xap  = Xbp - np.dot(kmat.T, ye)
@@ -95,6 +103,365 @@ def enkf_update_array(Xb, obvalue, Ye, ob_err, loc=None, inflate=None):
     return Xa
 
 
+#==========================================================================================
+#
+#==========================================================================================
+
+def enkf_update_serial_inplace(xbm, Xbp, obvalues, ye_rows, ob_errs, locs=None,
+                               callback=None, rowblock=None, check_finite=False):
+    """
+    Serial EnSRF update of a batch of observations, applied in place to a
+    state held as an ensemble-mean / ensemble-perturbation pair.
+
+    Each observation is processed exactly as in enkf_update_array, but the
+    ensemble mean and perturbations are carried from one observation to the
+    next instead of being re-derived from a full state array, and the
+    updates are written directly into xbm and Xbp (no new Nx x Nens array
+    is allocated per observation).
+
+    Originator: Based on enkf_update_array (G. J. Hakim, L. Madaus)
+                Dept. Atmos. Sciences, Univ. of Washington
+
+    -----------------------------------------------------------------
+     Inputs:
+         xbm: ensemble-mean of the (augmented) state (Nx), updated in place
+         Xbp: ensemble perturbations of the (augmented) state (Nx x Nens),
+              updated in place. Must be a regular (non-masked) array, with
+              NaN for missing values (e.g. ocean points of land variables).
+    obvalues: proxy values (Nobs)
+     ye_rows: row indices in the state of the ensemble estimates of each
+              proxy (Nobs), i.e. the Ye's appended to the augmented state
+     ob_errs: proxy error variances (Nobs)
+        locs: sequence of localization vectors (Nx), sparse (indices,
+              weights) tuples as returned by LocalizationCache.get or None
+              entries, or a function returning the localization of the k-th
+              observation as locs(k) [optional]. With sparse localization,
+              the gain and update are only calculated for the rows with
+              nonzero weights.
+    callback: function called as callback(k, xbm) after the update with
+              the k-th observation (e.g. for diagnostics) [optional]
+    rowblock: if set, the perturbations are updated by blocks of rowblock
+              rows, bounding the temporary memory of the update to
+              (rowblock x Nens) instead of (Nx x Nens) [optional]
+check_finite: if True, check that the gain is finite on the valid (i.e.
+              non-NaN) rows of the state after each observation, and raise
+              a ValueError otherwise (i.e. the reconstruction has blown-up)
+              [optional]
+
+     Outputs:
+        nupdates: number of observations actually assimilated
+    """
+
+    Nx, Nens = Xbp.shape
+
+    if check_finite:
+        valid = np.isfinite(xbm)
+
+    nupdates = 0
+    for k in range(len(obvalues)):
+        irow = ye_rows[k]
+        ob_err = ob_errs[k]
+
+        # lowercase ye has ensemble-mean removed. Copy as Xbp is updated below.
+        mye = xbm[irow]
+        ye = Xbp[irow, :].copy()
+        varye = np.var(ye, ddof=1, dtype=np.float64)
+
+        # innovation
+        innov = obvalues[k] - mye
+        if not np.isfinite(innov):
+            print('innovation error. obvalue = ' + str(obvalues[k]) + ' mye = ' + str(mye))
+            print('state left unchanged for this observation...')
+            continue
+
+        # innovation variance (denominator of serial Kalman gain)
+        kdenom = (varye + ob_err)
+
+        # Localization of the gain
+        loc = None
+        if locs is not None:
+            loc = locs(k) if callable(locs) else locs[k]
+
+        # Rows of the state to update: all of them, or only those with
+        # nonzero localization weights if these are given in sparse form
+        # (indices, weights). Other rows would have a zero gain.
+        if isinstance(loc, tuple):
+            rows, loc = loc
+            nrows = rows.size
+        else:
+            rows = None
+            nrows = Nx
+        step = rowblock if rowblock is not None else max(nrows, 1)
+
+        # numerator of serial Kalman gain (cov(x,Hx))
+        if rows is None:
+            kcov = np.dot(Xbp, ye) / (Nens-1)
+        elif rowblock is None:
+            kcov = np.dot(Xbp[rows], ye) / (Nens-1)
+        else:
+            kcov = np.concatenate([np.dot(Xbp[rows[i:i+step]], ye)
+                                   for i in range(0, nrows, step)]) / (Nens-1)
+
+        # Option to localize the gain
+        if loc is not None:
+            kcov *= loc
+
+        # Kalman gain
+        kmat = np.divide(kcov, kdenom, out=kcov)
+
+        # cheap blow-up check on the gain rather than on the updated state
+        if check_finite:
+            valid_rows = valid if rows is None else valid[rows]
+            if not (np.isfinite(kdenom) and np.isfinite(ye).all() and
+                    np.isfinite(kmat[valid_rows]).all()):
+                raise ValueError('Non-finite Kalman gain for observation ' + str(k))
+
+        # update ensemble mean
+        if rows is None:
+            xbm += kmat*innov
+        else:
+            xbm[rows] += kmat*innov
+
+        # update the ensemble perturbations using the square-root approach
+        # (by blocks of rows if requested)
+        beta = 1./(1. + np.sqrt(ob_err/(varye+ob_err)))
+        kmat *= beta
+        for i in range(0, nrows, step):
+            blk = slice(i, i+step)
+            if rows is None:
+                Xbp[blk] -= np.outer(kmat[blk], ye)
+            else:
+                Xbp[rows[blk]] -= np.outer(kmat[blk], ye)
+
+        nupdates += 1
+        if callback is not None:
+            callback(k, xbm)
+
+    return nupdates
+
+
+def enkf_update_array_batch(Xb, obvalues, ye_rows, ob_errs, locs=None,
+                            inflate=None, callback=None):
+    """
+    Batched version of enkf_update_array: serially assimilates all
+    observations available at a given time, with results comparable (to
+    round-off) to calling enkf_update_array once per observation.
+
+    The ensemble mean and perturbations are calculated once from Xb, then
+    updated in place by enkf_update_serial_inplace, and the full state is
+    rebuilt once at the end.
+
+    -----------------------------------------------------------------
+     Inputs:
+          Xb: background ensemble estimates of the augmented state
+              (Nx x Nens), Ye's of the proxies included as rows
+    obvalues: proxy values (Nobs)
+     ye_rows: row indices of the Ye's of each proxy in Xb (Nobs)
+     ob_errs: proxy error variances (Nobs)
+        locs: sequence of localization vectors (Nx) or None entries, or
+              function of k returning them [optional]
+     inflate: scalar inflation factor [optional, not implemented as in
+              enkf_update_array]
+    callback: function called as callback(k, xam) after the update with
+              the k-th observation [optional]
+
+     Outputs:
+          Xa: analysis ensemble (Nx x Nens). A masked array with
+              fill_value = nan if Xb is a masked array.
+    """
+
+    masked = np.ma.isMaskedArray(Xb)
+    if masked:
+        Xb = Xb.filled(np.nan)
+
+    # ensemble mean background (accumulated and carried in float64) and
+    # perturbations (in the data type of the state)
+    xbm = np.mean(Xb, axis=1, dtype=np.float64)
+    Xbp = np.subtract(Xb, xbm[:,None], dtype=Xb.dtype)
+
+    enkf_update_serial_inplace(xbm, Xbp, obvalues, ye_rows, ob_errs,
+                               locs=locs, callback=callback)
+
+    # full state
+    Xa = np.add(Xbp, xbm[:,None], out=Xbp)
+
+    if masked:
+        Xa = np.ma.masked_invalid(Xa)
+        np.ma.set_fill_value(Xa, np.nan)
+
+    return Xa
+
+
+#==========================================================================================
+#
+#==========================================================================================
+
+def etkf_weights(Yp, innov, ob_errs):
+    """
+    Ensemble transform Kalman filter (ETKF) solution in ensemble space
+    (ref: Hunt et al., Physica D, 2007): all observations assimilated at
+    once.
+
+    -----------------------------------------------------------------
+     Inputs:
+          Yp: ensemble perturbations of the proxy estimates (Nobs x Nens)
+       innov: innovations, i.e. proxy values minus ensemble-mean of proxy
+              estimates (Nobs)
+     ob_errs: proxy error variances (Nobs)
+
+     Outputs:
+        wbar: weights of the ensemble-mean increment (Nens), such that
+              xam = xbm + Xbp.wbar
+          Wa: symmetric transform of the perturbations (Nens x Nens), such
+              that Xap = Xbp.Wa
+    """
+
+    Nens = Yp.shape[1]
+
+    # C = Yp^T R^-1
+    C = Yp.T / ob_errs[None,:]
+    # analysis error covariance in ensemble space: [(Nens-1)I + C Yp]^-1,
+    # through the eigen-decomposition of the symmetric matrix
+    A = np.dot(C, Yp)
+    A[np.diag_indices(Nens)] += (Nens-1)
+    eigvals, eigvecs = np.linalg.eigh(A)
+    Pa = np.dot(eigvecs / eigvals[None,:], eigvecs.T)
+
+    # ensemble-mean increment weights
+    wbar = np.dot(Pa, np.dot(C, innov))
+    # symmetric square root of (Nens-1) Pa
+    Wa = np.dot(eigvecs * np.sqrt((Nens-1) / eigvals)[None,:], eigvecs.T)
+
+    return wbar, Wa
+
+
+def etkf_domains(X_coords, localizeable, block_deg):
+    """
+    Decomposition of the state vector in local domains for a localized
+    ETKF: localizeable elements are grouped in lat/lon boxes of block_deg
+    degrees, and non-localizeable elements form a single domain.
+
+    -----------------------------------------------------------------
+     Inputs:
+        X_coords: array containing geographic location information of
+                  state vector elements (Nx x 2, lat & lon)
+    localizeable: boolean mask of localizeable elements (Nx)
+       block_deg: size (in degrees of lat. & lon.) of local domains
+
+     Outputs:
+         domains: list of (indices, center lat, center lon) of the state
+                  elements in each domain. Center lat/lon are None for the
+                  domain of non-localizeable elements.
+    """
+
+    domains = []
+
+    inds = np.flatnonzero(localizeable)
+    if inds.size > 0:
+        lat = X_coords[inds, 0]
+        lon = np.mod(X_coords[inds, 1], 360.)
+        ilat = np.floor((lat + 90.) / block_deg).astype(np.int64)
+        ilon = np.floor(lon / block_deg).astype(np.int64)
+        nlon_blocks = int(np.ceil(360. / block_deg)) + 1
+        block_id = ilat * nlon_blocks + ilon
+        order = np.argsort(block_id, kind='mergesort')
+        block_id = block_id[order]
+        bounds = np.flatnonzero(np.diff(block_id)) + 1
+        for rows in np.split(inds[order], bounds):
+            clat = np.mean(X_coords[rows, 0])
+            clon = np.mod(X_coords[rows, 1], 360.)
+            # center longitude: average as unit vectors
+            clon = np.degrees(np.arctan2(np.mean(np.sin(np.radians(clon))),
+                                         np.mean(np.cos(np.radians(clon)))))
+            domains.append((rows, clat, clon))
+
+    inds = np.flatnonzero(~localizeable)
+    if inds.size > 0:
+        domains.append((inds, None, None))
+
+    return domains
+
+
+def enkf_update_etkf(Xb, obvalues, ye_rows, ob_errs, locRad=None, domains=None,
+                     ob_coords=None):
+    """
+    Ensemble transform Kalman filter (ETKF) update of the (augmented) state
+    with all observations available at a given time assimilated at once.
+
+    Without localization, the analysis ensemble-mean and covariance are the
+    same as with the serial EnSRF (enkf_update_array), but the update only
+    requires a few matrix-matrix products. Localization is approximated by
+    domain decomposition (see etkf_domains): the state elements of each
+    local domain are updated using the observations within locRad of the
+    domain center, with error variances inflated by the inverse of their
+    Gaspari-Cohn weight (R-localization).
+
+    -----------------------------------------------------------------
+     Inputs:
+          Xb: background ensemble estimates of the augmented state
+              (Nx x Nens), Ye's of the proxies included as rows
+    obvalues: proxy values (Nobs)
+     ye_rows: row indices of the Ye's of each proxy in Xb (Nobs)
+     ob_errs: proxy error variances (Nobs)
+      locRad: localization radius (km) [optional]
+     domains: local domains, as returned by etkf_domains [required with
+              locRad]
+   ob_coords: lat/lon of the proxy sites (Nobs x 2) [required with locRad]
+
+     Outputs:
+          Xa: analysis ensemble (Nx x Nens). A masked array with
+              fill_value = nan if Xb is a masked array.
+    """
+
+    masked = np.ma.isMaskedArray(Xb)
+    if masked:
+        Xb = Xb.filled(np.nan)
+
+    obvalues = np.asarray(obvalues, dtype=np.float64)
+    ob_errs = np.asarray(ob_errs, dtype=np.float64)
+    ye_rows = np.asarray(ye_rows, dtype=np.int64)
+
+    # ensemble mean background (accumulated in float64) and perturbations
+    # (in the data type of the state). The ensemble-space solution is
+    # calculated in float64, and the transform applied in the state dtype.
+    xbm = np.mean(Xb, axis=1, dtype=np.float64)
+    Xbp = np.subtract(Xb, xbm[:,None], dtype=Xb.dtype)
+
+    if obvalues.size == 0:
+        Xa = Xb.copy()
+    elif locRad is None:
+        Yp = Xbp[ye_rows, :].astype(np.float64)
+        innov = obvalues - xbm[ye_rows]
+        wbar, Wa = etkf_weights(Yp, innov, ob_errs)
+        Wa[...] += wbar[:,None]
+        Xa = np.dot(Xbp, Wa.astype(Xbp.dtype))
+        Xa += xbm[:,None]
+    else:
+        Xa = np.empty_like(Xbp)
+        for rows, clat, clon in domains:
+            if clat is None:
+                # non-localizeable elements: all obs with full weight
+                obs_weights = np.ones(obvalues.size)
+            else:
+                dists = LMR_utils.haversine(clon, clat, ob_coords[:,1], ob_coords[:,0])
+                obs_weights = gaspari_cohn(np.asarray(dists, dtype=np.float64), locRad)
+            local = obs_weights > 0.
+            if not local.any():
+                Xa[rows] = Xb[rows]
+                continue
+            Yp = Xbp[ye_rows[local], :].astype(np.float64)
+            innov = obvalues[local] - xbm[ye_rows[local]]
+            wbar, Wa = etkf_weights(Yp, innov, ob_errs[local] / obs_weights[local])
+            Wa[...] += wbar[:,None]
+            Xa[rows] = np.dot(Xbp[rows], Wa.astype(Xbp.dtype)) + xbm[rows,None]
+
+    if masked:
+        Xa = np.ma.masked_invalid(Xa)
+        np.ma.set_fill_value(Xa, np.nan)
+
+    return Xa
+
+
 #========================================================================================== 
 #
 #========================================================================================== 
@@ -119,27 +486,46 @@ def cov_localization(locRad, Y, X, X_coords):
 
     """
 
-    # declare the localization array, filled with ones to start with (as in no localization)
     stateVectDim, nbdimcoord = X_coords.shape
-    covLoc = np.ones(shape=[stateVectDim],dtype=np.float64)
 
     # Mask to identify elements of state vector that are "localizeable"
     # i.e. fields with (lat,lon)
-    localizeable = covLoc == 1. # Initialize as True
+    localizeable = localizeable_mask(X, stateVectDim)
+
+    return _localization_weights(locRad, Y.lat, Y.lon, X_coords, localizeable)
+
+
+def localizeable_mask(X, stateVectDim):
+    """
+    Boolean mask identifying the elements of the state vector that are
+    "localizeable", i.e. belonging to fields with (lat,lon) coordinates.
+    Elements beyond the state variables (e.g. appended Ye's) are tagged as
+    localizeable.
+    """
+
+    localizeable = np.ones(shape=[stateVectDim], dtype=bool) # Initialize as True
     
     for var in X.trunc_state_info.keys():
         [var_state_pos_begin,var_state_pos_end] =  X.trunc_state_info[var]['pos']
         # if variable is not a field with lats & lons, tag localizeable as False
         if X.trunc_state_info[var]['spacecoords'] != ('lat', 'lon'):
             localizeable[var_state_pos_begin:var_state_pos_end+1] = False
-    
+
+    return localizeable
+
+
+def _localization_weights(locRad, site_lat, site_lon, X_coords, localizeable):
+    """
+    Gaspari-Cohn localization weights of the state vector elements w.r.t.
+    proxy site at (site_lat, site_lon). See cov_localization.
+    """
+
+    stateVectDim, nbdimcoord = X_coords.shape
+
     # array of distances between state vector elements & proxy site
     # initialized as zeros: this is important!
     dists = np.zeros(shape=[stateVectDim])
 
-    # geographic location of proxy site
-    site_lat = Y.lat
-    site_lon = Y.lon
     # geographic locations of elements of state vector
     X_lon = X_coords[:,1]
     X_lat = X_coords[:,0]
@@ -153,7 +539,20 @@ def cov_localization(locRad, Y, X, X_coords):
     # so these elements will not be included in the indexing
     # according to distances (see below)
     dists[~localizeable] = np.nan
-    
+
+    return gaspari_cohn(dists, locRad)
+
+
+def gaspari_cohn(dists, locRad):
+    """
+    Gaspari-Cohn localization weights for distances dists (in km) and
+    localization radius locRad. Elements with a distance of NaN are
+    given a weight of one (no localization).
+    """
+
+    # filled with ones to start with (as in no localization)
+    covLoc = np.ones(shape=dists.shape, dtype=np.float64)
+
     # Some transformation to variables used in calculating localization weights
     hlr = 0.5*locRad; # work with half the localization radius
     r = dists/hlr;
@@ -181,3 +580,159 @@ def cov_localization(locRad, Y, X, X_coords):
 
     
     return covLoc
+
+
+class LocalizationCache(object):
+    """
+    Cache of covariance localization weights, per proxy site.
+
+    Proxy locations and the state grid do not change during a
+    reconstruction, so the weights of a given site are calculated once
+    (as in cov_localization) and stored in sparse form, i.e. as the indices
+    of the state vector elements with nonzero weight and the corresponding
+    weights. The weights of the state variables can optionally be persisted
+    to (and reloaded from) a npz file in cache_dir, identified by a hash of
+    the state grid, the localizeable elements and the localization radius.
+    The weights of the Ye's appended to the state vector (which depend on
+    the proxies drawn in a Monte-Carlo iteration) are calculated per site
+    and kept in memory only.
+
+    Attributes
+    ----------
+    locRad: float
+        Localization radius (in km)
+    stateDim: int
+        Nb of state vector elements of the state variables, i.e. without
+        the appended Ye's
+    key: str
+        Hash identifying the state grid and localization radius
+    filename: str or None
+        Path of the npz file where the cache is persisted
+    """
+
+    def __init__(self, locRad, X, X_coords, cache_dir=None):
+        self.locRad = locRad
+        self.X_coords = X_coords
+        stateVectDim, _ = X_coords.shape
+        self.stateVectDim = stateVectDim
+        self.localizeable = localizeable_mask(X, stateVectDim)
+        self.stateDim = max(info['pos'][1]+1
+                            for info in X.trunc_state_info.values())
+
+        hsh = hashlib.sha1()
+        hsh.update(np.ascontiguousarray(X_coords[:self.stateDim],
+                                        dtype=np.float64).tobytes())
+        hsh.update(self.localizeable[:self.stateDim].tobytes())
+        hsh.update(repr(float(locRad)).encode('utf-8'))
+        self.key = hsh.hexdigest()
+
+        # weights of the state variables (persisted), and of the full
+        # state vector including the appended Ye's
+        self._state_sites = {}
+        self._sites = {}
+        self._modified = False
+
+        self.filename = None
+        if cache_dir is not None:
+            self.filename = os.path.join(cache_dir, 'loc_cache_' + self.key + '.npz')
+            if os.path.isfile(self.filename):
+                self.load()
+
+    @staticmethod
+    def _site_key(lat, lon):
+        return (round(float(lat), 6), round(float(lon), 6))
+
+    def get(self, Y):
+        """
+        Sparse localization weights for proxy Y.
+
+        Returns
+        -------
+        inds: ndarray
+            Indices of state vector elements with nonzero weights
+        weights: ndarray
+            Corresponding localization weights
+        """
+        key = self._site_key(Y.lat, Y.lon)
+        try:
+            return self._sites[key]
+        except KeyError:
+            pass
+
+        try:
+            state_inds, state_weights = self._state_sites[key]
+        except KeyError:
+            covLoc = _localization_weights(self.locRad, Y.lat, Y.lon,
+                                           self.X_coords[:self.stateDim],
+                                           self.localizeable[:self.stateDim])
+            state_inds = np.flatnonzero(covLoc)
+            state_weights = covLoc[state_inds]
+            self._state_sites[key] = (state_inds, state_weights)
+            self._modified = True
+
+        if self.stateVectDim > self.stateDim:
+            covLoc = _localization_weights(self.locRad, Y.lat, Y.lon,
+                                           self.X_coords[self.stateDim:],
+                                           self.localizeable[self.stateDim:])
+            ye_inds = np.flatnonzero(covLoc)
+            sparse_loc = (np.concatenate((state_inds, ye_inds + self.stateDim)),
+                          np.concatenate((state_weights, covLoc[ye_inds])))
+        else:
+            sparse_loc = (state_inds, state_weights)
+        self._sites[key] = sparse_loc
+        return sparse_loc
+
+    def dense(self, Y):
+        """
+        Localization vector (Nx) for proxy Y, as returned by cov_localization.
+        """
+        inds, weights = self.get(Y)
+        covLoc = np.zeros(shape=[self.stateVectDim], dtype=np.float64)
+        covLoc[inds] = weights
+        return covLoc
+
+    def load(self):
+        """
+        Load cached weights (of the state variables) from file. An
+        unreadable file is ignored (weights calculated again).
+        """
+        try:
+            with np.load(self.filename) as data:
+                sites = data['sites']
+                offsets = data['offsets']
+                inds = data['inds']
+                weights = data['weights']
+        except (IOError, OSError, EOFError, ValueError, KeyError,
+                zipfile.BadZipFile):
+            print('Unreadable localization cache file (ignored): ' + self.filename)
+            return
+        for i, (lat, lon) in enumerate(sites):
+            beg, end = offsets[i], offsets[i+1]
+            self._state_sites[self._site_key(lat, lon)] = (inds[beg:end],
+                                                           weights[beg:end])
+
+    def save(self):
+        """
+        Write cached weights (of the state variables) to file, if new sites
+        have been added.
+        """
+        if self.filename is None or not self._modified:
+            return
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        keys = list(self._state_sites.keys())
+        nvals = [self._state_sites[key][0].size for key in keys]
+        offsets = np.concatenate(([0], np.cumsum(nvals))).astype(np.int64)
+        if keys:
+            inds = np.concatenate([self._state_sites[key][0] for key in keys])
+            weights = np.concatenate([self._state_sites[key][1] for key in keys])
+        else:
+            inds = np.zeros(0, dtype=np.int64)
+            weights = np.zeros(0, dtype=np.float64)
+        # written to a temporary file first: other processes (concurrent
+        # iterations) may be reading the cache at the same time
+        tmpfilen = '{}.{}.tmp'.format(self.filename, os.getpid())
+        with open(tmpfilen, 'wb') as f:
+            np.savez(f, sites=np.array(keys, dtype=np.float64).reshape(-1, 2),
+                     offsets=offsets, inds=inds, weights=weights)
+        os.replace(tmpfilen, self.filename)
+        self._modified = False
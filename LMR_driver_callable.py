@@ -63,7 +63,48 @@ Revisions:
             - Included the Ye's from withheld proxies to state vector so they get 
               updated during DA as well for easier & complete proxy-based evaluation
               of reconstruction. (R. Tardif - U. of Washington)
+    Oct. 2026:
+            - Added the 'serial_batch' DA solver option (core.da_solver) for
+              offline reconstructions: all proxies available at a given time
+              are assimilated in a single call operating in place on the
+              ensemble mean and perturbations.
+            - Added a memory-lean update mode (core.lean_update) in which the
+              analysis is computed in place in a preallocated buffer (of the
+              data type of the state vector, core.state_dtype), with a blow-up check on the Kalman gain of the
+              updated rows instead of on the variance of the full state.
+            - Covariance localization weights are now calculated once per
+              proxy site and cached (in sparse form), optionally persisted
+              to disk (core.loc_cache_dir).
+            - Added a parallel scheduler for offline reconstructions
+              (core.recon_workers): years are distributed over a pool of
+              worker processes sharing the prior through a memory-mapped
+              file. Years with existing output are skipped when
+              core.clean_start is False (restart of an interrupted run).
+            - Added the 'etkf' DA solver option for offline reconstructions:
+              ensemble transform Kalman filter with all proxies available at
+              a given time assimilated at once (localized through a domain
+              decomposition of the state, core.etkf_domain_size).
+            - Ye's calculated from the prior for all proxies at once
+              (LMR_psms.psm_batch) when precalculated values are not
+              available.
+            - Analyses written to a single memory-mapped store
+              (LMR_utils.AnalysisStore, core.analysis_store) instead of one
+              file per year.
+            - ESMF regridding weights of the prior truncation calculated once
+              per grids and method, optionally persisted to disk
+              (core.regrid_weights_dir).
+            - Processed prior data read from (and written to) a persistent
+              cache when prior.prior_cache_dir is set.
+            - Only the data of the sampled prior years read from the prior
+              files when prior.read_sampled_years is set.
+            - State variables of the prior optionally read concurrently
+              (prior.load_workers, prior.load_memory_budget).
+            - State vector optionally assembled, updated and written in
+              float32 (core.state_dtype), from the prior ensemble and Ye's
+              to the per-year analyses.
 """
+import os
+import multiprocessing
 import numpy as np
 from os.path import join
 from time import time
@@ -72,10 +113,227 @@ import LMR_proxy_pandas_rework
 import LMR_prior
 import LMR_utils
 import LMR_config as BaseCfg
-from LMR_DA import enkf_update_array, cov_localization
+from LMR_DA import enkf_update_array, enkf_update_array_batch, \
+    enkf_update_serial_inplace, enkf_update_etkf, etkf_domains, \
+    localizeable_mask, LocalizationCache
+from LMR_psms import psm_batch
 from LMR_utils import FlagError
 
 
+def _proxy_ob_for_interval(Y, start_yr, end_yr, recon_timescale):
+    """
+    Returns the (mean value, number of values) of the observations of proxy
+    Y within the time interval [start_yr, end_yr], or None if the proxy
+    record has no data over that interval.
+    """
+    if recon_timescale > 1:
+        # exclude lower bound to not include same obs in adjacent time intervals
+        Yvals = Y.values[(Y.values.index > start_yr) & (Y.values.index <= end_yr)]
+    else:
+        Yvals = Y.values[(Y.values.index >= start_yr) & (Y.values.index <= end_yr)]
+    if Yvals.empty:
+        return None
+    return Yvals.mean(), len(Yvals)
+
+
+def _proxy_obs_by_interval(Y, start_yrs, end_yrs, recon_timescale):
+    """
+    Vectorized version of _proxy_ob_for_interval over a sequence of time
+    intervals. Returns arrays with the mean value and the number of values
+    of the observations of proxy Y in each interval (mean is NaN where there
+    are no observations).
+    """
+    idx = np.asarray(Y.values.index, dtype=np.float64)
+    vals = np.asarray(Y.values.values, dtype=np.float64)
+    order = np.argsort(idx, kind='mergesort')
+    idx = idx[order]
+    vals = vals[order]
+
+    # exclude lower bound to not include same obs in adjacent time intervals
+    side = 'right' if recon_timescale > 1 else 'left'
+    lo = np.searchsorted(idx, start_yrs, side=side)
+    hi = np.searchsorted(idx, end_yrs, side='right')
+    nobs = hi - lo
+
+    means = np.full(len(nobs), np.nan)
+    single = nobs == 1
+    means[single] = vals[lo[single]]
+    for j in np.flatnonzero(nobs > 1):
+        if np.isfinite(vals[lo[j]:hi[j]]).any():
+            means[j] = np.nanmean(vals[lo[j]:hi[j]])
+
+    return means, nobs
+
+
+def _recon_obs_by_interval(assim_proxy_objs, recon_times, recon_timescale,
+                           loc_cache=None):
+    """
+    Observations of the assimilated proxies for all the times of an
+    (offline) reconstruction, for the workers of the parallel scheduler.
+
+    Returns the (Nproxies x Ntimes) arrays of the mean value and number of
+    values of the observations in each time interval (see
+    _proxy_obs_by_interval), the ob error variances of the proxies and their
+    localization weights (None without loc_cache).
+    """
+    # iterated several times below (assim_proxy_objs may be a generator)
+    assim_proxy_objs = list(assim_proxy_objs)
+    nproxies = len(assim_proxy_objs)
+    ntimes = len(recon_times)
+
+    start_yrs = recon_times - recon_timescale//2
+    end_yrs = recon_times + recon_timescale//2
+    ob_means = np.zeros([nproxies, ntimes])
+    ob_counts = np.zeros([nproxies, ntimes], dtype=np.int64)
+    for proxy_idx, Y in enumerate(assim_proxy_objs):
+        ob_means[proxy_idx], ob_counts[proxy_idx] = \
+            _proxy_obs_by_interval(Y, start_yrs, end_yrs, recon_timescale)
+    ob_R = np.array([Y.psm_obj.R for Y in assim_proxy_objs], dtype=np.float64)
+
+    loc_weights = None
+    if loc_cache is not None:
+        loc_weights = [loc_cache.get(Y) for Y in assim_proxy_objs]
+
+    return ob_means, ob_counts, ob_R, loc_weights
+
+
+# Context of the worker processes of the parallel (offline) reconstruction,
+# set by _init_recon_worker
+_recon_ctx = {}
+
+
+def _init_recon_worker(ctx):
+    _recon_ctx.clear()
+    _recon_ctx.update(ctx)
+    # read-only prior, shared by all workers through the memory-mapped file
+    _recon_ctx['Xb_one_aug'] = np.load(ctx['prior_file'], mmap_mode='r')
+    # analysis store opened by each worker (None: one year*.npy file per year)
+    _recon_ctx['analysis_store'] = None
+    if ctx['analysis_store']:
+        _recon_ctx['analysis_store'] = LMR_utils.AnalysisStore(ctx['workdir'],
+                                                               mode='r+')
+
+
+def _recon_years_worker(years):
+    """
+    Performs the (offline) reconstruction for the list of (index, year) in
+    years, writing the analyses to the analysis store (or year*.npy files).
+    Years with an existing analysis are skipped unless clean_start is set.
+
+    Returns the worker process id, the number of years reconstructed, the
+    time taken and a list of (year index, global/hemispheric means update
+    history) for the reconstructed years ((year index, None) for skipped
+    years).
+    """
+    ctx = _recon_ctx
+    begin_time = time()
+
+    Xb_one_aug = ctx['Xb_one_aug']
+    ob_means = ctx['ob_means']
+    ob_counts = ctx['ob_counts']
+    ob_R = ctx['ob_R']
+    loc_weights = ctx['loc_weights']
+    gmt_info = ctx['gmt_info']
+    nproxies = ob_means.shape[0]
+
+    Xbuf = np.empty(Xb_one_aug.shape, dtype=ctx['dtype'])
+
+    nyears = 0
+    results = []
+    analysis_store = ctx.get('analysis_store')
+    for yr_idx, t in years:
+        filen = join(ctx['workdir'], 'year' + '{:07d}'.format(t) + '.npy')
+        if analysis_store is not None:
+            analysis_exists = analysis_store.done[yr_idx]
+        else:
+            analysis_exists = os.path.isfile(filen)
+        if analysis_exists and not ctx['clean_start']:
+            results.append((yr_idx, None))
+            continue
+
+        # proxies with obs in current time interval
+        obs_idx = np.flatnonzero(ob_counts[:, yr_idx] > 0)
+        obvalues = ob_means[obs_idx, yr_idx]
+        nYobs = ob_counts[obs_idx, yr_idx]
+        # if ob is an average of several values, adjust its ob error variance
+        ob_errs = ob_R[obs_idx] / np.maximum(nYobs, 1).astype(np.float64)
+        # Ye's of assimilated proxies follow the state in augmented vector
+        ye_rows = ctx['state_dim'] + obs_idx
+
+        locs = None
+        if loc_weights is not None:
+            locs = [loc_weights[i] for i in obs_idx]
+
+        gmt_update = None
+        if gmt_info is not None:
+            gmt_hist = np.zeros([3, nproxies+1])
+            gmt_hist[:, 0:2] = gmt_info['prior'][:, None]
+            lat = gmt_info['lat']
+            def gmt_update(k, xam):
+                xam_lalo = xam[gmt_info['ibeg']:(gmt_info['iend']+1)].reshape(
+                    gmt_info['nlat'], gmt_info['nlon'])
+                gmt_hist[:, obs_idx[k]+1] = \
+                    LMR_utils.global_hemispheric_means(xam_lalo, lat)
+
+        np.copyto(Xbuf, Xb_one_aug)
+        xbm = np.mean(Xbuf, axis=1, dtype=np.float64)
+        Xbuf -= xbm[:,None]
+        enkf_update_serial_inplace(xbm, Xbuf, obvalues, ye_rows, ob_errs, locs,
+                                   callback=gmt_update,
+                                   rowblock=ctx['rowblock'], check_finite=True)
+        Xbuf += xbm[:,None]
+        if analysis_store is not None:
+            analysis_store.write(yr_idx, Xbuf)
+        else:
+            np.save(filen, Xbuf)
+
+        if gmt_info is not None:
+            # Make sure GMT spots filled for proxies without obs at this time
+            for proxy_idx in np.flatnonzero(ob_counts[:, yr_idx] == 0):
+                gmt_hist[0, proxy_idx+1] = gmt_hist[0, proxy_idx]
+            results.append((yr_idx, gmt_hist))
+        else:
+            results.append((yr_idx, None))
+        nyears += 1
+
+    if analysis_store is not None:
+        analysis_store.flush()
+
+    return os.getpid(), nyears, time() - begin_time, results
+
+
+def setup_prior(cfg):
+    """
+    Returns the prior object assigned according to cfg.prior.prior_source,
+    with the attributes defined in the configuration.
+    """
+    prior = cfg.prior
+
+    X = LMR_prior.prior_assignment(prior.prior_source)
+
+    # TODO: AP explicit requirements
+    # add namelist attributes to the prior object
+    X.prior_datadir = prior.datadir_prior
+    X.prior_datafile = prior.datafile_prior
+    X.statevars = prior.state_variables
+    X.statevars_info = prior.state_variables_info
+    X.Nens = cfg.core.nens
+    # Use a specified reference period for state variable anomalies 
+    X.anom_reference = prior.anom_reference
+    # new option: detrending the prior
+    X.detrend = prior.detrend
+    print('detrend:', X.detrend)
+    X.avgInterval = prior.avgInterval
+    # persistent cache of processed prior data
+    X.prior_cache_dir = prior.prior_cache_dir
+    X.prior_cache_max_size = prior.prior_cache_max_size
+    X.read_sampled_years = prior.read_sampled_years
+    X.load_workers = prior.load_workers
+    X.load_memory_budget = prior.load_memory_budget
+
+    return X
+
+
 def LMR_driver_callable(cfg=None):
 
     if cfg is None:
@@ -97,6 +355,12 @@ def LMR_driver_callable(cfg=None):
     nens = core.nens
     loc_rad = core.loc_rad
     inflation_fact = core.inflation_fact
+    da_solver = core.da_solver
+    lean_update = core.lean_update and not online and da_solver != 'etkf'
+    state_dtype = np.dtype(core.state_dtype)
+    recon_workers = core.recon_workers
+    parallel_years = (recon_workers is not None and recon_workers > 1
+                      and not online and da_solver != 'etkf')
     prior_source = prior.prior_source
     datadir_prior = prior.datadir_prior
     datafile_prior = prior.datafile_prior
@@ -136,24 +400,10 @@ def LMR_driver_callable(cfg=None):
         print('Source for prior: ', prior_source)
 
     # Assign prior object according to "prior_source" (from namelist)
-    X = LMR_prior.prior_assignment(prior_source)
-
-    # TODO: AP explicit requirements
-    # add namelist attributes to the prior object
-    X.prior_datadir = datadir_prior
-    X.prior_datafile = datafile_prior
-    X.statevars = state_variables
-    X.statevars_info = state_variables_info
-    X.Nens = nens
-    # Use a specified reference period for state variable anomalies 
-    X.anom_reference = prior.anom_reference
-    # new option: detrending the prior
-    X.detrend = prior.detrend
-    print('detrend:', X.detrend)
-    X.avgInterval = prior.avgInterval
+    X = setup_prior(cfg)
     
     # Read data file & populate initial prior ensemble
-    X.populate_ensemble(prior_source, prior)
+    X.populate_ensemble(prior_source, prior, dtype=state_dtype)
     Xb_one_full = X.ens
 
     
@@ -193,11 +443,12 @@ def LMR_driver_callable(cfg=None):
     if verbose > 3:
         print('Assimilating proxy types/sites:', type_site_assim)
 
+    # count the total number of proxies
+    assim_proxy_count = len(prox_manager.ind_assim)
+
     if verbose > 0:
         print('--------------------------------------------------------------------')
         print('Proxy counts for experiment:')
-        # count the total number of proxies
-        assim_proxy_count = len(prox_manager.ind_assim)
         for pkey, plist in sorted(type_site_assim.items()):
             print(('%45s : %5d' % (pkey, len(plist))))
         print(('%45s : %5d' % ('TOTAL', assim_proxy_count)))
@@ -269,7 +520,8 @@ def LMR_driver_callable(cfg=None):
                                                        nlat,
                                                        nlon,
                                                        include_poles=target_grid['include_poles'],
-                                                       method=prior.esmpy_interp_method)
+                                                       method=prior.esmpy_interp_method,
+                                                       cache_dir=core.regrid_weights_dir)
                 else:
                     print('Exiting! Unrecognized regridding method.')
                     raise SystemExit
@@ -317,6 +569,9 @@ def LMR_driver_callable(cfg=None):
             # fill in new state info dictionary
             new_state_info[var] = dct
 
+            # regridded fields in the data type of the state vector
+            var_array_new = var_array_new.astype(state_dtype, copy=False)
+
             # if 1st time in loop over state variables, create Xb_one array as copy
             # of var_array_new
             if Nx == 0:
@@ -376,37 +631,35 @@ def LMR_driver_callable(cfg=None):
 
             # Manually calculate ye_values from state vector
             print('Calculating ye_values from the prior...')
-            Ye_assim = np.empty(shape=[assim_proxy_count, nens])
-            Ye_assim_coords = np.empty(shape=[assim_proxy_count, 2])
-            for k, proxy in enumerate(prox_manager.sites_assim_proxy_objs()):
-                Ye_assim[k, :] = proxy.psm(Xb_one_full,
-                                         X.full_state_info,
-                                         X.coords)
-                Ye_assim_coords[k, :] = np.asarray([proxy.lat, proxy.lon], dtype=np.float64)
+            # all proxies mapped at once (single nearest grid pt. search)
+            assim_objs = list(prox_manager.sites_assim_proxy_objs())
+            Ye_assim = psm_batch([proxy.psm_obj for proxy in assim_objs],
+                                 Xb_one_full, X.full_state_info, X.coords)
+            Ye_assim_coords = np.array([[proxy.lat, proxy.lon] for proxy in assim_objs],
+                                       dtype=np.float64).reshape(-1, 2)
 
 
             eval_proxy_count = 0
             if prox_manager.ind_eval:
                 eval_proxy_count = len(prox_manager.ind_eval)
-                Ye_eval = np.empty(shape=[eval_proxy_count, nens])
-                Ye_eval_coords = np.empty(shape=[eval_proxy_count, 2])
-                for k, proxy in enumerate(prox_manager.sites_eval_proxy_objs()):
-                    Ye_eval[k, :] = proxy.psm(Xb_one_full,
-                                              X.full_state_info,
-                                              X.coords)
-                    Ye_eval_coords[k, :] = np.asarray([proxy.lat, proxy.lon], dtype=np.float64)
+                eval_objs = list(prox_manager.sites_eval_proxy_objs())
+                Ye_eval = psm_batch([proxy.psm_obj for proxy in eval_objs],
+                                    Xb_one_full, X.full_state_info, X.coords)
+                Ye_eval_coords = np.array([[proxy.lat, proxy.lon] for proxy in eval_objs],
+                                          dtype=np.float64).reshape(-1, 2)
 
 
         # ----------------------------------
         # Augment state vector with the Ye's
         # ----------------------------------
         # Append ensemble of Ye's of assimilated proxies to prior state vector
-        Xb_one_aug = np.append(Xb_one, Ye_assim, axis=0)
+        # (in the data type of the state vector)
+        Xb_one_aug = np.append(Xb_one, Ye_assim.astype(state_dtype, copy=False), axis=0)
         Xb_one_coords = np.append(Xb_one_coords, Ye_assim_coords, axis=0)
 
         if prox_manager.ind_eval:
             # Append ensemble of Ye's of withheld proxies to prior state vector
-            Xb_one_aug = np.append(Xb_one_aug, Ye_eval, axis=0)
+            Xb_one_aug = np.append(Xb_one_aug, Ye_eval.astype(state_dtype, copy=False), axis=0)
             Xb_one_coords = np.append(Xb_one_coords, Ye_eval_coords, axis=0)
         
     else:
@@ -426,6 +679,27 @@ def LMR_driver_callable(cfg=None):
              stateDim=state_dim,
              Xb_one_coords=Xb_one_coords, state_info=X.trunc_state_info)
 
+    # Covariance localization weights, calculated once per proxy site
+    loc_cache = None
+    etkf_local_domains = None
+    if loc_rad is not None and da_solver == 'etkf' and not online:
+        # domain decomposition of the state for localized ETKF
+        etkf_local_domains = etkf_domains(Xb_one_coords,
+                                          localizeable_mask(X, Xb_one_coords.shape[0]),
+                                          core.etkf_domain_size)
+    elif loc_rad is not None:
+        loc_cache = LocalizationCache(loc_rad, X, Xb_one_coords,
+                                      cache_dir=core.loc_cache_dir)
+
+    if lean_update:
+        # Memory-lean update: the prior is kept as a regular array (NaN for
+        # missing values) and each year is updated in place in a single
+        # preallocated buffer
+        Xb_one_aug = out_Xb_one_aug
+        Xbuf = np.empty(Xb_one_aug.shape, dtype=state_dtype)
+        # rows per block in update of perturbations (bounded temporary arrays)
+        lean_rowblock = max(1, (8*1024**2)//nens)
+
     # NEW: write out (to prior_sampling_info.txt file) the info on prior sampling
     # i.e. the list of indices (i.e. years for annual recons) randomly chosen
     # from available model states
@@ -511,11 +785,113 @@ def LMR_driver_callable(cfg=None):
         nhmt_save[1,:] = nhmt
         shmt_save[1,:] = shmt
 
+    recon_years_seq = list(range(recon_period[0], recon_period[1]+1, recon_timescale))
+
+    # Analyses written to a single memory-mapped store (or one file per year)
+    analysis_store = None
+    if core.analysis_store:
+        analysis_store = LMR_utils.AnalysisStore.create(workdir, recon_times,
+                                                        out_Xb_one_aug.shape,
+                                                        state_dtype,
+                                                        restart=not core.clean_start)
+
+    if parallel_years:
+        # ----------------------------------------------------------------------
+        # Offline reconstruction: years are independent, and are distributed
+        # over a pool of worker processes sharing the read-only prior
+        # ----------------------------------------------------------------------
+        if verbose > 0:
+            print('\n==== Reconstructing ' + str(ntimes) + ' times using ' +
+                  str(recon_workers) + ' worker processes')
+
+        prior_file = join(workdir, 'Xb_one_aug.npy')
+        np.save(prior_file, out_Xb_one_aug)
+
+        # proxy obs for all time intervals
+        ob_means, ob_counts, ob_R, loc_weights = \
+            _recon_obs_by_interval(prox_manager.sites_assim_proxy_objs(),
+                                   recon_times, recon_timescale, loc_cache)
+
+        gmt_info = None
+        if tas_var:
+            gmt_info = {'ibeg': ibeg_tas, 'iend': iend_tas,
+                        'nlat': nlat_new, 'nlon': nlon_new,
+                        'lat': lat_lalo[:, 0],
+                        'prior': np.array([gmt_save[0, 0], nhmt_save[0, 0],
+                                           shmt_save[0, 0]])}
+
+        ctx = {'prior_file': prior_file,
+               'workdir': workdir,
+               'analysis_store': analysis_store is not None,
+               'clean_start': core.clean_start,
+               'state_dim': state_dim,
+               'dtype': state_dtype,
+               'rowblock': max(1, (8*1024**2)//nens),
+               'ob_means': ob_means,
+               'ob_counts': ob_counts,
+               'ob_R': ob_R,
+               'loc_weights': loc_weights,
+               'gmt_info': gmt_info}
+
+        # contiguous chunks of years, several per worker for load balancing
+        nchunks = min(ntimes, 4*recon_workers)
+        year_chunks = [[(int(i), int(recon_times[i])) for i in chunk]
+                       for chunk in np.array_split(np.arange(ntimes), nchunks)]
+
+        worker_stats = {}
+        pool = multiprocessing.Pool(processes=recon_workers,
+                                    initializer=_init_recon_worker,
+                                    initargs=(ctx,))
+        try:
+            for pid, nyrs, wtime, results in pool.imap_unordered(_recon_years_worker,
+                                                                 year_chunks):
+                stats = worker_stats.setdefault(pid, [0, 0.])
+                stats[0] += nyrs
+                stats[1] += wtime
+
+                if not tas_var:
+                    continue
+                for yr_idx, gmt_hist in results:
+                    if gmt_hist is not None:
+                        gmt_save[:, yr_idx] = gmt_hist[0]
+                        nhmt_save[:, yr_idx] = gmt_hist[1]
+                        shmt_save[:, yr_idx] = gmt_hist[2]
+                    else:
+                        # existing analysis: no update history available
+                        if analysis_store is not None:
+                            Xa = analysis_store.data[yr_idx]
+                        else:
+                            filen = join(workdir, 'year' + '{:07d}'.format(recon_times[yr_idx]) + '.npy')
+                            Xa = np.load(filen, mmap_mode='r')
+                        xam_lalo = np.mean(Xa[ibeg_tas:iend_tas+1, :], axis=1).reshape(nlat_new, nlon_new)
+                        [gmt, nhmt, shmt] = \
+                            LMR_utils.global_hemispheric_means(xam_lalo, lat_lalo[:, 0])
+                        gmt_save[1:, yr_idx] = gmt
+                        nhmt_save[1:, yr_idx] = nhmt
+                        shmt_save[1:, yr_idx] = shmt
+        except ValueError as e:
+            print(e)
+            print('ERROR: Reconstruction has blown-up. Exiting!')
+            raise SystemExit(1)
+        finally:
+            pool.terminate()
+            pool.join()
+            os.remove(prior_file)
+
+        if verbose > 0:
+            for pid, (nyrs, wtime) in sorted(worker_stats.items()):
+                rate = nyrs/wtime if wtime > 0. else 0.
+                print(('worker %8d : %6d times in %10.2f seconds (%8.3f times/s)'
+                       % (pid, nyrs, wtime, rate)))
+
+        # nothing left for the sequential loop below
+        recon_years_seq = []
+
     # -------------------------------------
     # Loop over years of the reconstruction
     # -------------------------------------
     lasttime = time()
-    for yr_idx, t in enumerate(range(recon_period[0], recon_period[1]+1, recon_timescale)):
+    for yr_idx, t in enumerate(recon_years_seq):
         
         start_yr = int(t-recon_timescale//2)
         end_yr = int(t+recon_timescale//2)
@@ -529,118 +905,247 @@ def LMR_driver_callable(cfg=None):
 
         ypad = '{:07d}'.format(t)
         filen = join(workdir, 'year' + ypad + '.npy')
-        if prior_check.exists(filen) and not core.clean_start:
+        if analysis_store is not None:
+            analysis_exists = analysis_store.done[yr_idx]
+        else:
+            analysis_exists = prior_check.exists(filen)
+        if analysis_exists and not core.clean_start:
+            if analysis_store is not None:
+                Xa_prev = analysis_store.data[yr_idx]
+            else:
+                Xa_prev = np.load(filen, mmap_mode='r')
+
+        if lean_update:
+            # (re)initialize the preallocated update buffer
+            if analysis_exists and not core.clean_start:
+                if verbose > 2:
+                    print('analysis exists for time: ' + ypad)
+                np.copyto(Xbuf, Xa_prev)
+            else:
+                np.copyto(Xbuf, Xb_one_aug)
+            Xb = Xbuf
+        elif analysis_exists and not core.clean_start:
             if verbose > 2:
-                print('prior file exists: ' + filen)
-            Xb = np.load(filen)
+                print('analysis exists for time: ' + ypad)
+            Xb = np.array(Xa_prev)
         else:
             if verbose > 2:
                 print('Prior file ', filen, ' does not exist...')
             Xb = Xb_one_aug.copy()
 
             
-        # -----------------
-        # Loop over proxies
-        # -----------------
-        for proxy_idx, Y in enumerate(prox_manager.sites_assim_proxy_objs()):
-            # Check if we have proxy ob for current time interval
-            try:
-                if recon_timescale > 1:
-                    # exclude lower bound to not include same obs in adjacent time intervals
-                    Yvals = Y.values[(Y.values.index > start_yr) & (Y.values.index <= end_yr)]
-                else:
-                    Yvals = Y.values[(Y.values.index >= start_yr) & (Y.values.index <= end_yr)]
-                if Yvals.empty: raise KeyError()
-                nYobs = len(Yvals)
-                Yobs =  Yvals.mean()
-                
-            except KeyError:
-                # Make sure GMT spot filled from previous proxy
-                # TODO: AP temporary fix for no TAS in state
-                if tas_var:
-                    gmt_save[proxy_idx+1, yr_idx] = gmt_save[proxy_idx, yr_idx]
-                continue # skip to next loop iteration (proxy record)
+        if (da_solver in ('serial_batch', 'etkf') or lean_update) and not online:
+            # ---------------------------------------------------------------
+            # Assimilate all proxies available for current time in one call
+            # ---------------------------------------------------------------
+            obs_proxy_idx = []
+            obs_proxy_objs = []
+            obvalues = []
+            ye_rows = []
+            ob_errs = []
+            for proxy_idx, Y in enumerate(prox_manager.sites_assim_proxy_objs()):
+                ob = _proxy_ob_for_interval(Y, start_yr, end_yr, recon_timescale)
+                if ob is None:
+                    continue
+                Yobs, nYobs = ob
+
+                # Define the ob error variance, adjusted if ob is an average
+                # of several values
+                ob_err = Y.psm_obj.R
+                if nYobs > 1: ob_err = ob_err/float(nYobs)
+
+                obs_proxy_idx.append(proxy_idx)
+                obs_proxy_objs.append(Y)
+                obvalues.append(Yobs)
+                # Ye's of assimilated proxies follow the state in augmented vector
+                ye_rows.append(state_dim + proxy_idx)
+                ob_errs.append(ob_err)
 
             if verbose > 1:
-                print('--------------- Processing proxy: ' + Y.id)
-            if verbose > 2:
-                print('Site:', Y.id, ':', Y.type)
-                print(' latitude, longitude: ' + str(Y.lat), str(Y.lon))
+                print('--------------- Assimilating ' + str(len(obvalues)) + ' proxies')
 
-            loc = None
-            if loc_rad is not None:
-                if verbose > 2:
-                    print('...computing localization...')
-                loc = cov_localization(loc_rad, Y, X, Xb_one_coords)
+            locs = None
+            if loc_rad is not None and da_solver != 'etkf':
+                # sparse weights, looked up when needed by the update
+                locs = lambda k: loc_cache.get(obs_proxy_objs[k])
 
-            # Get Ye values for current proxy
-            if online:
-                # Calculate from latest updated prior
-                Ye = Y.psm(Xb)
+            gmt_update = None
+            if tas_var:
+                def gmt_update(k, xam):
+                    xam_lalo = xam[ibeg_tas:(iend_tas+1)].reshape(nlat_new, nlon_new)
+                    [gmt, nhmt, shmt] = \
+                        LMR_utils.global_hemispheric_means(xam_lalo, lat_lalo[:, 0])
+                    gmt_save[obs_proxy_idx[k]+1, yr_idx] = gmt
+                    nhmt_save[obs_proxy_idx[k]+1, yr_idx] = nhmt
+                    shmt_save[obs_proxy_idx[k]+1, yr_idx] = shmt
+
+            if da_solver == 'etkf':
+                # all obs. at once: no intermediate states, so GMT after
+                # each proxy is that of the final analysis
+                ob_coords = None
+                if loc_rad is not None:
+                    ob_coords = np.array([[Y.lat, Y.lon] for Y in obs_proxy_objs])
+                Xa = enkf_update_etkf(Xb, obvalues, ye_rows, ob_errs,
+                                      locRad=loc_rad, domains=etkf_local_domains,
+                                      ob_coords=ob_coords)
+                if tas_var and obs_proxy_idx:
+                    xam_lalo = np.mean(Xa[ibeg_tas:(iend_tas+1)], axis=1).reshape(nlat_new, nlon_new)
+                    [gmt, nhmt, shmt] = \
+                        LMR_utils.global_hemispheric_means(xam_lalo, lat_lalo[:, 0])
+                    for proxy_idx in obs_proxy_idx:
+                        gmt_save[proxy_idx+1, yr_idx] = gmt
+                        nhmt_save[proxy_idx+1, yr_idx] = nhmt
+                        shmt_save[proxy_idx+1, yr_idx] = shmt
+            elif lean_update:
+                # work in place on ensemble mean and perturbations in buffer
+                xbm = np.mean(Xbuf, axis=1, dtype=np.float64)
+                Xbuf -= xbm[:,None]
+                try:
+                    enkf_update_serial_inplace(xbm, Xbuf, obvalues, ye_rows, ob_errs,
+                                               locs, callback=gmt_update,
+                                               rowblock=lean_rowblock,
+                                               check_finite=True)
+                except ValueError as e:
+                    print(e)
+                    print('ERROR: Reconstruction has blown-up. Exiting!')
+                    raise SystemExit(1)
+                Xbuf += xbm[:,None]
+                Xa = Xbuf
             else:
-                # Extract latest updated Ye from appended state vector
-                Ye = Xb[proxy_idx - (assim_proxy_count+eval_proxy_count)]
-
-            # Define the ob error variance
-            ob_err = Y.psm_obj.R
-
-            # if ob is an average of several values, adjust its ob error variance
-            if nYobs > 1: ob_err = ob_err/float(nYobs)
-            
-            # ------------------------------------------------------------------
-            # Do the update (assimilation) -------------------------------------
-            # ------------------------------------------------------------------
-            if verbose > 2:
-                print(('updating time: ' + str(t) + ' proxy value : ' +
-                       str(Yobs) + ' (nobs=' + str(nYobs) +') | mean prior proxy estimate: ' +
-                       str(Ye.mean())))
-
-            # Update the state
-            Xa = enkf_update_array(Xb, Yobs, Ye, ob_err, loc, inflate)
+                Xa = enkf_update_array_batch(Xb, obvalues, ye_rows, ob_errs, locs,
+                                             inflate, callback=gmt_update)
 
-            
-            # TODO: AP Temporary fix for no TAS in state
+            # Make sure GMT spots filled for proxies without obs at this time
+            # TODO: AP temporary fix for no TAS in state
             if tas_var:
-                xam = Xa.mean(axis=1)
-                xam_lalo = xam[ibeg_tas:(iend_tas+1)].reshape(nlat_new, nlon_new)
-                [gmt, nhmt, shmt] = \
-                    LMR_utils.global_hemispheric_means(xam_lalo, lat_lalo[:, 0])
-                gmt_save[proxy_idx+1, yr_idx] = gmt
-                nhmt_save[proxy_idx+1, yr_idx] = nhmt
-                shmt_save[proxy_idx+1, yr_idx] = shmt
-
-            # add check to detect whether recon has blown-up (and stop it if it has)
-            xbvar = Xb.var(axis=1, ddof=1)
-            xavar = Xa.var(ddof=1, axis=1)
-            vardiff = xavar - xbvar
-            if (not np.isfinite(np.min(vardiff))) or (not np.isfinite(np.max(vardiff))):
-                print('ERROR: Reconstruction has blown-up. Exiting!')
-                raise SystemExit(1)
-            
-            # check the variance change for sign
+                obs_proxy_set = set(obs_proxy_idx)
+                for proxy_idx in range(assim_proxy_count):
+                    if proxy_idx not in obs_proxy_set:
+                        gmt_save[proxy_idx+1, yr_idx] = gmt_save[proxy_idx, yr_idx]
+
+            # check whether recon has blown-up (and stop it if it has)
+            # (already checked on the gain after each ob. in lean mode)
+            if not lean_update:
+                xbvar = Xb.var(axis=1, ddof=1)
+                xavar = Xa.var(ddof=1, axis=1)
+                vardiff = xavar - xbvar
+                if (not np.isfinite(np.min(vardiff))) or (not np.isfinite(np.max(vardiff))):
+                    print('ERROR: Reconstruction has blown-up. Exiting!')
+                    raise SystemExit(1)
+
             thistime = time()
             if verbose > 2:
-                #xbvar = Xb.var(axis=1, ddof=1)
-                #xavar = Xa.var(ddof=1, axis=1)
-                #vardiff = xavar - xbvar
-                print('min/max change in variance: ('+str(np.min(vardiff))+','+str(np.max(vardiff))+')')
+                if not lean_update:
+                    print('min/max change in variance: ('+str(np.min(vardiff))+','+str(np.max(vardiff))+')')
                 print('update took ' + str(thistime-lasttime) + 'seconds')
             lasttime = thistime
 
-            # Put analysis Xa in Xb for next assimilation
             Xb = Xa
 
-            # End of loop on proxies
+        else:
+            # -----------------
+            # Loop over proxies
+            # -----------------
+            for proxy_idx, Y in enumerate(prox_manager.sites_assim_proxy_objs()):
+                # Check if we have proxy ob for current time interval
+                ob = _proxy_ob_for_interval(Y, start_yr, end_yr, recon_timescale)
+                if ob is None:
+                    # Make sure GMT spot filled from previous proxy
+                    # TODO: AP temporary fix for no TAS in state
+                    if tas_var:
+                        gmt_save[proxy_idx+1, yr_idx] = gmt_save[proxy_idx, yr_idx]
+                    continue # skip to next loop iteration (proxy record)
+                Yobs, nYobs = ob
+
+                if verbose > 1:
+                    print('--------------- Processing proxy: ' + Y.id)
+                if verbose > 2:
+                    print('Site:', Y.id, ':', Y.type)
+                    print(' latitude, longitude: ' + str(Y.lat), str(Y.lon))
+
+                loc = None
+                if loc_rad is not None:
+                    if verbose > 2:
+                        print('...computing localization...')
+                    loc = loc_cache.dense(Y)
+
+                # Get Ye values for current proxy
+                if online:
+                    # Calculate from latest updated prior
+                    Ye = Y.psm(Xb)
+                else:
+                    # Extract latest updated Ye from appended state vector
+                    Ye = Xb[proxy_idx - (assim_proxy_count+eval_proxy_count)]
+
+                # Define the ob error variance
+                ob_err = Y.psm_obj.R
+
+                # if ob is an average of several values, adjust its ob error variance
+                if nYobs > 1: ob_err = ob_err/float(nYobs)
+            
+                # ------------------------------------------------------------------
+                # Do the update (assimilation) -------------------------------------
+                # ------------------------------------------------------------------
+                if verbose > 2:
+                    print(('updating time: ' + str(t) + ' proxy value : ' +
+                           str(Yobs) + ' (nobs=' + str(nYobs) +') | mean prior proxy estimate: ' +
+                           str(Ye.mean())))
+
+                # Update the state
+                Xa = enkf_update_array(Xb, Yobs, Ye, ob_err, loc, inflate)
+
+            
+                # TODO: AP Temporary fix for no TAS in state
+                if tas_var:
+                    xam = Xa.mean(axis=1)
+                    xam_lalo = xam[ibeg_tas:(iend_tas+1)].reshape(nlat_new, nlon_new)
+                    [gmt, nhmt, shmt] = \
+                        LMR_utils.global_hemispheric_means(xam_lalo, lat_lalo[:, 0])
+                    gmt_save[proxy_idx+1, yr_idx] = gmt
+                    nhmt_save[proxy_idx+1, yr_idx] = nhmt
+                    shmt_save[proxy_idx+1, yr_idx] = shmt
+
+                # add check to detect whether recon has blown-up (and stop it if it has)
+                xbvar = Xb.var(axis=1, ddof=1)
+                xavar = Xa.var(ddof=1, axis=1)
+                vardiff = xavar - xbvar
+                if (not np.isfinite(np.min(vardiff))) or (not np.isfinite(np.max(vardiff))):
+                    print('ERROR: Reconstruction has blown-up. Exiting!')
+                    raise SystemExit(1)
+            
+                # check the variance change for sign
+                thistime = time()
+                if verbose > 2:
+                    #xbvar = Xb.var(axis=1, ddof=1)
+                    #xavar = Xa.var(ddof=1, axis=1)
+                    #vardiff = xavar - xbvar
+                    print('min/max change in variance: ('+str(np.min(vardiff))+','+str(np.max(vardiff))+')')
+                    print('update took ' + str(thistime-lasttime) + 'seconds')
+                lasttime = thistime
+
+                # Put analysis Xa in Xb for next assimilation
+                Xb = Xa
+
+                # End of loop on proxies
 
         # Dump Xa to file (use Xb in case no proxies assimilated for
         # current year)
-        try:
-            np.save(filen, Xb.filled())
-        except AttributeError as e:
-            np.save(filen, Xb)
+        if analysis_store is not None:
+            analysis_store.write(yr_idx, np.ma.filled(Xb))
+        else:
+            try:
+                np.save(filen, Xb.filled())
+            except AttributeError as e:
+                np.save(filen, Xb)
 
     end_time = time() - begin_time
 
+    if loc_cache is not None:
+        loc_cache.save()
+
+    if analysis_store is not None:
+        analysis_store.flush()
+
     # End of loop on years
     if verbose > 0:
         print('')
@@ -656,8 +1161,11 @@ def LMR_driver_callable(cfg=None):
         nhmt_ensemble = np.zeros([ntimes,nens])
         shmt_ensemble = np.zeros([ntimes,nens])
         for iyr, yr in enumerate(range(recon_period[0], recon_period[1]+1, recon_timescale)):
-            filen = join(workdir, 'year{:07d}'.format(yr))
-            Xa = np.load(filen+'.npy')
+            if analysis_store is not None:
+                Xa = analysis_store.data[iyr]
+            else:
+                filen = join(workdir, 'year{:07d}'.format(yr))
+                Xa = np.load(filen+'.npy')
             for k in range(nens):
                 xam_lalo = Xa[ibeg_tas:iend_tas+1, k].reshape(nlat_new,nlon_new)
                 [gmt, nhmt, shmt] = \
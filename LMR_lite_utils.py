@@ -418,9 +418,14 @@ def load_prior(cfg,verbose=False):
     X.anom_reference = prior.anom_reference
     X.detrend = prior.detrend
     X.avgInterval = prior.avgInterval
+    X.prior_cache_dir = prior.prior_cache_dir
+    X.prior_cache_max_size = prior.prior_cache_max_size
+    X.read_sampled_years = prior.read_sampled_years
+    X.load_workers = prior.load_workers
+    X.load_memory_budget = prior.load_memory_budget
     
     # Read data file & populate initial prior ensemble
-    X.populate_ensemble(prior.prior_source, prior)
+    X.populate_ensemble(prior.prior_source, prior, dtype=np.dtype(core.state_dtype))
     Xb_one_full = X.ens
 
     # Prepare to check for files in the prior (work) directory (this object just
@@ -756,7 +761,7 @@ def Kalman_ESRF(cfg,vY,vR,vYe,Xb_in,verbose=False):
     nx = Xb_in.shape[0]
 
     # augmented state vector with Ye appended
-    Xb = np.append(Xb_in, vYe, axis=0)
+    Xb = np.append(Xb_in, np.asarray(vYe, dtype=Xb_in.dtype), axis=0)
     
     #loc_rad = cfg.core.loc_rad
     # need to add code block to compute localization factor
@@ -980,13 +985,15 @@ def make_obs(ob_lat,ob_lon,dat_lat,dat_lon,dat,verbose=False):
     obs_ind_lat = np.zeros(nobs)
     obs_ind_lon = np.zeros(nobs)
   
+    dat_index = LMR_utils.get_spatial_index(dat_lat, dat_lon,
+                                            axes=(np.ndim(dat_lat) == 1))
+
     k = -1
     # make the obs
     for lon in ob_lon:
         for lat in ob_lat:
             k = k + 1
-            dist = LMR_utils.get_distance(lon,lat,dat_lon,dat_lat)
-            jind, kind = np.unravel_index(dist.argmin(),dist.shape)
+            jind, kind = dat_index.unravel(dat_index.nearest(lat, lon)[1])
             obs[k,:] = dat[:,jind,kind]
             obs_ind_lat[k] = jind
             obs_ind_lon[k] = kind
@@ -1127,6 +1134,9 @@ def prior_regrid(cfg,X,Xb_one,verbose=False):
         # fill in new state info dictionary
         new_state_info[var] = dct
 
+        # regridded fields in the data type of the prior state vector
+        var_array_new = var_array_new.astype(Xb_one_full.dtype, copy=False)
+
         # if 1st time in loop over state variables, create Xb_one array as copy
         # of var_array_new
         if Nx == 0:
@@ -39,12 +39,147 @@ Revisions:
             last millennium (0850 to 1850) and of the last millennium to which 
             a modern historical simulation (1850 to 2006) has been concatenated. 
             [R. Tardif, U. of Washington, Nov 2017]
+          - Added the possibility to keep prior data in memory to be shared
+            by the reconstructions performed in the same process or in
+            processes forked from it (see share_prior_data).
+            [Oct 2026]
+          - Prior ensemble assembled with one gather of the sampled states
+            per state variable, directly into the (optionally float32) state
+            array, and the mask of invalid values built per variable.
+            [Oct 2026]
+          - Added a persistent, size-bounded cache of processed prior data
+            (PriorCache), so that experiments using the same prior data and
+            processing options skip reading and processing the data files.
+            [Oct 2026]
+          - Added the possibility to read only the data of the years sampled
+            to populate the prior ensemble (read_sampled_years attribute),
+            for the sources read with read_gridded_data_CMIP5_model.
+            [Oct 2026]
+          - State variables can be read concurrently in a pool of processes
+            (load_workers attribute), within a memory budget
+            (load_memory_budget attribute).
+            [Oct 2026]
 
 """
 
+import os
+import glob
+import pickle
+import hashlib
 import numpy as np
 from random import sample, seed
-from copy import deepcopy
+from copy import copy, deepcopy
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+# In-memory store of prior data dictionaries (prior_dict), shared by the
+# reconstructions performed in the same process (e.g. Monte-Carlo iterations
+# performed by LMR_wrapper). None when not activated.
+_shared_prior_dicts = None
+
+
+def share_prior_data(enable=True):
+    """
+    Activate (or deactivate and clear) the in-memory store of prior data.
+
+    When activated, the prior data read by prior_master.load_prior are kept
+    in memory and reused by later prior objects reading the same data (same
+    source, files, state variables and processing options), instead of
+    being read and processed again.
+    """
+    global _shared_prior_dicts
+    if enable:
+        if _shared_prior_dicts is None:
+            _shared_prior_dicts = {}
+    else:
+        _shared_prior_dicts = None
+
+def _read_prior_var(prior, var):
+    # Read the prior data of state variable var (run in worker processes,
+    # see prior_master.read_prior_vars)
+    prior.statevars = {var: prior.statevars[var]}
+    prior.read_prior()
+    return prior.prior_dict[var]
+
+
+class PriorCache(object):
+    """
+    Persistent cache of processed prior data, i.e. of the prior_dict
+    entries of state variables (annual or seasonal averages, anomalies,
+    possibly detrended) as returned by the read_prior methods.
+
+    Each entry is a pickle file (highest protocol) in cache_dir, named after
+    a key identifying the data file and processing options (see
+    prior_master._prior_var_key). When max_size (in GB) is given, the least
+    recently used entries are removed once the total size of the cache
+    exceeds it.
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _filename(self, key):
+        return os.path.join(self.cache_dir, 'prior_' + key + '.pckl')
+
+    def get(self, key):
+        """
+        Cached data for key, or None if not in cache.
+        """
+        filen = self._filename(key)
+        try:
+            with open(filen, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # mark as recently used
+        os.utime(filen, None)
+        return value
+
+    def put(self, key, value):
+        """
+        Store value in cache, then evict least recently used entries if the
+        size limit is exceeded.
+        """
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        filen = self._filename(key)
+        # written to a temporary file first: other processes may be
+        # reading the cache at the same time
+        tmpfilen = '{}.{}.tmp'.format(filen, os.getpid())
+        with open(tmpfilen, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfilen, filen)
+        self.evict(keep=filen)
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries (other than keep) until the
+        total size of the cache is within max_size.
+        """
+        if self.max_size is None:
+            return
+        entries = []
+        for filen in glob.glob(os.path.join(self.cache_dir, 'prior_*.pckl')):
+            try:
+                stat = os.stat(filen)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filen))
+        total_size = sum(entry[1] for entry in entries)
+        max_bytes = self.max_size * 1024.**3
+        for _, size, filen in sorted(entries):
+            if total_size <= max_bytes:
+                break
+            if filen == keep:
+                continue
+            print('Removing prior cache entry: ' + filen)
+            try:
+                os.remove(filen)
+            except OSError:
+                pass
+            total_size -= size
+
 
 # -------------------------------------------------------------------------------
 # *** Prior source assignment  --------------------------------------------------
@@ -96,11 +231,201 @@ class prior_master(object):
     This is the master class for the prior data. Inherent to create classes for each prior source.
     '''
 
+    # Years for which the prior data are read (all if None), see
+    # populate_ensemble
+    prior_read_years = None
+
+    def read_prior_years(self):
+        """
+        Years of the prior data, determined without reading the data, for
+        the sources supporting the read of a subset of years (see
+        populate_ensemble). None for the other sources.
+        """
+        return None
+
+    def _prior_data_key(self):
+        # Identifies the prior data read by read_prior()
+        statevars_info = getattr(self, 'statevars_info', None)
+        return (self.__class__.__name__,
+                self.prior_datadir,
+                self.prior_datafile,
+                repr(sorted(self.statevars.items())),
+                repr(sorted(statevars_info.items())) if statevars_info else None,
+                repr(self.avgInterval),
+                repr(self.detrend),
+                repr(self.anom_reference),
+                repr(self.prior_read_years))
+
+    def _prior_var_key(self, var):
+        # Identifies the processed data of state variable var, including the
+        # modification time of the data file so that updated data are read
+        statevars_info = getattr(self, 'statevars_info', None)
+        datafile = os.path.join(self.prior_datadir,
+                                self.prior_datafile.replace('[vardef_template]', var))
+        try:
+            stat = os.stat(datafile)
+            file_id = (stat.st_mtime, stat.st_size)
+        except OSError:
+            file_id = None
+        key = (self.__class__.__name__,
+               os.path.abspath(datafile),
+               repr(file_id),
+               var,
+               repr(self.statevars[var]),
+               repr(sorted(statevars_info.items())) if statevars_info else None,
+               repr(self.avgInterval),
+               repr(self.detrend),
+               repr(self.anom_reference),
+               repr(self.prior_read_years))
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def _load_workers(self, nvars):
+        # Nb of processes reading the prior data of nvars state variables
+        nworkers = getattr(self, 'load_workers', None) or 1
+        return max(1, min(nworkers, nvars))
+
+    def _prior_var_size(self, var):
+        # Size (in bytes) of the data file of state variable var, used as
+        # the estimate of the memory needed to read it
+        datafile = os.path.join(self.prior_datadir,
+                                self.prior_datafile.replace('[vardef_template]', var))
+        try:
+            return os.path.getsize(datafile)
+        except OSError:
+            return 0
+
+    def read_prior_vars(self, variables):
+        """
+        Read (read_prior) the prior data of the given state variables and
+        return their data dictionaries, in the order of variables.
+
+        With more than one worker (load_workers attribute), the variables
+        are read concurrently in a pool of processes, and collected as they
+        complete. A new variable is started only if the data files of the
+        variables being read (estimate of the memory they need) total less
+        than load_memory_budget GB (no limit if None). One variable is always
+        read.
+        """
+        nworkers = self._load_workers(len(variables))
+        if nworkers == 1:
+            statevars = self.statevars
+            self.statevars = dict((var, statevars[var]) for var in variables)
+            try:
+                self.read_prior()
+            finally:
+                self.statevars = statevars
+            return dict((var, self.prior_dict[var]) for var in variables)
+
+        budget = getattr(self, 'load_memory_budget', None)
+        sizes = dict((var, self._prior_var_size(var)) for var in variables)
+
+        # light copy of the prior object sent to the worker processes
+        prior = copy(self)
+        prior.prior_dict = None
+        prior.ens = None
+
+        var_dicts = {}
+        pending = list(variables)
+        running = {}
+        with ProcessPoolExecutor(max_workers=nworkers) as pool:
+            while pending or running:
+                while pending and len(running) < nworkers:
+                    var = pending[0]
+                    in_use = sum(sizes[v] for v in running.values())
+                    if running and budget is not None and in_use + sizes[var] > budget*1024.**3:
+                        break
+                    pending.pop(0)
+                    running[pool.submit(_read_prior_var, prior, var)] = var
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    var = running.pop(future)
+                    var_dicts[var] = future.result()
+                    print('Prior data read for', var)
+
+        return dict((var, var_dicts[var]) for var in variables)
+
+    def read_prior_cached(self):
+        """
+        Load prior data into self.prior_dict from the persistent cache of
+        processed prior data (see PriorCache) when activated (prior_cache_dir
+        attribute), reading (read_prior_vars) and caching the state variables
+        not found in it. Otherwise, simply read the prior data.
+        """
+        cache_dir = getattr(self, 'prior_cache_dir', None)
+        if cache_dir is None:
+            if self._load_workers(len(self.statevars)) == 1:
+                self.read_prior()
+            else:
+                self.prior_dict = self.read_prior_vars(list(self.statevars))
+            return
+
+        cache = PriorCache(cache_dir, getattr(self, 'prior_cache_max_size', None))
+        keys = dict((var, self._prior_var_key(var)) for var in self.statevars)
+        prior_dict = {}
+        for var in self.statevars:
+            var_dict = cache.get(keys[var])
+            if var_dict is not None:
+                print('Using cached prior data for', var)
+                prior_dict[var] = var_dict
+
+        missing = [var for var in self.statevars if var not in prior_dict]
+        if missing:
+            var_dicts = self.read_prior_vars(missing)
+            for var in missing:
+                cache.put(keys[var], var_dicts[var])
+                prior_dict[var] = var_dicts[var]
+
+        # same order of state variables as read_prior
+        self.prior_dict = dict((var, prior_dict[var]) for var in self.statevars)
+
+    def load_prior(self):
+        """
+        Load prior data from file(s) (or the persistent cache of processed
+        prior data, see read_prior_cached) into self.prior_dict, or get them
+        from the in-memory store of shared prior data if activated (see
+        share_prior_data).
+        """
+        if _shared_prior_dicts is None:
+            self.read_prior_cached()
+            return
+
+        key = self._prior_data_key()
+        if key in _shared_prior_dicts:
+            print('Using prior data shared in memory.')
+            self.prior_dict = _shared_prior_dicts[key]
+        else:
+            self.read_prior_cached()
+            _shared_prior_dicts[key] = self.prior_dict
+
     # Populate the prior ensemble from gridded model/analysis data
-    def populate_ensemble(self,prior_source, prior_cfg):
+    def populate_ensemble(self,prior_source, prior_cfg, dtype=np.float64):
+        """
+        Populate the prior ensemble (self.ens, of shape (Nx, Nens) and type
+        dtype, a masked array if it contains invalid values), the spatial
+        coordinates of the state elements (self.coords) and the state vector
+        information (self.full_state_info) from the prior data.
+        """
+
+        # Sample the ensemble members before reading the prior data if only
+        # the data of the sampled years are to be read
+        ind_ens = None
+        prior_years = None
+        self.prior_read_years = None
+        if getattr(self, 'read_sampled_years', False) and self.Nens:
+            # not with multiyear averages
+            if not (isinstance(self.avgInterval, dict) and 'multiyear' in self.avgInterval):
+                prior_years = self.read_prior_years()
+        if prior_years is not None:
+            if self.Nens > len(prior_years):
+                raise SystemExit('ERROR in populate_ensemble! Specified ensemble size too large for available nb of states. '
+                'Max allowed with current configuration: %d' %len(prior_years))
+            seed(prior_cfg.seed)
+            ind_ens = sample(list(range(len(prior_years))), self.Nens)
+            self.prior_read_years = sorted([prior_years[i] for i in ind_ens])
 
         # Load prior data from file(s) - multiple state variables
-        self.read_prior()        
+        self.load_prior()
         
         Nens_max = len(self.prior_dict[list(self.prior_dict.keys())[0]]['years'])
         if self.Nens and self.Nens > Nens_max:
@@ -205,23 +530,33 @@ class prior_master(object):
             take_sample = True
 
         # Array that will contain the prior ensemble (state vector)
-        Xb = np.zeros(shape=[Nx,self.Nens]) # no time dimension now...
+        Xb = np.empty(shape=[Nx,self.Nens], dtype=dtype) # no time dimension now...
         # ***NOTE: Following code assumes that data for a given year are located at same array time index across all state variables
 
-        if take_sample:
+        if ind_ens is not None:
+            print('Random selection of', str(self.Nens), 'ensemble members (data of sampled years only)')
+            # position of the sampled states in the data read
+            read_pos = dict((year, i) for i, year in enumerate(self.prior_read_years))
+            ind_read = [read_pos[prior_years[i]] for i in ind_ens]
+        elif take_sample:
             print('Random selection of', str(self.Nens), 'ensemble members')
             # Populate prior ensemble from randomly sampled states
             seed(prior_cfg.seed)
             ind_ens = sample(list(range(ntime)), self.Nens)
+            ind_read = ind_ens
         else:
             print('Using entire consecutive years in prior dataset.')
             ind_ens = list(range(ntime))
+            ind_read = ind_ens
 
         self.prior_sample_indices = ind_ens
 
         # To keep spatial coords of gridpoints (needed geo. information)
         Xb_coords = np.empty(shape=[Nx,2]) # 2 is max nb of spatial dim a variable can take
-        Xb_coords[:,:] = np.NAN # initialize with Nan's
+        Xb_coords[:,:] = np.nan # initialize with Nan's
+
+        # Mask of invalid (NaN) elements, allocated if any is found
+        Xb_mask = None
 
         for var in list(self.prior_dict.keys()):
 
@@ -230,11 +565,25 @@ class prior_master(object):
             indstart = state_vect_info[var]['pos'][0]
             indend   = state_vect_info[var]['pos'][1]
 
-            if '2D' in vartype:
-                    # Loop over ensemble members
-                    for i in range(0,self.Nens):
-                        Xb[indstart:indend+1,i] = self.prior_dict[var]['value'][ind_ens[i],:,:].flatten()
+            if not ('2D' in vartype or vartype in ('1D:meridional', '0D:time series')):
+                raise SystemExit('ERROR im populate_ensemble: variable of unrecognized spatial dimensions. Exiting!')
+
+            # All sampled states of the variable at once (members x state
+            # elements of the variable), into the block of the state vector
+            value = self.prior_dict[var]['value']
+            Xb_var = Xb[indstart:indend+1,:]
+            Xb_var[:] = np.reshape(np.take(value, ind_read, axis=0),
+                                   (self.Nens, indend+1-indstart)).T
+
+            # invalid values in the block
+            var_mask = np.isnan(Xb_var)
+            if var_mask.any():
+                if Xb_mask is None:
+                    Xb_mask = np.zeros(shape=Xb.shape, dtype=bool)
+                Xb_mask[indstart:indend+1,:] = var_mask
+            del var_mask
 
+            if '2D' in vartype:
                     # get the name of the spatial coordinates for state variable 'var'
                     coordname1, coordname2 = state_vect_info[var]['spacecoords']
                     # load in the coord values from data dictionary 
@@ -246,46 +595,17 @@ class prior_master(object):
                     if len(coord1.shape) == 1 and len(coord2.shape) == 1:
                         ndim1 = coord1.shape[0]
                         ndim2 = coord2.shape[0]
-                        X_coord1 =  np.array([coord1,]*ndim2).transpose()
-                        X_coord2 =  np.array([coord2,]*ndim1)
+                        Xb_coords[indstart:indend+1,0] = np.repeat(coord1, ndim2)
+                        Xb_coords[indstart:indend+1,1] = np.tile(coord2, ndim1)
                     elif len(coord1.shape) == 2 and len(coord2.shape) == 2:
-                        ndim1, ndim2 = coord1.shape
-                        X_coord1 =  coord1
-                        X_coord2 =  coord2
-
-                    Xb_coords[indstart:indend+1,0] = X_coord1.flatten()
-                    Xb_coords[indstart:indend+1,1] = X_coord2.flatten()
-
-                    # Some cleanup
-                    del coord1
-                    del coord2
-                    del X_coord1
-                    del X_coord2
+                        Xb_coords[indstart:indend+1,0] = coord1.ravel()
+                        Xb_coords[indstart:indend+1,1] = coord2.ravel()
 
             elif vartype == '1D:meridional':
-                # Loop over ensemble members
-                for i in range(0,self.Nens):
-                    Xb[indstart:indend+1,i] = self.prior_dict[var]['value'][ind_ens[i],:].flatten()
-
-                    # get the name of the spatial coordinate for state variable 'var'
-                    coordname1, = state_vect_info[var]['spacecoords']
-                    # load in the coord values from data dictionary 
-                    X_coord1 = self.prior_dict[var][coordname1]
-
-                    Xb_coords[indstart:indend+1,0] = X_coord1.flatten()
-
-                    # Some cleanup
-                    del X_coord1                    
-
-            elif vartype == '0D:time series':
-                # Loop over ensemble members
-                for i in range(0,self.Nens):
-                    Xb[indstart:indend+1,i] = self.prior_dict[var]['value'][ind_ens[i]].flatten()
-                
-            else:
-                raise SystemExit('ERROR im populate_ensemble: variable of unrecognized spatial dimensions. Exiting!')
-
-
+                # get the name of the spatial coordinate for state variable 'var'
+                coordname1, = state_vect_info[var]['spacecoords']
+                # load in the coord values from data dictionary 
+                Xb_coords[indstart:indend+1,0] = np.ravel(self.prior_dict[var][coordname1])
 
             """
             # RT dev ... ... ...
@@ -310,16 +630,12 @@ class prior_master(object):
         # Returning state vector Xb as masked array, if it contains
         # at least one invalid value
 
-        if np.any(np.isnan(Xb)):
-            # Returning state vector Xb as masked array
-            Xb_res = np.ma.masked_invalid(Xb)
+        if Xb_mask is not None:
+            # Returning state vector Xb as masked array (no copy of the data)
+            Xb_res = np.ma.MaskedArray(Xb, mask=Xb_mask, copy=False)
 
             # Set fill_value to np.nan
             np.ma.set_fill_value(Xb_res, np.nan)
-        
-            # array indices of masked & valid elements
-            inds_mask = np.nonzero(Xb_res.mask)
-            inds_valid = np.nonzero(~Xb_res.mask)
         else:
             Xb_res = Xb
         
@@ -360,9 +676,16 @@ class prior_ccsm4_last_millenium(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for the CCSM4 Pre-Industrial Control simulation
 class prior_ccsm4_preindustrial_control(prior_master):
 
@@ -374,9 +697,16 @@ class prior_ccsm4_preindustrial_control(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for the CCSM4 isotope-enabled control simulation (from D. Noone)
 class prior_ccsm4_isotope_controlrun(prior_master):
 
@@ -388,8 +718,15 @@ class prior_ccsm4_isotope_controlrun(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
+
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
     
 # class for the MPI-ESM-P Last Millenniun simulation
 class prior_mpi_esm_p_last_millenium(prior_master):
@@ -402,9 +739,16 @@ class prior_mpi_esm_p_last_millenium(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for the GFDL-CM3 Pre-Industrial Control simulation
 class prior_gfdl_cm3_preindustrial_control(prior_master):
 
@@ -416,9 +760,16 @@ class prior_gfdl_cm3_preindustrial_control(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for NOAA's 20th century reanalysis (20CR)
 class prior_20cr(prior_master):
 
@@ -430,9 +781,16 @@ class prior_20cr(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for ECMWF's 20th century reanalysis (ERA20C)
 class prior_era20c(prior_master):
 
@@ -444,9 +802,16 @@ class prior_era20c(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for ECMWF's 20th century model ensemble (ERA20CM)
 class prior_era20cm(prior_master):
 
@@ -469,9 +834,16 @@ class prior_loveclim_goosse2005(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for the iCESM last millennium simulation
 class prior_icesm_last_millennium(prior_master):
 
@@ -484,9 +856,16 @@ class prior_icesm_last_millennium(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for the concatenated iCESM last millennium and historical simulations
 class prior_icesm_last_millennium_historical(prior_master):
 
@@ -499,9 +878,16 @@ class prior_icesm_last_millennium_historical(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for the the isotope-enabled HadCM3 model simulation of preindustrial climate
 # (the "0kyr" time slice, part of a series of equilibrium paleoclimate simulations
 class prior_ihadcm3_preindustrial_control(prior_master):
@@ -515,9 +901,16 @@ class prior_ihadcm3_preindustrial_control(prior_master):
                                                         self.avgInterval,
                                                         self.detrend,
                                                         self.anom_reference,
-                                                        self.statevars_info)
+                                                        self.statevars_info,
+                                                        read_years=self.prior_read_years)
         return
 
+    def read_prior_years(self):
+        from load_gridded_data import read_gridded_data_CMIP5_years
+        return read_gridded_data_CMIP5_years(self.prior_datadir,
+                                             self.prior_datafile,
+                                             self.statevars)
+
 # class for the simulation of the transient climate of the last 21k years (TraCE21ka)
 class prior_ccsm3_trace21ka(prior_master):
 
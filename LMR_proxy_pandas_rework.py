@@ -30,6 +30,14 @@ Revisions:
          - Renamed the proxy databases to less-confusing convention. 
            'pages' renamed as 'PAGES2kv1' and 'NCDC' renamed as 'LMRdb'
            [ R. Tardif, Univ. of Washington, Sept 2017 ]
+         - Metadata of the proxy sites indexed once per source (site_meta_table)
+           in load_all, and passed to load_site instead of selecting the site
+           from the metadata DataFrame for every site.
+           [ October 2026 ]
+         - Database, availability and blacklist filters of load_all calculated
+           with vectorized operations on the metadata and data DataFrames
+           instead of loops over proxy records.
+           [ October 2026 ]
 """
 
 import LMR_psms
@@ -41,6 +49,7 @@ from collections import defaultdict
 from random import sample, seed
 from copy import deepcopy
 import ast
+import re
 
 class ProxyManager:
     """
@@ -246,7 +255,7 @@ class BaseProxyObject(metaclass=ABCMeta):
     @classmethod
     @abstractmethod
     def load_site(cls,  config, site, data_range=None, meta_src=None,
-                  data_src=None):
+                  data_src=None, meta_table=None):
         """
         Load proxy object from single site.
 
@@ -262,6 +271,9 @@ class BaseProxyObject(metaclass=ABCMeta):
             Source for proxy record data (might be same as meta_src)
         data_range: iterable
             Two-item container holding beginning and end date of reconstruction
+        meta_table: dict, optional
+            Proxy metadata indexed by site (see site_meta_table), used
+            instead of meta_src when loading many sites from the same source
 
         Returns
         -------
@@ -325,33 +337,35 @@ class ProxyPAGES2kv1(BaseProxyObject):
     @classmethod
     @augment_docstr
     def load_site(cls, config, site, data_range=None, meta_src=None,
-                  data_src=None):
+                  data_src=None, meta_table=None):
         """%%aug%%
 
         Expects meta_src, data_src to be pickled pandas DataFrame objects.
         """
 
         pages2kv1_cfg = config.proxies.PAGES2kv1
-        if meta_src is None:
+        if meta_src is None and meta_table is None:
             meta_src = load_data_frame(pages2kv1_cfg.metafile_proxy)
         if data_src is None:
             data_src = load_data_frame(pages2kv1_cfg.datafile_proxy)
             data_src = data_src.to_dense()
 
-        site_meta = meta_src[meta_src['Proxy ID'] == site]
-        pid = site_meta['Proxy ID'].iloc[0]
-        pmeasure = site_meta['Proxy measurement'].iloc[0]
-        pages2kv1_type = site_meta['Archive type'].iloc[0]
+        if meta_table is None:
+            meta_table = site_meta_table(meta_src[meta_src['Proxy ID'] == site])
+        site_meta = meta_table[site]
+        pid = site_meta['Proxy ID']
+        pmeasure = site_meta['Proxy measurement']
+        pages2kv1_type = site_meta['Archive type']
         try:
             proxy_type = pages2kv1_cfg.proxy_type_mapping[(pages2kv1_type, pmeasure)]
         except (KeyError, ValueError) as e:
             print('Proxy type/measurement not found in mapping: {}'.format(e))
             raise ValueError(e)
 
-        start_yr = site_meta['Youngest (C.E.)'].iloc[0]
-        end_yr = site_meta['Oldest (C.E.)'].iloc[0]
-        lat = site_meta['Lat (N)'].iloc[0]
-        lon = site_meta['Lon (E)'].iloc[0]
+        start_yr = site_meta['Youngest (C.E.)']
+        end_yr = site_meta['Oldest (C.E.)']
+        lat = site_meta['Lat (N)']
+        lon = site_meta['Lon (E)']
         elev = 0.0 # elev not info available in PAGES2kS1 data
         seasonality = None # not defined in PAGES2kS1 metadata
         site_data = data_src[site]
@@ -428,13 +442,11 @@ class ProxyPAGES2kv1(BaseProxyObject):
             # period (ignore record if fraction of available data is below user-defined
             # threshold (proxy_availability_fraction in config).
             maxnb = (finish - start) + 1
-            proxies_to_test = meta_src['Proxy ID'][availability_mask & useable].values
-            for prx in proxies_to_test.tolist():
-                values = data_src[prx][(data_src[:].index >= start) & (data_src[:].index <= finish)]
-                values = values[values.notnull()]
-                frac_available = float(len(values))/float(maxnb)
-                if frac_available < availability_fraction:
-                    availability_mask[meta_src[meta_src['Proxy ID'] == prx].index] = False
+            # nb of available data of all records at once, over the period
+            window = (data_src.index >= start) & (data_src.index <= finish)
+            nb_available = data_src[window].notnull().sum()
+            frac_available = meta_src['Proxy ID'].map(nb_available).fillna(0) / float(maxnb)
+            availability_mask &= ~(frac_available < availability_fraction)
             
         # Create proxy id lists
         proxy_id_by_type = {}
@@ -468,12 +480,13 @@ class ProxyPAGES2kv1(BaseProxyObject):
 
             all_proxy_ids += proxies.tolist()
 
-        # Create proxy objects list
+        # Create proxy objects list (metadata of the sites indexed once)
+        meta_table = site_meta_table(meta_src)
         all_proxies = []
         for site in all_proxy_ids:
             try:
                 pobj = cls.load_site(config, site, data_range,
-                                     meta_src=meta_src, data_src=data_src)
+                                     data_src=data_src, meta_table=meta_table)
                 all_proxies.append(pobj)
             except ValueError as e:
                 # Proxy had no obs or didn't meet psm r crit
@@ -512,11 +525,12 @@ class ProxyPAGES2kv1(BaseProxyObject):
 
         proxy_ids = meta_src['Proxy ID'][useable].values
 
+        meta_table = site_meta_table(meta_src)
         proxy_objs = []
         for site in proxy_ids:
             try:
                 pobj = cls.load_site(config, site,
-                                     meta_src=meta_src, data_src=data_src)
+                                     data_src=data_src, meta_table=meta_table)
                 proxy_objs.append(pobj)
             except ValueError as e:
                 print(e)
@@ -538,36 +552,38 @@ class ProxyLMRdb(BaseProxyObject):
     @classmethod
     @augment_docstr
     def load_site(cls, config, site, data_range=None, meta_src=None,
-                  data_src=None):
+                  data_src=None, meta_table=None):
         """%%aug%%
 
         Expects meta_src, data_src to be pickled pandas DataFrame objects.
         """
 
         LMRdb_cfg = config.proxies.LMRdb
-        if meta_src is None:
+        if meta_src is None and meta_table is None:
             meta_src = load_data_frame(LMRdb_cfg.metafile_proxy)
         if data_src is None:
             data_src = load_data_frame(LMRdb_cfg.datafile_proxy)
             data_src = data_src.to_dense()
 
-        site_meta = meta_src[meta_src['Proxy ID'] == site]
-        pid = site_meta['Proxy ID'].iloc[0]
-        pmeasure = site_meta['Proxy measurement'].iloc[0]
-        LMRdb_type = site_meta['Archive type'].iloc[0]
+        if meta_table is None:
+            meta_table = site_meta_table(meta_src[meta_src['Proxy ID'] == site])
+        site_meta = meta_table[site]
+        pid = site_meta['Proxy ID']
+        pmeasure = site_meta['Proxy measurement']
+        LMRdb_type = site_meta['Archive type']
         try:
             proxy_type = LMRdb_cfg.proxy_type_mapping[(LMRdb_type,pmeasure)]
         except (KeyError, ValueError) as e:
             print('Proxy type/measurement not found in mapping: {}'.format(e))
             raise ValueError(e)
 
-        start_yr = site_meta['Youngest (C.E.)'].iloc[0]
-        end_yr = site_meta['Oldest (C.E.)'].iloc[0]
-        lat = site_meta['Lat (N)'].iloc[0]
-        lon = site_meta['Lon (E)'].iloc[0]
-        elev = site_meta['Elev'].iloc[0]
+        start_yr = site_meta['Youngest (C.E.)']
+        end_yr = site_meta['Oldest (C.E.)']
+        lat = site_meta['Lat (N)']
+        lon = site_meta['Lon (E)']
+        elev = site_meta['Elev']
         site_data = data_src[site]
-        seasonality = site_meta['Seasonality'].iloc[0]
+        seasonality = site_meta['Seasonality']
         # make sure a list is returned
         if type(seasonality) is not list: seasonality = ast.literal_eval(seasonality)
         
@@ -645,29 +661,22 @@ class ProxyLMRdb(BaseProxyObject):
             # period (ignore record if fraction of available data is below user-defined
             # threshold (proxy_availability_fraction in config).
             maxnb = (finish - start) + 1
-            proxies_to_test = meta_src['Proxy ID'][availability_mask & useable].values
-            for prx in proxies_to_test.tolist():
-                values = data_src[prx][(data_src[:].index >= start) & (data_src[:].index <= finish)]
-                values = values[values.notnull()]
-                frac_available = float(len(values))/float(maxnb)
-                if frac_available < availability_fraction:
-                    availability_mask[meta_src[meta_src['Proxy ID'] == prx].index] = False
+            # nb of available data of all records at once, over the period
+            window = (data_src.index >= start) & (data_src.index <= finish)
+            nb_available = data_src[window].notnull().sum()
+            frac_available = meta_src['Proxy ID'].map(nb_available).fillna(0) / float(maxnb)
+            availability_mask &= ~(frac_available < availability_fraction)
             
         # Find indices matching **database filter** specifications
         database_col = 'Databases'
         
         # dbase_filters not "None" or empty list (some selection on db has been activated)
         if dbase_filters:
-            # define boolean array with right dimension & set all to False
-            dbase_mask = meta_src[database_col] == 0            
-            # set mask to True for proxies matching all databases found in dbase_filters
-            for i in range(len(meta_src[database_col])):      
-                if meta_src[database_col][i]:
-                    #dbase_mask[i] = set(meta_src[database_col][i]).isdisjoint(dbase_filters) # oldold code
-                    #dbase_mask[i] = set(dbase_filters).issubset(meta_src[database_col][i]) # old code
-                    dbase_mask[i] = bool(set(meta_src[database_col][i]).intersection(set(dbase_filters)))
-                else:
-                    dbase_mask[i] = False
+            # set mask to True for proxies included in any of the databases
+            # found in dbase_filters (one row per proxy & database in the
+            # exploded lists, False for proxies without databases)
+            in_dbase = meta_src[database_col].explode().isin(dbase_filters)
+            dbase_mask = in_dbase.groupby(level=0).any()
         else:
             # selection on db has NOT been activated: 
             # define boolean array with right dimension & set all to True
@@ -679,12 +688,11 @@ class ProxyLMRdb(BaseProxyObject):
         # boolean array set with right dimension & all set to True
         blacklist_mask = meta_src['Proxy ID'] != ' '
         if proxy_blacklist:
-            # If site listed in blacklist, modify corresponding elements of
-            # boolean array to False
-            for pbl in proxy_blacklist:
-                tmp = meta_src['Proxy ID'].map(lambda x: x.startswith(pbl))
-                inds = meta_src['Proxy ID'][tmp].index
-                blacklist_mask[inds] = False
+            # If site id starts with an entry of the blacklist, modify
+            # corresponding elements of boolean array to False (all entries
+            # matched at once)
+            blacklisted = '|'.join(re.escape(pbl) for pbl in proxy_blacklist)
+            blacklist_mask &= ~meta_src['Proxy ID'].str.match(blacklisted)
 
         # Create proxy id lists
         proxy_id_by_type = {}
@@ -718,12 +726,13 @@ class ProxyLMRdb(BaseProxyObject):
 
             all_proxy_ids += proxies.tolist()
 
-        # Create proxy objects list
+        # Create proxy objects list (metadata of the sites indexed once)
+        meta_table = site_meta_table(meta_src)
         all_proxies = []
         for site in all_proxy_ids:
             try:
                 pobj = cls.load_site(config, site, data_range,
-                                     meta_src=meta_src, data_src=data_src)
+                                     data_src=data_src, meta_table=meta_table)
                 all_proxies.append(pobj)
             except ValueError as e:
                 # Proxy had no obs or didn't meet psm r crit
@@ -762,11 +771,12 @@ class ProxyLMRdb(BaseProxyObject):
 
         proxy_ids = meta_src['Proxy ID'][useable].values
 
+        meta_table = site_meta_table(meta_src)
         proxy_objs = []
         for site in proxy_ids:
             try:
                 pobj = cls.load_site(config, site,
-                                     meta_src=meta_src, data_src=data_src)
+                                     data_src=data_src, meta_table=meta_table)
                 proxy_objs.append(pobj)
             except ValueError as e:
                 print(e)
@@ -788,35 +798,37 @@ class ProxyNCDCdtda(BaseProxyObject):
     @classmethod
     @augment_docstr
     def load_site(cls, config, site, data_range=None, meta_src=None,
-                  data_src=None):
+                  data_src=None, meta_table=None):
         """%%aug%%
 
         Expects meta_src, data_src to be pickled pandas DataFrame objects.
         """
 
         NCDCdtda_cfg = config.proxies.NCDCdtda
-        if meta_src is None:
+        if meta_src is None and meta_table is None:
             meta_src = load_data_frame(NCDCdtda_cfg.metafile_proxy)
         if data_src is None:
             data_src = load_data_frame(NCDCdtda_cfg.datafile_proxy)
 
-        site_meta = meta_src[meta_src['Proxy ID'] == site]
-        pid = site_meta['Proxy ID'].iloc[0]
-        pmeasure = site_meta['Proxy measurement'].iloc[0]
-        NCDCdtda_type = site_meta['Archive type'].iloc[0]
+        if meta_table is None:
+            meta_table = site_meta_table(meta_src[meta_src['Proxy ID'] == site])
+        site_meta = meta_table[site]
+        pid = site_meta['Proxy ID']
+        pmeasure = site_meta['Proxy measurement']
+        NCDCdtda_type = site_meta['Archive type']
         try:
             proxy_type = NCDCdtda_cfg.proxy_type_mapping[(NCDCdtda_type,pmeasure)]
         except (KeyError, ValueError) as e:
             print('Proxy type/measurement not found in mapping: {}'.format(e))
             raise ValueError(e)
 
-        start_yr = site_meta['Youngest (C.E.)'].iloc[0]
-        end_yr = site_meta['Oldest (C.E.)'].iloc[0]
-        lat = site_meta['Lat (N)'].iloc[0]
-        lon = site_meta['Lon (E)'].iloc[0]
-        elev = site_meta['Elev'].iloc[0]
+        start_yr = site_meta['Youngest (C.E.)']
+        end_yr = site_meta['Oldest (C.E.)']
+        lat = site_meta['Lat (N)']
+        lon = site_meta['Lon (E)']
+        elev = site_meta['Elev']
         site_data = data_src[site]
-        seasonality = site_meta['Seasonality'].iloc[0]
+        seasonality = site_meta['Seasonality']
 
         # if field exists, make sure a list is returned for seasonality
         if seasonality:
@@ -882,8 +894,7 @@ class ProxyNCDCdtda(BaseProxyObject):
             
             for value in filt_list:
                 if colname == 'Resolution (yr)' and type(value) is tuple:
-                    for i in range(len(meta_src[colname].index)):                    
-                        simple_mask[i] |= (value[0] <= meta_src[colname][i] <= value[1])
+                    simple_mask |= meta_src[colname].between(value[0], value[1])
                 else:
                     simple_mask |= meta_src[colname] == value
 
@@ -903,29 +914,22 @@ class ProxyNCDCdtda(BaseProxyObject):
             # period (ignore record if fraction of available data is below user-defined
             # threshold (proxy_availability_fraction in config).
             maxnb = (finish - start) + 1
-            proxies_to_test = meta_src['Proxy ID'][availability_mask & useable].values
-            for prx in proxies_to_test.tolist():
-                values = data_src[prx][(data_src[:].index >= start) & (data_src[:].index <= finish)]
-                values = values[values.notnull()]
-                frac_available = float(len(values))/float(maxnb)
-                if frac_available < availability_fraction:
-                    availability_mask[meta_src[meta_src['Proxy ID'] == prx].index] = False
+            # nb of available data of all records at once, over the period
+            window = (data_src.index >= start) & (data_src.index <= finish)
+            nb_available = data_src[window].notnull().sum()
+            frac_available = meta_src['Proxy ID'].map(nb_available).fillna(0) / float(maxnb)
+            availability_mask &= ~(frac_available < availability_fraction)
             
         # Find indices matching **database filter** specifications
         database_col = 'Databases'
         
         # dbase_filters not "None" or empty list (some selection on db has been activated)
         if dbase_filters:
-            # define boolean array with right dimension & set all to False
-            dbase_mask = meta_src[database_col] == 0            
-            # set mask to True for proxies matching all databases found in dbase_filters
-            for i in range(len(meta_src[database_col])):      
-                if meta_src[database_col][i]:
-                    #dbase_mask[i] = set(meta_src[database_col][i]).isdisjoint(dbase_filters) # oldold code
-                    #dbase_mask[i] = set(dbase_filters).issubset(meta_src[database_col][i]) # old code
-                    dbase_mask[i] = bool(set(meta_src[database_col][i]).intersection(set(dbase_filters)))                    
-                else:
-                    dbase_mask[i] = False
+            # set mask to True for proxies included in any of the databases
+            # found in dbase_filters (one row per proxy & database in the
+            # exploded lists, False for proxies without databases)
+            in_dbase = meta_src[database_col].explode().isin(dbase_filters)
+            dbase_mask = in_dbase.groupby(level=0).any()
         else:
             # selection on db has NOT been activated: 
             # define boolean array with right dimension & set all to True
@@ -937,12 +941,11 @@ class ProxyNCDCdtda(BaseProxyObject):
         # boolean array set with right dimension & all set to True
         blacklist_mask = meta_src['Proxy ID'] != ' '
         if proxy_blacklist:
-            # If site listed in blacklist, modify corresponding elements of
-            # boolean array to False
-            for pbl in proxy_blacklist:
-                tmp = meta_src['Proxy ID'].map(lambda x: x.startswith(pbl))
-                inds = meta_src['Proxy ID'][tmp].index
-                blacklist_mask[inds] = False
+            # If site id starts with an entry of the blacklist, modify
+            # corresponding elements of boolean array to False (all entries
+            # matched at once)
+            blacklisted = '|'.join(re.escape(pbl) for pbl in proxy_blacklist)
+            blacklist_mask &= ~meta_src['Proxy ID'].str.match(blacklisted)
 
         # Create proxy id lists
         proxy_id_by_type = {}
@@ -977,12 +980,13 @@ class ProxyNCDCdtda(BaseProxyObject):
 
             all_proxy_ids += proxies.tolist()
             
-        # Create proxy objects list
+        # Create proxy objects list (metadata of the sites indexed once)
+        meta_table = site_meta_table(meta_src)
         all_proxies = []
         for site in all_proxy_ids:
             try:
                 pobj = cls.load_site(config, site, data_range,
-                                     meta_src=meta_src, data_src=data_src)
+                                     data_src=data_src, meta_table=meta_table)
                 all_proxies.append(pobj)
             except ValueError as e:
                 # Proxy had no obs or didn't meet psm r crit
@@ -1020,11 +1024,12 @@ class ProxyNCDCdtda(BaseProxyObject):
 
         proxy_ids = meta_src['Proxy ID'][useable].values
 
+        meta_table = site_meta_table(meta_src)
         proxy_objs = []
         for site in proxy_ids:
             try:
                 pobj = cls.load_site(config, site,
-                                     meta_src=meta_src, data_src=data_src)
+                                     data_src=data_src, meta_table=meta_table)
                 proxy_objs.append(pobj)
             except ValueError as e:
                 print(e)
@@ -1037,7 +1042,33 @@ class ProxyNCDCdtda(BaseProxyObject):
 
 
 
-    
+
+def site_meta_table(meta_src):
+    """
+    Proxy metadata indexed by site, for the lookup of the metadata of single
+    sites without scanning the metadata DataFrame (see load_site). Columns
+    are extracted once from the DataFrame.
+
+    Parameters
+    ----------
+    meta_src: pandas.DataFrame
+        Proxy metadata, with one row per site identified by 'Proxy ID'
+
+    Returns
+    -------
+    dict
+        Dictionary of site ids (keys) with the metadata of the site (values,
+        dictionaries of column name -> value). The first row is used for
+        sites listed more than once.
+    """
+    columns = [(col, meta_src[col].values) for col in meta_src.columns]
+    table = {}
+    for i, pid in enumerate(meta_src['Proxy ID'].values):
+        if pid not in table:
+            table[pid] = {col: values[i] for col, values in columns}
+    return table
+
+
 def fix_lon(lon):
     """
     Fixes negative longitude values.
@@ -38,13 +38,27 @@ Revisions:
           - Calibration of statistical PSMs now all referenced to anomalies w.r.t.
             20th century.
             [ R. Tardif, Univ. of Washington, August 2017 ]
+          - Added the "psm_batch" function mapping the prior to the Ye's of
+            a collection of proxies at once: nearest grid points of all sites
+            are found with a single KD-tree per state variable and the Ye's
+            of linear PSMs are evaluated as a gather + multiply-add.
+            [Oct 2026]
+          - Nearest grid points (Ye calculation and calibration) found with
+            the cached spatial index of the grid (LMR_utils.SpatialIndex)
+            instead of distances to all grid points.
+            [Oct 2026]
+          - Seasonal averages of the calibration data (LinearPSM and
+            BilinearPSM calibrate) calculated for all years at once with
+            time_aggregation.seasonal_means.
+            [Oct 2026]
 """
 import numpy as np
 import logging
 import os.path
 import LMR_calibrate
 from LMR_utils import (haversine, get_distance, smooth2D,
-                       get_data_closest_gridpt, class_docs_fixer)
+                       get_data_closest_gridpt, class_docs_fixer,
+                       get_spatial_index)
 
 import pandas as pd
 from scipy.stats import linregress
@@ -52,6 +66,7 @@ import statsmodels.formula.api as sm
 
 from abc import ABCMeta, abstractmethod
 from load_data import load_cpickle
+from time_aggregation import date_year_month, seasonal_means
 
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
@@ -105,6 +120,26 @@ class BasePSM(metaclass=ABCMeta):
         """
         pass
 
+    def psm_terms(self, X_state_info):
+        """
+        Linear form of the PSM, used by psm_batch: Ye is the sum of the
+        state variables at the grid point nearest to the proxy site
+        weighted by the given coefficients, plus an intercept.
+
+        Parameters
+        ----------
+        X_state_info: dict
+            Information pertaining to variables in the state vector
+
+        Returns
+        -------
+        terms: list(tuple(str, float)), None
+            (state variable, coefficient) of each term and intercept, as
+            ([(state_var, coef), ...], intercept). None if the PSM has no
+            such linear form (psm_batch then calls psm).
+        """
+        return None
+
     @staticmethod
     @abstractmethod
     def get_kwargs(config):
@@ -251,6 +286,30 @@ class LinearPSM(BasePSM):
         # Calculate the Ye's ...
         # ----------------------
 
+        # Associate state variable with PSM calibration dataset
+        [(state_var, _)], _ = self.psm_terms(X_state_info)
+
+        # TODO: end index should already be +1, more pythonic
+        tas_startidx, tas_endidx = X_state_info[state_var]['pos']
+        ind_lon = X_state_info[state_var]['spacecoords'].index('lon')
+        ind_lat = X_state_info[state_var]['spacecoords'].index('lat')
+        X_lons = X_coords[tas_startidx:(tas_endidx+1), ind_lon]
+        X_lats = X_coords[tas_startidx:(tas_endidx+1), ind_lat]
+        tas_data = Xb[tas_startidx:(tas_endidx+1), :]
+
+        gridpoint_data = self.get_close_grid_point_data(tas_data.T,
+                                                        X_lons,
+                                                        X_lats)
+        Ye = self.basic_psm(gridpoint_data)
+
+        return Ye
+
+    def psm_terms(self, X_state_info):
+        """
+        Linear form of the PSM (see BasePSM.psm_terms): slope times the
+        calibration variable at the nearest grid point plus intercept.
+        """
+
         # Associate state variable with PSM calibration dataset
         # TODO: possible calibration sources hard coded for now... should define associations at config level
         if self.datatag_calib in ['GISTEMP', 'MLOST', 'NOAAGlobalTemp', 'HadCRUT', 'BerkeleyEarth']:
@@ -273,20 +332,7 @@ class LinearPSM(BasePSM):
             raise KeyError('Needed variable not in state vector for Ye'
                            ' calculation.')
 
-        # TODO: end index should already be +1, more pythonic
-        tas_startidx, tas_endidx = X_state_info[state_var]['pos']
-        ind_lon = X_state_info[state_var]['spacecoords'].index('lon')
-        ind_lat = X_state_info[state_var]['spacecoords'].index('lat')
-        X_lons = X_coords[tas_startidx:(tas_endidx+1), ind_lon]
-        X_lats = X_coords[tas_startidx:(tas_endidx+1), ind_lat]
-        tas_data = Xb[tas_startidx:(tas_endidx+1), :]
-
-        gridpoint_data = self.get_close_grid_point_data(tas_data.T,
-                                                        X_lons,
-                                                        X_lats)
-        Ye = self.basic_psm(gridpoint_data)
-
-        return Ye
+        return [(state_var, self.slope)], self.intercept
 
     def basic_psm(self, data):
         """
@@ -332,24 +378,18 @@ class LinearPSM(BasePSM):
         lonshp = lon.shape
         latshp = lat.shape
 
-        # If not equal we got a single vector?
-        if lonshp != latshp:
-            lon, lat = np.meshgrid(lon, lat)
-
-        if len(lon.shape) > 1:
-            lon = lon.ravel()
-            lat = lat.ravel()
+        # If not equal we got a single vector? (lat/lon axes of the grid)
+        index = get_spatial_index(lat, lon, axes=(lonshp != latshp))
 
-        # Calculate distance
-        dist = haversine(self.lon, self.lat, lon, lat)
+        # Nearest grid pt. (index in the flattened grid)
+        _, loc_idx = index.nearest(self.lat, self.lon)
 
-        if len(dist) in data.shape:
-            loc_idx = dist.argmin()
+        if index.lats.size in data.shape:
             tmp_dat = data[..., loc_idx]
         else:
             # TODO: This is not general lat/lon being swapped, OK for now...
             min_dist_lat_idx, \
-            min_dist_lon_idx = np.unravel_index(dist.argmin(), data.shape[-2:])
+            min_dist_lon_idx = np.unravel_index(loc_idx, data.shape[-2:])
             tmp_dat = data[..., min_dist_lat_idx, min_dist_lon_idx]
             
         return tmp_dat
@@ -388,9 +428,10 @@ class LinearPSM(BasePSM):
         
         # Look for indices of calibration grid point closest in space (in 2D)
         # to proxy site
-        dist = get_distance(proxy.lon, proxy.lat, C.lon, C.lat)
+        C_index = get_spatial_index(C.lat, C.lon, axes=(np.ndim(C.lat) == 1))
         # indices of nearest grid pt.
-        jind, kind = np.unravel_index(dist.argmin(), dist.shape)
+        _, ind = C_index.nearest(proxy.lat, proxy.lon)
+        jind, kind = C_index.unravel(ind)
 
         if calib_spatial_avg:
             C2Dsmooth = np.zeros(
@@ -417,33 +458,12 @@ class LinearPSM(BasePSM):
             exit(1)
         
         nbmonths = len(avgMonths)
-        cyears = np.asarray(list(set([C.time[k].year for k in range(len(C.time))]))) # 'set' is used to get unique values
-        nbcyears = len(cyears)
-        reg_x = np.zeros(shape=[nbcyears])
-        reg_x[:] = np.nan # initialize with nan's
-
-        for i in range(nbcyears):
-            # monthly data from current year
-            indsyr = [j for j,v in enumerate(C.time) if v.year == cyears[i] and v.month in avgMonths]
-            # check if data from previous year is to be included
-            indsyrm1 = []
-            if any(m < 0 for m in avgMonths):
-                year_before = [abs(m) for m in avgMonths if m < 0]
-                indsyrm1 = [j for j,v in enumerate(C.time) if v.year == cyears[i]-1. and v.month in year_before]
-            # check if data from following year is to be included
-            indsyrp1 = []
-            if any(m > 12 for m in avgMonths):
-                year_follow = [m-12 for m in avgMonths if m > 12]
-                indsyrp1 = [j for j,v in enumerate(C.time) if v.year == cyears[i]+1. and v.month in year_follow]
-
-            inds = indsyrm1 + indsyr + indsyrp1
-            if len(inds) == nbmonths: # all months are in the data
-                tmp = np.nanmean(calvals[inds],axis=0)
-                nancount = np.isnan(calvals[inds]).sum(axis=0)
-                if nancount > nbmaxnan: tmp = np.nan
-            else:
-                tmp = np.nan
-            reg_x[i] = tmp
+        # average over the months of the season for every year of the
+        # calibration data. Only averages over all months of the season,
+        # without missing data, are retained.
+        ctime_years, ctime_months = date_year_month(C.time)
+        cyears, reg_x = seasonal_means(calvals, ctime_years, ctime_months, avgMonths,
+                                       max_nan=nbmaxnan, min_steps=nbmonths)
         
         
         # ------------------------
@@ -821,6 +841,34 @@ class LinearPSM_TorP(LinearPSM):
         # ----------------------
         # Calculate the Ye's ...
         # ----------------------
+        [(state_var, _)], _ = self.psm_terms(X_state_info)
+
+        # TODO: end index should already be +1, more pythonic
+        calibvar_startidx, calibvar_endidx = X_state_info[state_var]['pos']
+        ind_lon = X_state_info[state_var]['spacecoords'].index('lon')
+        ind_lat = X_state_info[state_var]['spacecoords'].index('lat')
+        X_lons = X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lon]
+        X_lats = X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lat]
+        
+        # Extract data from closest grid point to location of proxy site
+        # [self.lat,self.lon]
+        calibvar_data = Xb[calibvar_startidx:(calibvar_endidx+1), :]
+        # get_close_grid_point_data is inherited from the LinearPSM class
+        # on which this one is based.
+        gridpoint_data = self.get_close_grid_point_data(calibvar_data.T,
+                                                        X_lons,
+                                                        X_lats)
+
+        Ye = self.slope * gridpoint_data + self.intercept
+        
+        return Ye
+
+    def psm_terms(self, X_state_info):
+        """
+        Linear form of the PSM (see BasePSM.psm_terms): slope times the
+        variable (temperature or moisture) the proxy is sensitive to at the
+        nearest grid point plus intercept.
+        """
         if self.sensitivity:
             # "sensitivity" defined for this proxy
             if self.sensitivity == 'temperature':
@@ -844,26 +892,8 @@ class LinearPSM_TorP(LinearPSM):
         if state_var not in X_state_info.keys():
             raise KeyError('Needed variable not in state vector for Ye'
                            ' calculation.')
-        
-        # TODO: end index should already be +1, more pythonic
-        calibvar_startidx, calibvar_endidx = X_state_info[state_var]['pos']
-        ind_lon = X_state_info[state_var]['spacecoords'].index('lon')
-        ind_lat = X_state_info[state_var]['spacecoords'].index('lat')
-        X_lons = X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lon]
-        X_lats = X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lat]
-        
-        # Extract data from closest grid point to location of proxy site
-        # [self.lat,self.lon]
-        calibvar_data = Xb[calibvar_startidx:(calibvar_endidx+1), :]
-        # get_close_grid_point_data is inherited from the LinearPSM class
-        # on which this one is based.
-        gridpoint_data = self.get_close_grid_point_data(calibvar_data.T,
-                                                        X_lons,
-                                                        X_lats)
 
-        Ye = self.slope * gridpoint_data + self.intercept
-        
-        return Ye
+        return [(state_var, self.slope)], self.intercept
 
     # Define the error model for this proxy
     @staticmethod
@@ -1050,18 +1080,7 @@ class BilinearPSM(BasePSM):
         # ----------------------
 
         # Defining state variables to consider in the calculation of Ye's
-        state_var_T = 'tas_sfc_Amon'
-        if self.calib_moisture == 'GPCC':
-            state_var_P = 'pr_sfc_Amon'
-        elif self.calib_moisture == 'DaiPDSI':
-            state_var_P = 'scpdsi_sfc_Amon'
-        else:
-            raise KeyError('Unrecognized calibration-state variable association. State variable not identified for Ye'
-                           ' calculation.')
-
-        if state_var_T not in X_state_info.keys() or state_var_P not in X_state_info.keys():
-            raise KeyError('One or more needed variable not in state vector for Ye'
-                           ' calculation.')
+        [(state_var_T, _), (state_var_P, _)], _ = self.psm_terms(X_state_info)
 
         # Do not assume that temperature and precipitation/moisture variables are on same grid (for generality)
         # So need to make distinct distance calculations for both state variables
@@ -1072,16 +1091,11 @@ class BilinearPSM(BasePSM):
         ind_lat = X_state_info[state_var_T]['spacecoords'].index('lat')
         # Find row index of X for which [X_lat,X_lon] corresponds to closest
         # grid point to location of proxy site [self.lat,self.lon]
-        # Calclulate distances from proxy site.
-        stateDim = calibvar_endidx - calibvar_startidx + 1
-        ensDim = Xb.shape[1]
-        dist = np.empty(stateDim)
-        dist = haversine(self.lon, self.lat,
-                          X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lon],
-                          X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lat])
+        index = get_spatial_index(X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lat],
+                                  X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lon])
 
         # row index of nearest grid pt. in prior (minimum distance)
-        kind_T = np.unravel_index(dist.argmin(), dist.shape)[0] + calibvar_startidx
+        kind_T = index.nearest(self.lat, self.lon)[1] + calibvar_startidx
 
         # Precipitation/Moisture ---
         # TODO: end index should already be +1, more pythonic
@@ -1090,22 +1104,41 @@ class BilinearPSM(BasePSM):
         ind_lat = X_state_info[state_var_P]['spacecoords'].index('lat')
         # Find row index of X for which [X_lat,X_lon] corresponds to closest
         # grid point to location of proxy site [self.lat,self.lon]
-        # Calclulate distances from proxy site.
-        stateDim = calibvar_endidx - calibvar_startidx + 1
-        ensDim = Xb.shape[1]
-        dist = np.empty(stateDim)
-        dist = haversine(self.lon, self.lat,
-                          X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lon],
-                          X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lat])
+        index = get_spatial_index(X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lat],
+                                  X_coords[calibvar_startidx:(calibvar_endidx+1), ind_lon])
 
         # row index of nearest grid pt. in prior (minimum distance)
-        kind_P = np.unravel_index(dist.argmin(), dist.shape)[0] + calibvar_startidx
+        kind_P = index.nearest(self.lat, self.lon)[1] + calibvar_startidx
 
         # Now calculate the Ye's
         Ye = self.slope_temperature * np.squeeze(Xb[kind_T, :]) + self.slope_moisture * np.squeeze(Xb[kind_P, :]) + self.intercept
 
         return Ye
 
+    def psm_terms(self, X_state_info):
+        """
+        Linear form of the PSM (see BasePSM.psm_terms): temperature and
+        moisture at their nearest grid points, weighted by their slopes,
+        plus intercept.
+        """
+
+        # Defining state variables to consider in the calculation of Ye's
+        state_var_T = 'tas_sfc_Amon'
+        if self.calib_moisture == 'GPCC':
+            state_var_P = 'pr_sfc_Amon'
+        elif self.calib_moisture == 'DaiPDSI':
+            state_var_P = 'scpdsi_sfc_Amon'
+        else:
+            raise KeyError('Unrecognized calibration-state variable association. State variable not identified for Ye'
+                           ' calculation.')
+
+        if state_var_T not in X_state_info.keys() or state_var_P not in X_state_info.keys():
+            raise KeyError('One or more needed variable not in state vector for Ye'
+                           ' calculation.')
+
+        return ([(state_var_T, self.slope_temperature),
+                 (state_var_P, self.slope_moisture)], self.intercept)
+
     # Define the error model for this proxy
     @staticmethod
     def error():
@@ -1143,13 +1176,13 @@ class BilinearPSM(BasePSM):
         # Look for indices of calibration grid point closest in space (in 2D)
         # to proxy site
         # For temperature calibration dataset
-        dist_T = get_distance(proxy.lon, proxy.lat, C_T.lon, C_T.lat)
+        C_T_index = get_spatial_index(C_T.lat, C_T.lon, axes=(np.ndim(C_T.lat) == 1))
         # indices of nearest grid pt.
-        jind_T, kind_T = np.unravel_index(dist_T.argmin(), dist_T.shape)
+        jind_T, kind_T = C_T_index.unravel(C_T_index.nearest(proxy.lat, proxy.lon)[1])
         # For precipitation/moisture calibration dataset
-        dist_P = get_distance(proxy.lon, proxy.lat, C_P.lon, C_P.lat)
+        C_P_index = get_spatial_index(C_P.lat, C_P.lon, axes=(np.ndim(C_P.lat) == 1))
         # indices of nearest grid pt.
-        jind_P, kind_P = np.unravel_index(dist_P.argmin(), dist_P.shape)
+        jind_P, kind_P = C_P_index.unravel(C_P_index.nearest(proxy.lat, proxy.lon)[1])
 
         # Apply spatial smoother to calibration gridded data, if option is activated
         if calib_spatial_avg:
@@ -1198,63 +1231,21 @@ class BilinearPSM(BasePSM):
         nbmonths_P = len(avgMonths_P)
             
         # Temperature data
-        cyears_T = np.asarray(list(set([C_T.time[k].year for k in range(len(C_T.time))]))) # 'set' is used to get unique values
-        nbcyears_T = len(cyears_T)
-        reg_x_T = np.zeros(shape=[nbcyears_T])
-        reg_x_T[:] = np.nan # initialize with nan's
-
-        for i in range(nbcyears_T):
-            # monthly data from current year
-            indsyr = [j for j,v in enumerate(C_T.time) if v.year == cyears_T[i] and v.month in avgMonths_T]
-            # check if data from previous year is to be included
-            indsyrm1 = []
-            if any(m < 0 for m in avgMonths_T):
-                year_before = [abs(m) for m in avgMonths_T if m < 0]
-                indsyrm1 = [j for j,v in enumerate(C_T.time) if v.year == cyears_T[i]-1. and v.month in year_before]
-            # check if data from following year is to be included
-            indsyrp1 = []
-            if any(m > 12 for m in avgMonths_T):
-                year_follow = [m-12 for m in avgMonths_T if m > 12]
-                indsyrp1 = [j for j,v in enumerate(C_T.time) if v.year == cyears_T[i]+1. and v.month in year_follow]
-
-            inds = indsyrm1 + indsyr + indsyrp1
-            if len(inds) == nbmonths_T: # all months are in the data
-                tmp = np.nanmean(calvals_T[inds],axis=0)
-                nancount = np.isnan(calvals_T[inds]).sum(axis=0)
-                if nancount > nbmaxnan: tmp = np.nan
-            else:
-                tmp = np.nan
-            reg_x_T[i] = tmp
+        # average over the months of the season for every year of the
+        # calibration data. Only averages over all months of the season,
+        # without missing data, are retained.
+        ctime_years, ctime_months = date_year_month(C_T.time)
+        cyears_T, reg_x_T = seasonal_means(calvals_T, ctime_years, ctime_months, avgMonths_T,
+                                           max_nan=nbmaxnan, min_steps=nbmonths_T)
 
         
         # Moisture data
-        cyears_P = np.asarray(list(set([C_P.time[k].year for k in range(len(C_P.time))]))) # 'set' is used to get unique values
-        nbcyears_P = len(cyears_P)
-        reg_x_P = np.zeros(shape=[nbcyears_P])
-        reg_x_P[:] = np.nan # initialize with nan's
-
-        for i in range(nbcyears_P):
-            # monthly data from current year
-            indsyr = [j for j,v in enumerate(C_P.time) if v.year == cyears_P[i] and v.month in avgMonths_P]
-            # check if data from previous year is to be included
-            indsyrm1 = []
-            if any(m < 0 for m in avgMonths_P):
-                year_before = [abs(m) for m in avgMonths_P if m < 0]
-                indsyrm1 = [j for j,v in enumerate(C_P.time) if v.year == cyears_P[i]-1. and v.month in year_before]
-            # check if data from following year is to be included
-            indsyrp1 = []
-            if any(m > 12 for m in avgMonths_P):
-                year_follow = [m-12 for m in avgMonths_P if m > 12]
-                indsyrp1 = [j for j,v in enumerate(C_P.time) if v.year == cyears_P[i]+1. and v.month in year_follow]
-
-            inds = indsyrm1 + indsyr + indsyrp1
-            if len(inds) == nbmonths_P: # all months are in the data
-                tmp = np.nanmean(calvals_P[inds],axis=0)
-                nancount = np.isnan(calvals_P[inds]).sum(axis=0)
-                if nancount > nbmaxnan: tmp = np.nan
-            else:
-                tmp = np.nan
-            reg_x_P[i] = tmp
+        # average over the months of the season for every year of the
+        # calibration data. Only averages over all months of the season,
+        # without missing data, are retained.
+        ctime_years, ctime_months = date_year_month(C_P.time)
+        cyears_P, reg_x_P = seasonal_means(calvals_P, ctime_years, ctime_months, avgMonths_P,
+                                           max_nan=nbmaxnan, min_steps=nbmonths_P)
 
 
         # ---------------------------
@@ -1516,14 +1507,8 @@ class h_interpPSM(BasePSM):
 
         # Find row index of X for which [X_lat,X_lon] corresponds to closest
         # grid point to location of proxy site [self.lat,self.lon]
-
-        # Calclulate distances from proxy site.
-        stateDim = statevar_endidx - statevar_startidx + 1
-        ensDim = Xb.shape[1]
-        dist = np.empty(stateDim)
-        dist = haversine(self.lon, self.lat,
-                          X_coords[statevar_startidx:(statevar_endidx+1), ind_lon],
-                          X_coords[statevar_startidx:(statevar_endidx+1), ind_lat])
+        index = get_spatial_index(X_coords[statevar_startidx:(statevar_endidx+1), ind_lat],
+                                  X_coords[statevar_startidx:(statevar_endidx+1), ind_lon])
 
         # Check if RadiusInfluence is defined (not None). Use weighted-averaging as interpolator if it is.
         # Otherwise, seek value at nearest gridpoint to proxy location
@@ -1531,21 +1516,44 @@ class h_interpPSM(BasePSM):
             # Calculate weighted-average
             #  exponential decay
             L =  self.RadiusInfluence
+            # grid pts. beyond 6L have weights below machine precision
+            dist, inds = index.within(self.lat, self.lon, 6.*L)
+            if inds.size == 0:
+                # no grid pt. within 6L (coarse grid or distant site): the
+                # nearest grid pt. dominates the weighted-average
+                dist, inds = index.nearest(self.lat, self.lon)
+                dist, inds = np.atleast_1d(dist), np.atleast_1d(inds)
             weights = np.exp(-np.square(dist)/np.square(L))
             # make the weights sum to one
             weights /=weights.sum(axis=0)
         
-            Ye = np.dot(weights.T,Xb[statevar_startidx:(statevar_endidx+1), :])
+            Ye = np.dot(weights.T,Xb[inds + statevar_startidx, :])
         else:
             # Pick value at nearest grid point
             # row index of nearest grid pt. in prior (minimum distance)
-            kind = np.unravel_index(dist.argmin(), dist.shape)[0] + statevar_startidx
+            kind = index.nearest(self.lat, self.lon)[1] + statevar_startidx
             
             Ye = np.squeeze(Xb[kind, :])
 
             
         return Ye
 
+    def psm_terms(self, X_state_info):
+        """
+        Linear form of the PSM (see BasePSM.psm_terms) when Ye is taken as
+        the isotope field at the nearest grid point. None if the Ye is a
+        weighted-average over the radius of influence.
+        """
+        if self.RadiusInfluence:
+            return None
+
+        state_var = 'd18O_sfc_Amon'
+        if state_var not in X_state_info.keys():
+            raise KeyError('Needed variable not in state vector for Ye'
+                           ' calculation.')
+
+        return [(state_var, 1.)], 0.
+
     # Define a default error model for this proxy
     @staticmethod
     def error():
@@ -1775,6 +1783,68 @@ _psm_classes = {'linear': LinearPSM, 'linear_TorP': LinearPSM_TorP,
                 'bilinear': BilinearPSM,'h_interp': h_interpPSM,
                 'bayesreg_uk37': BayesRegUK37PSM}
 
+def psm_batch(psm_objs, Xb, X_state_info, X_coords):
+    """
+    Maps a given state to observations for a collection of proxies at once.
+
+    The grid points nearest to the proxy sites are found with a single
+    query of the spatial index of each state variable and, for PSMs with a
+    linear form (see BasePSM.psm_terms), the Ye's are evaluated as a gather
+    of these grid points and a multiply-add. Other PSMs are evaluated one
+    at a time with their psm method.
+
+    Parameters
+    ----------
+    psm_objs: list(BasePSM like)
+        PSM objects of the proxies
+    Xb: ndarray
+        State vector to be mapped into observation space (stateDim x ensDim)
+    X_state_info: dict
+        Information pertaining to variables in the state vector
+    X_coords: ndarray
+        Coordinates for the state vector (stateDim x 2)
+
+    Returns
+    -------
+    Ye: ndarray
+        Equivalent observations from prior (len(psm_objs) x ensDim)
+    """
+
+    nobs = len(psm_objs)
+    Ye = np.empty((nobs, Xb.shape[1]))
+
+    # (proxy index, coefficient, lat, lon) of terms, grouped by state variable
+    terms_by_var = {}
+    for k, psm_obj in enumerate(psm_objs):
+        linear_form = psm_obj.psm_terms(X_state_info)
+        if linear_form is None:
+            Ye[k] = psm_obj.psm(Xb, X_state_info, X_coords)
+            continue
+        terms, intercept = linear_form
+        Ye[k] = intercept
+        for state_var, coef in terms:
+            terms_by_var.setdefault(state_var, []).append(
+                (k, coef, psm_obj.lat, psm_obj.lon))
+
+    for state_var, terms in terms_by_var.items():
+        kobs, coefs, lats, lons = [np.array(v) for v in zip(*terms)]
+
+        # TODO: end index should already be +1, more pythonic
+        startidx, endidx = X_state_info[state_var]['pos']
+        ind_lon = X_state_info[state_var]['spacecoords'].index('lon')
+        ind_lat = X_state_info[state_var]['spacecoords'].index('lat')
+        X_lons = X_coords[startidx:(endidx+1), ind_lon]
+        X_lats = X_coords[startidx:(endidx+1), ind_lat]
+
+        # row indices of grid pts. nearest to the proxy sites
+        _, inds = get_spatial_index(X_lats, X_lons).nearest(lats, lons)
+        rows = inds + startidx
+
+        Ye[kobs] += coefs[:, None] * Xb[rows, :]
+
+    return Ye
+
+
 def get_psm_class(psm_type):
     """
     Retrieve psm class type to be instantiated.
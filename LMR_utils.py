@@ -17,19 +17,43 @@ Revisions:
           - Renamed the proxy databases to less-confusing convention. 
             'pages' renamed as 'PAGES2kv1' and 'NCDC' renamed as 'LMRdb'
             [R. Tardif, U. of Washington, Sept 2017]
+          - Added the SpatialIndex class (KD-tree on the unit sphere), cached
+            per grid, for nearest grid point, k-nearest and radius queries.
+            [Oct 2026]
+          - Added the AnalysisStore class: single memory-mapped store of the
+            analysis ensembles of a reconstruction, replacing the per-year
+            files. [Oct 2026]
+          - Added ensemble_quantiles (any number of percentiles with one
+            partition) and mergeable quantile sketches for combining ensemble
+            percentiles over Monte-Carlo iterations. [Oct 2026]
+          - ESMF regridding (regrid_esmpy) from sparse interpolation weights
+            generated once per grids and method (ESMFRegridder), cached in
+            memory and optionally on disk. [Oct 2026]
+          - regrid_simple vectorized over ensemble members, with distance
+            weights cached per pair of grids. [Oct 2026]
+          - regrid_sphere uses cached Spharmt objects (stored Legendre
+            functions) and transforms all members in one call. [Oct 2026]
+          - ensemble_stats archives the analysis statistics in the data type
+            of the state vector (e.g. float32), with ensemble means and
+            variances accumulated in float64. [Oct 2026]
 """
 import glob
 import os
+import hashlib
 import numpy as np
 import re
 import pickle
 import collections
 import copy
+import weakref
+import zipfile
 import ESMF
 from time import time
+from concurrent.futures import ThreadPoolExecutor
+from netCDF4 import Dataset, Variable
 from os.path import join
 from math import radians, cos, sin, asin, sqrt
-from scipy import signal, special
+from scipy import signal, special, sparse
 from scipy.spatial import cKDTree
 from spharm import Spharmt, getspecindx, regrid
 
@@ -118,6 +142,167 @@ def get_distance(lon_pt, lat_pt, lon_ref, lat_ref):
     return km
 
 
+class SpatialIndex(object):
+    """
+    Spatial index of lat/lon points (e.g. a grid), answering nearest point,
+    k-nearest points and radius queries in O(log N) per site. Points are
+    indexed in a KD-tree of their cartesian coordinates on the unit sphere,
+    on which euclidean (chord) and great circle distances are monotonically
+    related.
+
+    Use get_spatial_index to get the (cached) index of a given grid.
+
+    Parameters
+    ----------
+    lats: ndarray
+        Latitudes of the points, any shape.
+    lons: ndarray
+        Longitudes of the points, same shape as lats.
+
+    Attributes
+    ----------
+    shape: tuple
+        Shape of the lat/lon arrays. Indices returned by the queries are
+        indices in the flattened arrays (see unravel).
+    """
+
+    # Earth radius (km) consistent with haversine
+    radius = 6367.0
+
+    def __init__(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if lats.shape != lons.shape:
+            raise ValueError('Latitudes and longitudes of the points of the'
+                             ' spatial index should have the same shape.')
+        self.shape = lats.shape
+        self.lats = lats.ravel()
+        self.lons = lons.ravel()
+        self.tree = cKDTree(self._xyz(self.lats, self.lons))
+        self._mean_spacing = None
+
+    @staticmethod
+    def _xyz(lats, lons):
+        return np.column_stack(lon_lat_to_cartesian(np.ravel(lons),
+                                                    np.ravel(lats), R=1.))
+
+    def _km(self, chord):
+        return 2. * self.radius * np.arcsin(np.minimum(chord/2., 1.))
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Indices of (and distances to) the k points nearest to the site(s).
+
+        Inputs:
+        lat, lon : latitude(s), longitude(s) of the site(s), scalars or
+                   1D arrays
+        k        : number of nearest points
+
+        Outputs:
+        dist     : great circle distances (km), with shape of lat
+                   (plus trailing dimension of length k if k > 1)
+        inds     : flat indices of the points, same shape as dist
+        """
+        chord, inds = self.tree.query(self._xyz(lat, lon), k=k)
+        if np.ndim(lat) == 0:
+            chord, inds = chord[0], inds[0]
+        return self._km(chord), inds
+
+    def within(self, lat, lon, radius):
+        """
+        Indices of (and distances to) the points within a given great
+        circle distance (km) of a site, sorted by increasing distance.
+        """
+        chord_max = 2. * np.sin(min(radius/self.radius, np.pi)/2.)
+        xyz = self._xyz(lat, lon)[0]
+        inds = np.array(self.tree.query_ball_point(xyz, chord_max),
+                        dtype=np.int64)
+        chord = np.sqrt(np.sum((self.tree.data[inds] - xyz)**2, axis=1))
+        order = np.argsort(chord, kind='stable')
+        return self._km(chord[order]), inds[order]
+
+    def unravel(self, inds):
+        """Flat indices into indices w.r.t. shape of the lat/lon arrays."""
+        return np.unravel_index(inds, self.shape)
+
+    def mean_spacing(self):
+        """
+        Representative distance (km) between points: mean distance between
+        consecutive points of the flattened arrays.
+        """
+        if self._mean_spacing is None:
+            dist = haversine(np.roll(self.lons, 1), np.roll(self.lats, 1),
+                             self.lons, self.lats)
+            self._mean_spacing = np.mean(dist)
+        return self._mean_spacing
+
+
+# Spatial indices built so far, by key of the point coordinates (see
+# _coords_key), with weak references to the arrays identified by the keys
+_spatial_indices = collections.OrderedDict()
+_spatial_indices_max = 16
+
+
+def _coords_key(coords):
+    """
+    Cheap key identifying an array of coordinates: for a numpy array, its
+    memory location, shape, strides and dtype (no pass over the data), and
+    the array owning the memory, which must still be alive for the key to
+    match. Other sequences are hashed.
+    """
+    if isinstance(coords, np.ndarray):
+        owner = coords
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        key = (coords.__array_interface__['data'][0], coords.shape,
+               coords.strides, coords.dtype.str)
+        return key, owner
+    coords = np.asarray(coords, dtype=np.float64)
+    h = hashlib.sha1()
+    h.update(str(coords.shape).encode())
+    h.update(np.ascontiguousarray(coords).tobytes())
+    return h.hexdigest(), None
+
+
+def get_spatial_index(lats, lons, axes=False):
+    """
+    Returns the SpatialIndex of the given lat/lon points, built once per
+    set of coordinates and cached (up to the 16 most recently used).
+    Coordinate arrays are identified by their memory (e.g. the same slice of
+    the state vector coordinates), without a pass over the data, so they
+    should not be modified in place once indexed.
+
+    Inputs:
+    lats, lons : latitudes, longitudes of the points (same shape), or 1D
+                 latitude and longitude axes of a regular grid if axes
+                 is True (index then of shape (nlat, nlon))
+    """
+    lat_key, lat_owner = _coords_key(lats)
+    lon_key, lon_owner = _coords_key(lons)
+    key = (lat_key, lon_key, bool(axes))
+
+    entry = _spatial_indices.pop(key, None)
+    if entry is not None:
+        lat_ref, lon_ref, index = entry
+        # arrays freed since (memory possibly reused): index rebuilt
+        if ((lat_ref is not None and lat_ref() is not lat_owner) or
+                (lon_ref is not None and lon_ref() is not lon_owner)):
+            entry = None
+    if entry is None:
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if axes:
+            lons, lats = np.meshgrid(lons, lats)
+        index = SpatialIndex(lats, lons)
+        lat_ref = None if lat_owner is None else weakref.ref(lat_owner)
+        lon_ref = None if lon_owner is None else weakref.ref(lon_owner)
+    _spatial_indices[key] = (lat_ref, lon_ref, index)
+    while len(_spatial_indices) > _spatial_indices_max:
+        _spatial_indices.popitem(last=False)
+
+    return index
+
+
 def get_data_closest_gridpt(data,lon_data,lat_data,lon_pt,lat_pt,getvalid=None):
     """
         Extracts data from a gridded field (data) at the gridpt closest to the 
@@ -155,32 +340,22 @@ def get_data_closest_gridpt(data,lon_data,lat_data,lon_pt,lat_pt,getvalid=None):
     pt_data = np.zeros(shape=data.shape[0])
     pt_data[:] = np.nan
 
-    # Representative distance between grid pts.
-    dist = haversine(np.roll(lon_data,1), np.roll(lat_data,1), lon_data, lat_data)
-    meandist =  np.mean(dist)
-    
-    # Calculate distances
-    dist = haversine(lon_pt, lat_pt, lon_data, lat_data)
-    workdist = np.ravel(dist)
-    sorteddist = np.sort(workdist)
-
-    # Find closest grid point with *valid* data.
-    # Impose max of search distance equal to twice the representative distance
-    # Start with min dist.
+    index = get_spatial_index(lat_data, lon_data)
 
-    distptmin = sorteddist[0]
-    i = 0
-    distpt = distptmin
-    inds2 = np.where(workdist == distpt)[0][0]
-    inds = np.unravel_index(inds2, dist.shape)
+    # Representative distance between grid pts.
+    meandist = index.mean_spacing()
 
+    # Closest grid point
+    _, inds2 = index.nearest(lat_pt, lon_pt)
+    inds = index.unravel(inds2)
 
     if getvalid:
-        valid = False
-        while not valid and distpt < meandist*2.:
-
-            inds2 = np.where(workdist == distpt)[0][0]
-            inds = np.unravel_index(inds2, dist.shape)
+        # Find closest grid point with *valid* data.
+        # Impose max of search distance equal to twice the representative
+        # distance. Start with min dist.
+        _, cands = index.within(lat_pt, lon_pt, meandist*2.)
+        for inds2 in cands:
+            inds = index.unravel(inds2)
 
             if len(inds) == 2:
                 test_valid = np.isfinite(data[:,inds[0],inds[1]])
@@ -190,12 +365,7 @@ def get_data_closest_gridpt(data,lon_data,lat_data,lon_pt,lat_pt,getvalid=None):
             else:
                 print('ERROR in distance calc in get_data_closest_gridpt!')
                 raise SystemExit(1)            
-            if np.all(test_valid): valid = True
-            i +=1
-            distpt = sorteddist[i]
-
-    else:
-        pass
+            if np.all(test_valid): break
 
     # Extract the data at the identified grid pt.
     if len(inds) == 2:
@@ -261,6 +431,270 @@ def smooth2D(im, n=15):
     return(improc)
 
 
+class AnalysisStore(object):
+    """
+    Memory-mapped store of the analysis (i.e. posterior) ensembles of a
+    reconstruction: a single preallocated (ntimes x Nx x Nens) array in the
+    working directory, written into by the driver (one slice per
+    reconstruction time) and read one time at a time by ensemble_stats.
+
+    Parameters
+    ----------
+    workdir: str
+        Working directory containing the store.
+    mode: str
+        Memory-map mode ('r': read-only, 'r+': read/write).
+
+    Attributes
+    ----------
+    times: ndarray
+        Reconstruction times (years).
+    data: numpy.memmap
+        Analysis ensembles (ntimes x Nx x Nens).
+    done: numpy.memmap
+        Whether the analysis of each time has been written (ntimes).
+    """
+
+    data_file = 'analysis_store.npy'
+    times_file = 'analysis_store_times.npy'
+    done_file = 'analysis_store_done.npy'
+
+    def __init__(self, workdir, mode='r'):
+        self.workdir = workdir
+        self.times = np.load(join(workdir, self.times_file))
+        self.data = np.load(join(workdir, self.data_file), mmap_mode=mode)
+        self.done = np.load(join(workdir, self.done_file), mmap_mode=mode)
+
+    @classmethod
+    def exists(cls, workdir):
+        return os.path.isfile(join(workdir, cls.data_file))
+
+    @classmethod
+    def create(cls, workdir, times, shape, dtype, restart=False):
+        """
+        Creates the store of the analyses (of given (Nx, Nens) shape and
+        dtype) at the given reconstruction times. With restart, an existing
+        store of same times, shape and dtype is reopened instead, keeping
+        the analyses already written.
+        """
+        times = np.asarray(times)
+        shape = (len(times),) + tuple(shape)
+        dtype = np.dtype(dtype)
+
+        if restart and cls.exists(workdir):
+            store = cls(workdir, mode='r+')
+            if (np.array_equal(store.times, times) and
+                    store.data.shape == shape and store.data.dtype == dtype):
+                return store
+            del store
+
+        np.save(join(workdir, cls.times_file), times)
+        data = np.lib.format.open_memmap(join(workdir, cls.data_file),
+                                         mode='w+', dtype=dtype, shape=shape)
+        done = np.lib.format.open_memmap(join(workdir, cls.done_file),
+                                         mode='w+', dtype=bool,
+                                         shape=shape[0:1])
+        del data, done
+
+        return cls(workdir, mode='r+')
+
+    def write(self, idx, Xa):
+        """Writes the analysis ensemble (Nx x Nens) of time index idx."""
+        self.data[idx] = Xa
+        self.done[idx] = True
+
+    def flush(self):
+        self.data.flush()
+        self.done.flush()
+
+    def years(self):
+        """Times (as 7-digit strings) of the analyses written."""
+        return ['{:07d}'.format(int(t)) for t in self.times[self.done]]
+
+
+def _prefetch(load, nitems):
+    """
+    Iterates over load(0), ..., load(nitems-1), with the next item loaded
+    in a background thread while the current one is processed.
+    """
+    if nitems == 0:
+        return
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(load, 0)
+        for k in range(nitems):
+            item = future.result()
+            if k+1 < nitems:
+                future = executor.submit(load, k+1)
+            yield item
+
+
+def ensemble_quantiles(X, percentiles, axis=-1):
+    """
+    Percentiles (in %, any number of them) of X along axis, computed with a
+    single partition of the data (np.partition on all needed order
+    statistics) rather than a full sort per percentile as in np.percentile.
+    Same (linear interpolation) definition as np.percentile.
+
+    Returns an array with the dimensions of X but axis replaced by a last
+    axis of size len(percentiles).
+    """
+    X = np.moveaxis(np.asarray(X), axis, -1)
+    n = X.shape[-1]
+    pos = np.asarray(percentiles, dtype=np.float64) / 100. * (n - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, n - 1)
+    Xp = np.partition(X, np.unique(np.concatenate([lo, hi])), axis=-1)
+    frac = pos - lo
+    return Xp[..., lo] + (Xp[..., hi] - Xp[..., lo]) * frac
+
+
+def quantile_sketch(X, size, axis=-1):
+    """
+    Mergeable quantile sketch of the ensemble(s) in X (members along axis):
+    the size quantiles at probabilities (i+0.5)/size, i = 0, ..., size-1,
+    each one standing for an equal share of the members. Sketches of
+    different ensembles (e.g. Monte-Carlo iterations) are combined with
+    merge_quantile_sketches.
+    """
+    probs = 100. * (np.arange(size) + 0.5) / size
+    return ensemble_quantiles(X, probs, axis=axis)
+
+
+def merge_quantile_sketches(sketches, counts, percentiles):
+    """
+    Approximate percentiles of the union of ensembles from their sketches
+    (see quantile_sketch, sketch values along the last axis) and numbers of
+    members (counts). Points of all sketches are pooled, weighted by the
+    number of members each one stands for, and the percentiles interpolated
+    on the cumulated weights.
+    """
+    values = np.concatenate(sketches, axis=-1)
+    weights = np.concatenate([np.full(sketch.shape[-1], float(count) / sketch.shape[-1])
+                              for sketch, count in zip(sketches, counts)])
+    order = np.argsort(values, axis=-1)
+    values = np.take_along_axis(values, order, axis=-1)
+    w = weights[order]
+    # rank (in members) at the center of each point
+    ranks = np.cumsum(w, axis=-1) - 0.5 * w
+    npts = values.shape[-1]
+
+    merged = np.zeros(values.shape[:-1] + (len(percentiles),))
+    for i, pctl in enumerate(percentiles):
+        target = pctl / 100. * float(sum(counts))
+        nbelow = np.sum(ranks <= target, axis=-1, keepdims=True)
+        j1 = np.clip(nbelow - 1, 0, npts - 1)
+        j2 = np.clip(nbelow, 0, npts - 1)
+        r1 = np.take_along_axis(ranks, j1, axis=-1)[..., 0]
+        r2 = np.take_along_axis(ranks, j2, axis=-1)[..., 0]
+        v1 = np.take_along_axis(values, j1, axis=-1)[..., 0]
+        v2 = np.take_along_axis(values, j2, axis=-1)[..., 0]
+        frac = np.clip((target - r1) / np.where(r2 > r1, r2 - r1, 1.), 0., 1.)
+        merged[..., i] = v1 + (v2 - v1) * frac
+    return merged
+
+
+def merge_ensemble_percentiles(filenames, percentiles=None):
+    """
+    Ensemble percentiles of a variable over several Monte-Carlo iterations
+    from their ensemble_percentiles_<var>.npz archive files, which must
+    include the quantile sketches (core.save_archive_quantile_sketch). The
+    full ensembles are not needed.
+
+    Returns a dictionary with the content of a percentiles archive file
+    (coordinates and years of the first file) for the merged ensemble.
+    """
+    archives = [np.load(filen) for filen in filenames]
+    for filen, archive in zip(filenames, archives):
+        if 'xa_sketch' not in archive.files:
+            raise ValueError('No quantile sketches in ' + filen + '. Set '
+                             'core.save_archive_quantile_sketch to merge'
+                             ' ensemble percentiles.')
+
+    merged = {key: archive_value for key, archive_value in archives[0].items()
+              if key not in ('xb_sketch', 'xa_sketch')}
+    if percentiles is None:
+        percentiles = merged['percentiles']
+    counts = [int(archive['nens']) for archive in archives]
+    merged['nens'] = sum(counts)
+    merged['niters'] = len(archives)
+    merged['percentiles'] = percentiles
+    merged['xb_pctl'] = merge_quantile_sketches([archive['xb_sketch'] for archive in archives],
+                                                counts, percentiles)
+    merged['xa_pctl'] = merge_quantile_sketches([archive['xa_sketch'] for archive in archives],
+                                                counts, percentiles)
+    return merged
+
+
+def _accumulate_analysis_stats(cfg_core, k, Xavar, xam, xa_ens=None, xav=None,
+                               xa_pctl=None, xa_sketch=None, xa_sub=None):
+    """
+    Fills the statistics (ensemble mean and, if given, full ensemble,
+    variance, percentiles, quantile sketch or subsample of members) of the analysis ensemble
+    Xavar (state elements x Nens) of a variable at time index k of the
+    (time x space dims [x ...]) arrays.
+    """
+    nens = Xavar.shape[-1]
+    Xa = np.reshape(Xavar, xam.shape[1:] + (nens,))
+    xam[k] = np.mean(Xa,axis=-1,dtype=np.float64)  # ensemble mean
+    if xa_ens is not None:
+        xa_ens[k] = Xa                      # total ensemble
+    if xav is not None:
+        xav[k] = np.var(Xa,axis=-1,ddof=1,dtype=np.float64) # ensemble variance
+    if xa_pctl is not None:
+        xa_pctl[k] = ensemble_quantiles(Xa,cfg_core.save_archive_percentiles)
+    if xa_sketch is not None:
+        xa_sketch[k] = quantile_sketch(Xa,xa_sketch.shape[-1])
+    if xa_sub is not None:
+        xa_sub[k] = Xa[...,:cfg_core.save_archive_ens_subsample]
+
+
+def _ens_full_archive(cfg_core, filen, shape, spacecoords, dtype=np.float64):
+    """
+    Array (of type dtype) for the full analysis ensemble (time x space dims
+    x Nens) of a state variable. In memory, or with save_archive_ens_full_format set to
+    'netcdf', the 'xa_ens' variable of the filen.nc file, chunked (one time
+    per chunk) and compressed, so that the ensemble can be written one time
+    at a time with bounded memory. See _close_ens_full_archive.
+    """
+    if cfg_core.save_archive_ens_full_format != 'netcdf':
+        return np.zeros(shape, dtype=dtype)
+
+    ds = Dataset(filen + '.nc', 'w', format='NETCDF4')
+    dims = ('time',) + tuple(spacecoords) + ('member',)
+    for name, size in zip(dims, shape):
+        ds.createDimension(name, size)
+    return ds.createVariable('xa_ens', np.dtype(dtype), dims, zlib=True, complevel=4,
+                             chunksizes=[1] + list(shape[1:]))
+
+
+def _close_ens_full_archive(vars_to_save):
+    """
+    Writes the data other than the analysis ensemble (see _ens_full_archive)
+    in vars_to_save to the netcdf file of the full ensemble and closes it:
+    scalars as global attributes, years along time and arrays along the
+    space (and member) dims.
+    """
+    xa_ens = vars_to_save['xa_ens']
+    ds = xa_ens.group()
+    space_dims = xa_ens.dimensions[1:-1]
+    for name, value in vars_to_save.items():
+        if name == 'xa_ens':
+            continue
+        if name == 'years':
+            years = ds.createVariable('years', str, ('time',))
+            years[:] = np.array(value, dtype=object)
+            continue
+        value = np.asarray(value)
+        if value.ndim == 0:
+            ds.setncattr(name, value)
+        elif value.ndim == len(space_dims):
+            ds.createVariable(name, value.dtype, space_dims)[:] = value
+        else:
+            ds.createVariable(name, value.dtype,
+                              space_dims + ('member',))[:] = value
+    ds.close()
+
+
 def ensemble_stats(cfg_core, y_assim, y_eval=None):
     """
     Compute the ensemble mean and variance for files in the input directory
@@ -299,9 +733,33 @@ def ensemble_stats(cfg_core, y_assim, y_eval=None):
       Revised April 2018 (R. Tardif, UW)
               : Added options for archiving information on the reanalysis ensemble other than
                 the mean (i.e. full ensemble, ensemble variance, percentiles or subset of members)
+      Revised October 2026
+              : Analyses read from the memory-mapped AnalysisStore when available
+                instead of loading every year file for each variable.
+      Revised October 2026
+              : Single pass over the analyses: each one is read once (the next one
+                in a background thread) and the statistics of all variables (and the
+                Ye's) accumulated at once.
+      Revised October 2026
+              : Option to stream the full ensemble to chunked & compressed netcdf files
+                (cfg_core.save_archive_ens_full_format = 'netcdf') instead of
+                holding it in memory.
+      Revised October 2026
+              : Any number of ensemble percentiles, all computed with a single
+                partition of each ensemble, and optional quantile sketches
+                (cfg_core.save_archive_quantile_sketch) for merging percentiles
+                over Monte-Carlo iterations (see merge_ensemble_percentiles).
+      Revised October 2026
+              : Regridding of the archived fields (archive_regrid_method) with
+                ESMF interpolation weights calculated once per variable instead
+                of for every year (optionally persisted to cfg_core.regrid_weights_dir).
+      Revised October 2026
+              : Analysis statistics archived in the data type of the prior state vector
+                (e.g. float32 with cfg_core.state_dtype), means and variances accumulated
+                in float64.
 
       TODO: Look into how to prevent occurences of MemoryError when 
-            full-ensemble saving is activated.
+            full-ensemble saving is activated (other than with the netcdf format).
     """
 
     workdir = cfg_core.datadir_output
@@ -321,12 +779,33 @@ def ensemble_stats(cfg_core, y_assim, y_eval=None):
     # note: the .item() is necessary to access a dict stored in a npz file 
     state_info = npzfile['state_info'].item()
     nens = np.size(Xbtmp,1)
-
-    # get a listing of the analysis files
-    files = glob.glob(workdir+"/year*")
-    # sorted
-    sfiles = natural_sort(files)    
-    nyears = len(sfiles)
+    # analysis statistics archived in the data type of the state vector
+    # (core.state_dtype), accumulated in float64
+    archive_dtype = Xbtmp.dtype
+
+    # the analyses: memory-mapped store written by the driver, or one file
+    # per year (in older experiments)
+    if AnalysisStore.exists(workdir):
+        store = AnalysisStore(workdir)
+        analysis_years = store.years()
+        analysis_inds = np.flatnonzero(store.done)
+        def load_analysis(k):
+            return np.array(store.data[analysis_inds[k]])
+    else:
+        # get a listing of the analysis files
+        files = glob.glob(workdir+"/year*")
+        # sorted
+        sfiles = natural_sort(files)
+        analysis_years = [f.split('/')[-1].rstrip('.npy').lstrip('year')
+                          for f in sfiles]
+        def load_analysis(k):
+            return np.load(sfiles[k])
+    nyears = len(analysis_years)
+
+    # Statistics of the analyses are accumulated for all state variables in
+    # a single pass over the analyses (below). Here, the prior statistics are
+    # calculated and the arrays of analysis statistics allocated.
+    archived_vars = []
 
     # loop on state variables 
     for var in state_info.keys():
@@ -335,6 +814,7 @@ def ensemble_stats(cfg_core, y_assim, y_eval=None):
 
         ibeg = state_info[var]['pos'][0]
         iend = state_info[var]['pos'][1]
+        analysis_regrid = None
 
         # Determine variable type (2D lat/lon, 2D lat/depth, time series etc.)
         # Look for the 'vartype' entry in the state vector dict.
@@ -361,24 +841,26 @@ def ensemble_stats(cfg_core, y_assim, y_eval=None):
 
                 lat_2d = lats.reshape(nlat, nlon)
                 lon_2d = lons.reshape(nlat, nlon)
-                
-                [priorVariabletoArchive,
-                 lat_new,
-                 lon_new] = regrid_esmpy(target_grid['nlat'],
-                                         target_grid['nlon'],
-                                         nens,
-                                         Xbtmp[ibeg:iend+1,:],
-                                         lat_2d,
-                                         lon_2d,
-                                         nlat,
-                                         nlon,
-                                         include_poles=target_grid['include_poles'],
-                                         method=cfg_core.archive_esmpy_interp_method)
+
+                # interpolation weights calculated once, for the prior and
+                # all the analyses
+                regridder = get_esmpy_regridder(lat_2d, lon_2d,
+                                                target_grid['nlat'],
+                                                target_grid['nlon'],
+                                                include_poles=target_grid['include_poles'],
+                                                method=cfg_core.archive_esmpy_interp_method,
+                                                cache_dir=cfg_core.regrid_weights_dir)
+                priorVariabletoArchive = regridder(Xbtmp[ibeg:iend+1,:])
+                lat_new = regridder.lat_new
+                lon_new = regridder.lon_new
 
                 ndim1_archive = lat_new.shape[0]
                 ndim2_archive = lon_new.shape[1]
                 lats_archive = lat_new.flatten()
                 lons_archive = lon_new.flatten()
+
+                # analyses regridded the same way
+                analysis_regrid = regridder
                 
             else:            
                 # no regridding
@@ -394,67 +876,26 @@ def ensemble_stats(cfg_core, y_assim, y_eval=None):
             if cfg_core.save_archive == 'ens_variance':
                 xbv = np.var(Xb,axis=2,ddof=1) # ensemble variance
             elif cfg_core.save_archive == 'ens_percentiles':
-                xb_pctl = np.zeros([ndim1_archive,ndim2_archive,2])
-                xb_pctl[:,:,0] = np.percentile(Xb,cfg_core.save_archive_percentiles[0],axis=2)
-                xb_pctl[:,:,1] = np.percentile(Xb,cfg_core.save_archive_percentiles[1],axis=2)
+                xb_pctl = ensemble_quantiles(Xb,cfg_core.save_archive_percentiles)
             elif cfg_core.save_archive == 'ens_subsample':
                 xb_sub = Xb[:,:,0:cfg_core.save_archive_ens_subsample]
 
             
-            # -- Process the **analysis** (i.e. posterior) files --
-            years = []
+            # -- **Analysis** (i.e. posterior) statistics (filled below) --
+            years = list(analysis_years)
             if cfg_core.save_archive == 'ens_full':
-                if 'xa_ens' in dir():
-                    del xa_ens
-                xa_ens = np.zeros([nyears,ndim1_archive,ndim2_archive,nens])
-            xam = np.zeros([nyears,ndim1_archive,ndim2_archive])
+                xa_ens = _ens_full_archive(cfg_core, workdir + '/ensemble_full_' + var,
+                                           [nyears,ndim1_archive,ndim2_archive,nens],
+                                           state_info[var]['spacecoords'],
+                                           dtype=archive_dtype)
+            xam = np.zeros([nyears,ndim1_archive,ndim2_archive],dtype=archive_dtype)
             if cfg_core.save_archive == 'ens_variance':
-                xav = np.zeros([nyears,ndim1_archive,ndim2_archive],dtype=np.float64)
+                xav = np.zeros([nyears,ndim1_archive,ndim2_archive],dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_percentiles':
-                xa_pctl = np.zeros([nyears,ndim1_archive,ndim2_archive,2])
+                xa_pctl = np.zeros([nyears,ndim1_archive,ndim2_archive,len(cfg_core.save_archive_percentiles)],dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_subsample':
-                xa_sub = np.zeros([nyears,ndim1_archive,ndim2_archive,cfg_core.save_archive_ens_subsample])
-
-            k = -1
-            for f in sfiles:
-                k += 1
-                fname_end = f.split('/')[-1]
-                year = fname_end.rstrip('.npy').lstrip('year')
-                years.append(year)                
-
-                Xatmp = np.load(f)
-                
-                if cfg_core.archive_regrid_method is not None:
-                    # option to regrid the reanalysis is activated
-                    # nlat, nlon, lat_2d, lon_2d are same as for prior above
-                    [posteriorVariabletoArchive,
-                     lat_new,
-                     lon_new] = regrid_esmpy(target_grid['nlat'],
-                                             target_grid['nlon'],
-                                             nens,
-                                             Xatmp[ibeg:iend+1,:],
-                                             lat_2d,
-                                             lon_2d,
-                                             nlat,
-                                             nlon,
-                                             include_poles=target_grid['include_poles'],
-                                             method=cfg_core.archive_esmpy_interp_method)
-                else:
-                    posteriorVariabletoArchive = Xatmp[ibeg:iend+1,:]
-
-                Xa = np.reshape(posteriorVariabletoArchive,(ndim1_archive,ndim2_archive,nens))
-                xam[k,:,:] = np.mean(Xa,axis=2)       # ensemble mean
-                if cfg_core.save_archive == 'ens_full':
-                    xa_ens[k,:,:,:] = Xa              # total ensemble
-                elif cfg_core.save_archive == 'ens_variance':
-                    xav[k,:,:] = np.var(Xa,axis=2,ddof=1) # ensemble variance
-                elif cfg_core.save_archive == 'ens_percentiles':
-                    xa_pctl[k,:,:,0] = np.percentile(Xa,cfg_core.save_archive_percentiles[0],axis=2)
-                    xa_pctl[k,:,:,1] = np.percentile(Xa,cfg_core.save_archive_percentiles[1],axis=2)
-                elif cfg_core.save_archive == 'ens_subsample':
-                    xa_sub[k,:,:,:] = Xa[:,:,:cfg_core.save_archive_ens_subsample]
+                xa_sub = np.zeros([nyears,ndim1_archive,ndim2_archive,cfg_core.save_archive_ens_subsample],dtype=archive_dtype)
 
-                
             # form dictionary containing variables to save, including info on array dimensions
             coordname1 = state_info[var]['spacecoords'][0]
             coordname2 = state_info[var]['spacecoords'][1]
@@ -509,49 +950,26 @@ def ensemble_stats(cfg_core, y_assim, y_eval=None):
             if cfg_core.save_archive == 'ens_variance':
                 xbv = np.var(Xb,axis=2,ddof=1) # ensemble variance
             elif cfg_core.save_archive == 'ens_percentiles':
-                xb_pctl = np.zeros([ndim1,ndim2,2])
-                xb_pctl[:,:,0] = np.percentile(Xb,cfg_core.save_archive_percentiles[0],axis=2)
-                xb_pctl[:,:,1] = np.percentile(Xb,cfg_core.save_archive_percentiles[1],axis=2)
+                xb_pctl = ensemble_quantiles(Xb,cfg_core.save_archive_percentiles)
             elif cfg_core.save_archive == 'ens_subsample':
                 xb_sub = Xb[:,:,0:cfg_core.save_archive_ens_subsample]
 
             
-            # Process the **analysis** (i.e. posterior) files
-            years = []
+            # -- **Analysis** (i.e. posterior) statistics (filled below) --
+            years = list(analysis_years)
             # ensemble mean
-            xam = np.zeros([nyears,ndim1,ndim2])
+            xam = np.zeros([nyears,ndim1,ndim2],dtype=archive_dtype)
             if cfg_core.save_archive == 'ens_full':
-                if 'xa_ens' in dir():
-                    del xa_ens
-                xa_ens = np.zeros([nyears,ndim1,ndim2,nens])
+                xa_ens = _ens_full_archive(cfg_core, workdir + '/ensemble_full_' + var,
+                                           [nyears,ndim1,ndim2,nens],
+                                           state_info[var]['spacecoords'],
+                                           dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_variance':
-                xav = np.zeros([nyears,ndim1,ndim2],dtype=np.float64)
+                xav = np.zeros([nyears,ndim1,ndim2],dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_percentiles':
-                 xa_pctl = np.zeros([nyears,ndim1,ndim2,2])
+                 xa_pctl = np.zeros([nyears,ndim1,ndim2,len(cfg_core.save_archive_percentiles)],dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_subsample':
-                xa_sub = np.zeros([nyears,ndim1,ndim2,cfg_core.save_archive_ens_subsample])
-
-            k = -1
-            for f in sfiles:
-                k += 1
-                fname_end = f.split('/')[-1]
-                year = fname_end.rstrip('.npy').lstrip('year')
-                years.append(year)
-                
-                Xatmp = np.load(f)
-
-                Xa = np.reshape(Xatmp[ibeg:iend+1,:],(ndim1,ndim2,nens))
-                xam[k,:,:] = np.mean(Xa,axis=2)       # ensemble mean
-                if cfg_core.save_archive == 'ens_full':
-                    xa_ens[k,:,:,:] = Xa              # total ensemble
-                elif cfg_core.save_archive == 'ens_variance':
-                    xav[k,:,:] = np.var(Xa,axis=2,ddof=1) # ensemble variance
-                elif cfg_core.save_archive == 'ens_percentiles':
-                    xa_pctl[k,:,:,0] = np.percentile(Xa,cfg_core.save_archive_percentiles[0],axis=2)
-                    xa_pctl[k,:,:,1] = np.percentile(Xa,cfg_core.save_archive_percentiles[1],axis=2)
-                elif cfg_core.save_archive == 'ens_subsample':
-                    xa_sub[k,:,:,:] = Xa[:,:,:cfg_core.save_archive_ens_subsample]
-
+                xa_sub = np.zeros([nyears,ndim1,ndim2,cfg_core.save_archive_ens_subsample],dtype=archive_dtype)
 
             # form dictionary containing variables to save, including info on array dimensions
             coordname1 = state_info[var]['spacecoords'][0]
@@ -606,49 +1024,26 @@ def ensemble_stats(cfg_core, y_assim, y_eval=None):
             if cfg_core.save_archive == 'ens_variance':
                 xbv = np.var(Xb,axis=1,ddof=1) # ensemble variance
             elif cfg_core.save_archive == 'ens_percentiles':
-                xb_pctl = np.zeros([ndim1,2])
-                xb_pctl[:,0] = np.percentile(Xb,cfg_core.save_archive_percentiles[0],axis=1)
-                xb_pctl[:,1] = np.percentile(Xb,cfg_core.save_archive_percentiles[1],axis=1)
+                xb_pctl = ensemble_quantiles(Xb,cfg_core.save_archive_percentiles)
             elif cfg_core.save_archive == 'ens_subsample':
                 xb_sub = Xb[:,0:cfg_core.save_archive_ens_subsample]
 
 
-            # Process the **analysis** (i.e. posterior) files
-            years = []
+            # -- **Analysis** (i.e. posterior) statistics (filled below) --
+            years = list(analysis_years)
             # ensemble mean
-            xam = np.zeros([nyears,ndim1])
+            xam = np.zeros([nyears,ndim1],dtype=archive_dtype)
             if cfg_core.save_archive == 'ens_full':
-                if 'xa_ens' in dir():
-                    del xa_ens
-                xa_ens = np.zeros([nyears,ndim1,nens])
+                xa_ens = _ens_full_archive(cfg_core, workdir + '/ensemble_full_' + var,
+                                           [nyears,ndim1,nens],
+                                           state_info[var]['spacecoords'],
+                                           dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_variance':
-                xav = np.zeros([nyears,ndim1],dtype=np.float64)
+                xav = np.zeros([nyears,ndim1],dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_percentiles':
-                xa_pctl = np.zeros([nyears,ndim1,2])
+                xa_pctl = np.zeros([nyears,ndim1,len(cfg_core.save_archive_percentiles)],dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_subsample':
-                xa_sub = np.zeros([nyears,ndim1,cfg_core.save_archive_ens_subsample])
-
-            k = -1
-            for f in sfiles:
-                k += 1
-                fname_end = f.split('/')[-1]
-                year = fname_end.rstrip('.npy').lstrip('year')
-                years.append(year)
-
-                Xatmp = np.load(f)
-
-                Xa = np.reshape(Xatmp[ibeg:iend+1,:],(ndim1,nens))
-                xam[k,:] = np.mean(Xa,axis=1)       # ensemble mean
-                if cfg_core.save_archive == 'ens_full':
-                    xa_ens[k,:,:] = Xa              # total ensemble
-                elif cfg_core.save_archive == 'ens_variance':
-                    xav[k,:] = np.var(Xa,axis=1,ddof=1) # ensemble variance
-                elif cfg_core.save_archive == 'ens_percentiles':
-                    xa_pctl[k,:,0] = np.percentile(Xa,cfg_core.save_archive_percentiles[0],axis=1)
-                    xa_pctl[k,:,1] = np.percentile(Xa,cfg_core.save_archive_percentiles[1],axis=1)
-                elif cfg_core.save_archive == 'ens_subsample':
-                    xa_sub[k,:,:] = Xa[:,0:cfg_core.save_archive_ens_subsample]
-
+                xa_sub = np.zeros([nyears,ndim1,cfg_core.save_archive_ens_subsample],dtype=archive_dtype)
 
             # form dictionary containing variables to save, including info on array dimensions
             coordname1 = state_info[var]['spacecoords'][0]
@@ -690,46 +1085,22 @@ def ensemble_stats(cfg_core, y_assim, y_eval=None):
             if cfg_core.save_archive == 'ens_variance':
                 xbv = np.var(Xb,axis=1,ddof=1)   # ensemble variance
             elif cfg_core.save_archive == 'ens_percentiles':
-                xb_pctl = np.zeros([2])
-                xb_pctl[0] = np.percentile(Xb,cfg_core.save_archive_percentiles[0],axis=1)
-                xb_pctl[1] = np.percentile(Xb,cfg_core.save_archive_percentiles[1],axis=1)
+                xb_pctl = ensemble_quantiles(Xb,cfg_core.save_archive_percentiles)[0]
             elif cfg_core.save_archive == 'ens_subsample':
                 xb_sub = Xb[:,0:cfg_core.save_archive_ens_subsample]
 
 
-            # process the **analysis** files
-            years = []
-            xa_ens = np.zeros((nyears, Xb.shape[1]))
-            xam = np.zeros([nyears])
+            # -- **Analysis** (i.e. posterior) statistics (filled below) --
+            years = list(analysis_years)
+            xa_ens = np.zeros((nyears, Xb.shape[1]),dtype=archive_dtype)
+            xam = np.zeros([nyears],dtype=archive_dtype)
             if cfg_core.save_archive == 'ens_variance':
-                xav = np.zeros([nyears],dtype=np.float64)
+                xav = np.zeros([nyears],dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_percentiles':
-                xa_pctl = np.zeros([nyears,2])
+                xa_pctl = np.zeros([nyears,len(cfg_core.save_archive_percentiles)],dtype=archive_dtype)
             elif cfg_core.save_archive == 'ens_subsample':
-                xa_sub = np.zeros([nyears,cfg_core.save_archive_ens_subsample])
-
-            k = -1
-            for f in sfiles:
-                k += 1
-                fname_end = f.split('/')[-1]
-                year = fname_end.rstrip('.npy').lstrip('year')
-                years.append(year)
-                
-                Xatmp = np.load(f)
-
-                Xa = Xatmp[ibeg:iend+1,:]
-                xa_ens[k] = Xa              # total ensemble
-                xam[k] = np.mean(Xa,axis=1) # ensemble mean
-                if cfg_core.save_archive == 'ens_variance':
-                    xav[k] = np.var(Xa,axis=1,ddof=1)  # ensemble variance
-                elif cfg_core.save_archive == 'ens_percentiles':
-                    xa_pctl = np.zeros([nyears,2])
-                    xa_pctl[k,0] = np.percentile(Xa,cfg_core.save_archive_percentiles[0],axis=1)
-                    xa_pctl[k,1] = np.percentile(Xa,cfg_core.save_archive_percentiles[1],axis=1)
-                elif cfg_core.save_archive == 'ens_subsample':
-                    xa_sub[k,:] = Xa[:,0:cfg_core.save_archive_ens_subsample]
-                    
-                
+                xa_sub = np.zeros([nyears,cfg_core.save_archive_ens_subsample],dtype=archive_dtype)
+
             vars_to_save_ens = {'nens':nens, 'years':years, 'xb_ens':Xb, 'xa_ens':xa_ens}
             vars_to_save_mean = {'nens':nens, 'years':years, 'xbm':xbm, 'xam':xam}
 
@@ -743,71 +1114,103 @@ def ensemble_stats(cfg_core, y_assim, y_eval=None):
                 vars_to_save_var  = {'nens':nens, 'nsubsample': cfg_core.save_archive_ens_subsample, \
                                      'years':years, 'xb_subsample':xb_sub, 'xa_subsample':xa_sub}
 
-            # (full) ensemble to file for this variable type
-            filen = workdir + '/ensemble_full_' + var
-            print('writing the new ensemble file' + filen)
-            np.savez(filen, **vars_to_save_ens)
-
         else: 
             print('ERROR in ensemble_stats: Variable of unrecognized (space) dimensions! Skipping variable:', var)
             continue
 
         
-        # --- Write data to archive files ---
+        # analysis statistics to accumulate (arrays of the archive files)
+        analysis_stats = {'xam': xam}
+        if (state_info[var]['vartype'] == '0D:time series' or
+                cfg_core.save_archive == 'ens_full'):
+            analysis_stats['xa_ens'] = xa_ens
+        if cfg_core.save_archive == 'ens_variance':
+            analysis_stats['xav'] = xav
+        elif cfg_core.save_archive == 'ens_percentiles':
+            analysis_stats['xa_pctl'] = xa_pctl
+            if cfg_core.save_archive_quantile_sketch:
+                # sketches for merging percentiles over Monte-Carlo iterations
+                nsketch = cfg_core.save_archive_quantile_sketch
+                vars_to_save_var['xb_sketch'] = quantile_sketch(
+                    np.reshape(Xb, xam.shape[1:] + (nens,)), nsketch)
+                vars_to_save_var['xa_sketch'] = np.zeros(xam.shape + (nsketch,),dtype=archive_dtype)
+                analysis_stats['xa_sketch'] = vars_to_save_var['xa_sketch']
+        elif cfg_core.save_archive == 'ens_subsample':
+            analysis_stats['xa_sub'] = xa_sub
+
+        # --- Data to archive files ---
 
         # ens. mean to file
-        filen = workdir + '/ensemble_mean_' + var
-        print('writing the new ensemble mean file...' + filen)
-        np.savez(filen, **vars_to_save_mean)
+        archive_files = [('/ensemble_mean_', 'writing the new ensemble mean file...',
+                          vars_to_save_mean)]
 
+        if state_info[var]['vartype'] == '0D:time series':
+            # (full) ensemble to file for this variable type
+            archive_files.append(('/ensemble_full_', 'writing the new ensemble file',
+                                  vars_to_save_ens))
         if (state_info[var]['vartype'] != '0D:time series') and cfg_core.save_archive == 'ens_full':
-            filen = workdir + '/ensemble_full_' + var
-            print('writing the new ensemble file' + filen)
-            np.savez(filen, **vars_to_save_ens)
+            archive_files.append(('/ensemble_full_', 'writing the new ensemble file',
+                                  vars_to_save_ens))
         elif cfg_core.save_archive == 'ens_variance':
-            filen = workdir + '/ensemble_variance_' + var
-            print('writing the new ensemble variance file...' + filen)
-            np.savez(filen, **vars_to_save_var)
+            archive_files.append(('/ensemble_variance_', 'writing the new ensemble variance file...',
+                                  vars_to_save_var))
         elif cfg_core.save_archive == 'ens_percentiles':
-            filen = workdir + '/ensemble_percentiles_' + var
-            print('writing the new ensemble percentiles file...' + filen)
-            np.savez(filen, **vars_to_save_var)
+            archive_files.append(('/ensemble_percentiles_', 'writing the new ensemble percentiles file...',
+                                  vars_to_save_var))
         elif cfg_core.save_archive == 'ens_subsample':
-            filen = workdir + '/ensemble_subsample_' + var
-            print('writing the new ensemble members subsample file...' + filen)
-            np.savez(filen, **vars_to_save_var)
+            archive_files.append(('/ensemble_subsample_', 'writing the new ensemble members subsample file...',
+                                  vars_to_save_var))
+
+        archived_vars.append((var, ibeg, iend, analysis_regrid, analysis_stats,
+                              archive_files))
 
 
     # --------------------------------------------------------
-    # Extract the analyzed Ye ensemble for diagnostic purposes
+    # Single pass over the analyses (next one read in the background)
     # --------------------------------------------------------
     if write_posterior_Ye:
-
-        if 'xa_ens' in dir():
-            del xa_ens
-        
         # get information on dim of state without the Ye's (before augmentation)
         stateDim  = npzfile['stateDim']
         Xbtmp_aug = npzfile['Xb_one_aug']
         # dim of entire state vector (augmented)
         totDim = Xbtmp_aug.shape[0]
         nbye = (totDim - stateDim)
-        Ye_s = np.zeros([nbye,nyears,nens])
-
-        # Loop over **analysis** files & extract the Ye's
-        years = []
-        for k, f in enumerate(sfiles):
-            i = f.rfind('year')
-            fname_end = f[i+4:]
-            ii = fname_end.rfind('.')
-            year = fname_end[:ii]
-            years.append(float(year))
-            Xatmp = np.load(f)
+        Ye_s = np.zeros([nbye,nyears,nens],dtype=archive_dtype)
+
+    for k, Xatmp in enumerate(_prefetch(load_analysis, nyears)):
+        for var, ibeg, iend, analysis_regrid, analysis_stats, _ in archived_vars:
+            Xavar = Xatmp[ibeg:iend+1,:]
+            if analysis_regrid is not None:
+                # option to regrid the reanalysis is activated
+                Xavar = analysis_regrid(Xavar)
+            _accumulate_analysis_stats(cfg_core, k, Xavar, **analysis_stats)
+
+        if write_posterior_Ye:
             # Extract the Ye's from augmented state (beyond stateDim 'til end of
             # state vector).
             # RT Aug 2017: These now include Ye's from assimilated AND withheld proxies.
             Ye_s[:, k, :] = Xatmp[stateDim:, :]
-        years = np.array(years)
+
+    # --- Write data to archive files ---
+    for var, _, _, _, _, archive_files in archived_vars:
+        for file_prefix, message, vars_to_save in archive_files:
+            filen = workdir + file_prefix + var
+            if isinstance(vars_to_save.get('xa_ens'), Variable):
+                # full ensemble already streamed to netcdf file
+                print(message + filen + '.nc')
+                _close_ens_full_archive(vars_to_save)
+            else:
+                print(message + filen)
+                np.savez(filen, **vars_to_save)
+
+
+    # --------------------------------------------------------
+    # Extract the analyzed Ye ensemble for diagnostic purposes
+    # --------------------------------------------------------
+    if write_posterior_Ye:
+
+        # Ye's extracted from the **analyses** above
+        years = np.array([float(year) for year in analysis_years])
 
         int_recon = years[1] - years[0]
 
@@ -891,6 +1294,58 @@ def lon_lat_to_cartesian(lon, lat, R=6371.):
 
     return x, y, z
 
+# distance-weighting tables of regrid_simple, by hash of the grids
+_regrid_simple_tables = collections.OrderedDict()
+_regrid_simple_tables_max = 16
+
+
+def _regrid_simple_weights(lats, lons, lat_new, lon_new, N):
+    """
+    Local distance weights of regrid_simple, from the source grid points
+    (lats, lons) to the points of the new grid (lat_new, lon_new), built
+    once per pair of grids and cached (up to the 16 most recently used).
+
+    Returns sparse matrices (new grid points x source points) of the
+    normalized weights of the N source points closest to each new grid
+    point and of the corresponding neighbor indicators (ones).
+    """
+    h = hashlib.sha1()
+    h.update(str(N).encode())
+    for coords in (lats, lons, lat_new, lon_new):
+        h.update(str(np.shape(coords)).encode())
+        h.update(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+    key = h.hexdigest()
+
+    table = _regrid_simple_tables.pop(key, None)
+    if table is None:
+        # cartesian coords of target grid
+        xt,yt,zt = lon_lat_to_cartesian(np.ravel(lon_new), np.ravel(lat_new))
+        # cartesian coords of source grid
+        xs,ys,zs = lon_lat_to_cartesian(np.asarray(lons, dtype=np.float64),
+                                        np.asarray(lats, dtype=np.float64))
+
+        # cKDtree object of source grid
+        tree = cKDTree(np.column_stack((xs,ys,zs)))
+
+        # inverse distance weighting (N pts)
+        d, inds = tree.query(np.column_stack((xt,yt,zt)), k=N)
+        L = 200.
+        w = np.exp(-np.square(d)/np.square(L))
+        w = w / np.sum(w, axis=1, keepdims=True)
+
+        shape = (xt.size, xs.size)
+        rows = np.repeat(np.arange(xt.size), N)
+        weights = sparse.csr_matrix((w.ravel(), (rows, inds.ravel())), shape=shape)
+        nbneighbors = sparse.csr_matrix((np.ones(rows.size), (rows, inds.ravel())),
+                                        shape=shape)
+        table = (weights, nbneighbors)
+    _regrid_simple_tables[key] = table
+    while len(_regrid_simple_tables) > _regrid_simple_tables_max:
+        _regrid_simple_tables.popitem(last=False)
+
+    return table
+
+
 def regrid_simple(Nens,X,X_coords,ind_lat,ind_lon,ntrunc):
     """
     Truncate lat,lon grid to another resolution using local distance-weighted 
@@ -913,6 +1368,12 @@ def regrid_simple(Nens,X,X_coords,ind_lat,ind_lon,ntrunc):
     Originator: Robert Tardif
                 University of Washington
                 March 2017
+
+    Revised October 2026: distance weights calculated once per pair of
+                          grids (see _regrid_simple_weights) and applied to
+                          all members at once as sparse matrix products.
+                          Averages of members with invalid data use the
+                          valid data of that member only.
     """
         
     # truncate to a lower resolution grid (triangular truncation)
@@ -932,44 +1393,28 @@ def regrid_simple(Nens,X,X_coords,ind_lat,ind_lon,ntrunc):
     lat_new, lon_new, _, _ = generate_latlon(nlat_new, nlon_new,
                                              include_endpts=include_poles)
 
-    # cartesian coords of target grid
-    xt,yt,zt = lon_lat_to_cartesian(lon_new.flatten(), lat_new.flatten())
-
-    # cartesian coords of source grid
+    # distance weights (N pts) from the source grid to the new grid
     lats = X_coords[:, ind_lat]
     lons = X_coords[:, ind_lon]
-    xs,ys,zs = lon_lat_to_cartesian(lons, lats)
-
-    # cKDtree object of source grid
-    tree = cKDTree(list(zip(xs,ys,zs)))
-
-    # inverse distance weighting (N pts)
     N = 20
     fracvalid = 0.7
-    d, inds = tree.query(list(zip(xt,yt,zt)), k=N)
-    L = 200.
-    w = np.exp(-np.square(d)/np.square(L))
-
-    # transform each ensemble member, one at a time
-    X_new = np.zeros([nlat_new*nlon_new,Nens])
-    X_new[:] = np.nan
-    for k in range(Nens):
-        tmp = np.ma.masked_invalid(X[:,k][inds])
-        mask = tmp.mask
-
-        # apply tmp mask to weights array
-        w = np.ma.masked_where(np.ma.getmask(tmp),w)
-        
-        # compute weighted-average of surrounding data
-        datagrid = np.sum(w*tmp, axis=1)/np.sum(w, axis=1)
-
-        # keep track of valid data involved in averges  
-        nbvalid = np.sum(~mask,axis=1)
-        nonvalid = np.where(nbvalid < int(fracvalid*N))[0]
+    weights, nbneighbors = _regrid_simple_weights(lats, lons, lat_new, lon_new, N)
+
+    # weighted averages of surrounding data for all ensemble members at once
+    if hasattr(X, 'mask'):
+        X = np.ma.filled(X.astype(np.float64), np.nan)
+    valid = np.isfinite(X)
+    if valid.all():
+        X_new = weights.dot(X)
+    else:
+        # only valid data in averages
+        with np.errstate(invalid='ignore', divide='ignore'):
+            X_new = (weights.dot(np.where(valid, X, 0.)) /
+                     weights.dot(valid.astype(np.float64)))
 
         # make sure to mask grid points where too few valid data were used
-        datagrid[nonvalid] = np.nan
-        X_new[:,k] = datagrid
+        nbvalid = nbneighbors.dot(valid.astype(np.float64))
+        X_new[nbvalid < int(fracvalid*N)] = np.nan
 
     # make sure a masked array is returned, if at
     # least one invalid data is found
@@ -979,50 +1424,173 @@ def regrid_simple(Nens,X,X_coords,ind_lat,ind_lon,ntrunc):
     return X_new,lat_new,lon_new
 
 
-def regrid_esmpy(target_nlat, target_nlon, X_nens, X, X_lat2D, X_lon2D,
-                 X_nlat, X_nlon, include_poles=False, method='bilinear'):
+class ESMFRegridder(object):
     """
-    Regrid field to target resolution using the ESMF package.
-    
-    Parameters
+    Regridding of fields on a (nlat, nlon) lat/lon grid to a regular lat/lon
+    grid with the ESMF package (see regrid_esmpy). The interpolation weights
+    are generated by ESMF once per source grid (and mask), target grid and
+    method and kept as a sparse (target points x source points) matrix, so
+    that regridding a (source points x Nens) array is a single sparse matrix
+    product. The weights can optionally be persisted to (and reloaded from)
+    a npz file in cache_dir, identified by a hash of the regridding
+    definition.
+
+    Attributes
     ----------
-    target_nlat: int
-        number of latitude points for destination grid
-    target_nlon: int
-        number of longitude points for the destination grid
-    X_nens: int
-        number of ensemble members in the data array
-    X: ndarray
-        data array to be regridded of shape (nlat*nlon, nens)
-    X_lat2D: ndarray
-        2D array of latitudes corresponding to the source field of shape (
-        nlat, nlon)
-    X_lon2D: ndarray
-        2D array of longitudes corresponding to the source field of shape (
-        nlat, nlon)
-    X_nlat: int
-        number of latitude points in the source grid
-    X_nlon: int
-        number of longitude points in the source grid
-    include_poles: boolean
-        consider (or not) poles in constructing the lat-lon grid
-    method: str
-        Regridding method to use. Valid options include 'bilinear' and 'patch'
-
-    Returns
-    -------    
-    X_new:  
-        truncated data array of shape (nlat_new*nlon_new, Nens)
+    weights: scipy.sparse.csr_matrix
+        Interpolation weights (target points x source points)
     lat_new: ndarray
         2D latitude array on the new grid (nlat_new,nlon_new)
     lon_new: ndarray
         2D longitude array on the new grid (nlat_new,nlon_new)
-        
-    Notes
-    -----
-    This regridding function supports masked grids
+    unmapped: ndarray
+        Boolean array of the target points without any weights
+    key: str
+        Hash identifying the regridding definition
+    filename: str or None
+        Path of the npz file where the weights are persisted
+    """
 
+    def __init__(self, X_lat2D, X_lon2D, target_nlat, target_nlon,
+                 include_poles=False, method='bilinear', src_mask=None,
+                 cache_dir=None):
+        self.X_nlat, self.X_nlon = X_lat2D.shape
+        self.target_nlat = target_nlat
+        self.target_nlon = target_nlon
+        self.key = esmpy_regridder_key(X_lat2D, X_lon2D, target_nlat,
+                                       target_nlon, include_poles, method,
+                                       src_mask)
+
+        self.filename = None
+        if cache_dir is not None:
+            self.filename = os.path.join(cache_dir,
+                                         'regrid_weights_' + self.key + '.npz')
+
+        if (self.filename is None or not os.path.isfile(self.filename) or
+                not self.load()):
+            [src_inds, dst_inds, factors,
+             self.lat_new, self.lon_new] = _esmpy_regrid_factors(
+                X_lat2D, X_lon2D, target_nlat, target_nlon,
+                include_poles=include_poles, method=method, src_mask=src_mask)
+            self._set_weights(src_inds, dst_inds, factors)
+            self.save()
+
+    def _set_weights(self, src_inds, dst_inds, factors):
+        self.weights = sparse.csr_matrix(
+            (factors, (dst_inds, src_inds)),
+            shape=(self.target_nlat * self.target_nlon, self.X_nlat * self.X_nlon))
+        self.unmapped = np.diff(self.weights.indptr) == 0
+
+    def __call__(self, X):
+        """
+        Regrid X, of shape (nlat*nlon, Nens), to the new grid. Returns an
+        array of shape (nlat_new*nlon_new, Nens), masked at the target points
+        without weights if X is masked.
+        """
+        masked_regrid = hasattr(X, 'mask')
+        if masked_regrid:
+            X = np.ma.filled(X, 0.)
+        regrid_output = self.weights.dot(X)
+        if masked_regrid:
+            regrid_output[self.unmapped] = np.nan
+            regrid_output = np.ma.masked_invalid(regrid_output)
+        return regrid_output
+
+    def load(self):
+        """
+        Load the weights from file. Returns False (weights not loaded) if
+        the file cannot be read.
+        """
+        try:
+            with np.load(self.filename) as data:
+                lat_new = data['lat_new']
+                lon_new = data['lon_new']
+                src_inds = data['src_inds']
+                dst_inds = data['dst_inds']
+                factors = data['factors']
+        except (IOError, OSError, EOFError, ValueError, KeyError,
+                zipfile.BadZipFile):
+            print('Unreadable regridding weights file (ignored): ' + self.filename)
+            return False
+        self.lat_new = lat_new
+        self.lon_new = lon_new
+        self._set_weights(src_inds, dst_inds, factors)
+        return True
+
+    def save(self):
+        """
+        Write the weights to file.
+        """
+        if self.filename is None:
+            return
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        weights = self.weights.tocoo()
+        # written to a temporary file first: other processes (concurrent
+        # iterations) may be reading the weights at the same time
+        tmpfilen = '{}.{}.tmp'.format(self.filename, os.getpid())
+        with open(tmpfilen, 'wb') as f:
+            np.savez(f, src_inds=weights.col, dst_inds=weights.row,
+                     factors=weights.data, lat_new=self.lat_new,
+                     lon_new=self.lon_new)
+        os.replace(tmpfilen, self.filename)
+
+
+def esmpy_regridder_key(X_lat2D, X_lon2D, target_nlat, target_nlon,
+                        include_poles=False, method='bilinear', src_mask=None):
+    """
+    Hash identifying an ESMF regridding (source grid and mask, target grid,
+    method).
     """
+    h = hashlib.sha1()
+    h.update(str(X_lat2D.shape).encode())
+    h.update(np.ascontiguousarray(X_lat2D, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(X_lon2D, dtype=np.float64).tobytes())
+    if src_mask is not None:
+        h.update(np.ascontiguousarray(src_mask, dtype=bool).tobytes())
+    h.update(repr((int(target_nlat), int(target_nlon), bool(include_poles),
+                   method)).encode())
+    return h.hexdigest()
+
+
+# ESMF regridders built so far, by hash of the regridding definition
+_esmpy_regridders = collections.OrderedDict()
+_esmpy_regridders_max = 16
+
+
+def get_esmpy_regridder(X_lat2D, X_lon2D, target_nlat, target_nlon,
+                        include_poles=False, method='bilinear', src_mask=None,
+                        cache_dir=None):
+    """
+    Returns the ESMFRegridder for the given source grid (and mask), target
+    grid and method, built once and cached (up to the 16 most recently used).
+    With cache_dir, weights are also persisted to disk for reuse by other
+    reconstructions.
+    """
+    key = esmpy_regridder_key(X_lat2D, X_lon2D, target_nlat, target_nlon,
+                              include_poles, method, src_mask)
+    regridder = _esmpy_regridders.pop(key, None)
+    if regridder is None:
+        regridder = ESMFRegridder(X_lat2D, X_lon2D, target_nlat, target_nlon,
+                                  include_poles=include_poles, method=method,
+                                  src_mask=src_mask, cache_dir=cache_dir)
+    _esmpy_regridders[key] = regridder
+    while len(_esmpy_regridders) > _esmpy_regridders_max:
+        _esmpy_regridders.popitem(last=False)
+
+    return regridder
+
+
+def _esmpy_regrid_factors(X_lat2D, X_lon2D, target_nlat, target_nlon,
+                          include_poles=False, method='bilinear', src_mask=None):
+    """
+    Interpolation weights from ESMF for regridding from the (nlat, nlon)
+    source grid to a regular target_nlat x target_nlon lat/lon grid.
+
+    Returns the (0-based, C-ordered) indices of the source and target grid
+    points and the weights of the nonzero factors, and the 2D latitude and
+    longitude arrays of the new grid.
+    """
+    X_nlat, X_nlon = X_lat2D.shape
 
     lons_1D = X_lon2D[0]
     lon_diff_negative = np.diff(lons_1D) < 0
@@ -1032,7 +1600,7 @@ def regrid_esmpy(target_nlat, target_nlon, X_nens, X, X_lat2D, X_lon2D,
     # adjust cyclinc longitude point to boundaries if necessary
     elif lon_diff_negative.sum() == 1:
         cyclic_idx_start, = np.where(lon_diff_negative)
-        lon_shift = -(cyclic_idx_start+1)
+        lon_shift = -(cyclic_idx_start[0]+1)
         X_lon2D = np.roll(X_lon2D, lon_shift, axis=1)
         X_lat2D = np.roll(X_lat2D, lon_shift, axis=1)
     else:
@@ -1063,13 +1631,10 @@ def regrid_esmpy(target_nlat, target_nlon, X_nens, X, X_lat2D, X_lon2D,
     grid_y_corner = grid.get_coords(y, staggerloc=ESMF.StaggerLoc.CORNER)
     grid_y_corner[:] = lat_bnds[None, :]
 
-    # check for masked values
-    masked_regrid = hasattr(X, 'mask')
-
-    if masked_regrid:
+    if src_mask is not None:
         print('Mask detected.  Adding mask to src ESMF grid')
         grid_mask = grid.add_item(ESMF.GridItem.MASK)
-        X_mask = X[:, 0].mask.astype(np.int16)
+        X_mask = np.asarray(src_mask).astype(np.int16)
         X_mask = X_mask.reshape(X_nlat, X_nlon)
 
         if lon_shift:
@@ -1124,44 +1689,118 @@ def regrid_esmpy(target_nlat, target_nlon, X_nens, X, X_lat2D, X_lon2D,
     dst_field = ESMF.Field(new_grid, name='dst',
                            staggerloc=ESMF.StaggerLoc.CENTER)
 
-    regrid_output = np.empty((target_nlat * target_nlon, X_nens))
+    # sparse matrix of interpolation factors, between 1-based sequence
+    # indices of the (lon, lat) ESMF grids, i.e. lon varying fastest
     regridder = ESMF.Regrid(src_field, dst_field, regrid_method=use_method,
                             src_mask_values=mask_values,
-                            unmapped_action=ESMF.UnmappedAction.IGNORE)
+                            unmapped_action=ESMF.UnmappedAction.IGNORE,
+                            factors=True)
+    factor_inds, factors = regridder.get_factors()
+    src_inds = np.array(factor_inds[:, 0], dtype=np.int64) - 1
+    dst_inds = np.array(factor_inds[:, 1], dtype=np.int64) - 1
+    factors = np.array(factors, dtype=np.float64)
+
+    if lon_shift:
+        # source indices on the grid before the cyclic adjustment
+        src_lat, src_lon = np.divmod(src_inds, X_nlon)
+        src_inds = src_lat*X_nlon + (src_lon - lon_shift) % X_nlon
 
-    # Regrid each ensemble member
-    for k in range(X_nens):
-        grid_data = X[:,k].reshape(X_nlat, X_nlon)
-
-        if lon_shift:
-            grid_data = np.roll(grid_data, lon_shift, axis=1)
+    # Clean up objects
+    regridder.destroy()
+    src_field.destroy()
+    dst_field.destroy()
+    grid.destroy()
+    new_grid.destroy()
 
-        src_field.data[:] = grid_data.T
+    return src_inds, dst_inds, factors, new_lat, new_lon
 
-        regridder(src_field, dst_field)
 
-        out_data = dst_field.data[:].T
+def regrid_esmpy(target_nlat, target_nlon, X_nens, X, X_lat2D, X_lon2D,
+                 X_nlat, X_nlon, include_poles=False, method='bilinear',
+                 cache_dir=None):
+    """
+    Regrid field to target resolution using the ESMF package.
+    
+    Parameters
+    ----------
+    target_nlat: int
+        number of latitude points for destination grid
+    target_nlon: int
+        number of longitude points for the destination grid
+    X_nens: int
+        number of ensemble members in the data array
+    X: ndarray
+        data array to be regridded of shape (nlat*nlon, nens)
+    X_lat2D: ndarray
+        2D array of latitudes corresponding to the source field of shape (
+        nlat, nlon)
+    X_lon2D: ndarray
+        2D array of longitudes corresponding to the source field of shape (
+        nlat, nlon)
+    X_nlat: int
+        number of latitude points in the source grid
+    X_nlon: int
+        number of longitude points in the source grid
+    include_poles: boolean
+        consider (or not) poles in constructing the lat-lon grid
+    method: str
+        Regridding method to use. Valid options include 'bilinear' and 'patch'
+    cache_dir: str, None
+        Directory where the interpolation weights are persisted (None: only
+        cached in memory)
 
-        # Check for masked values on new grid
-        if masked_regrid:
-            out_mask = out_data == 0.0  # if it's exactly zero, it's masked
-            out_data[out_mask] = np.nan
+    Returns
+    -------    
+    X_new:  
+        truncated data array of shape (nlat_new*nlon_new, Nens)
+    lat_new: ndarray
+        2D latitude array on the new grid (nlat_new,nlon_new)
+    lon_new: ndarray
+        2D longitude array on the new grid (nlat_new,nlon_new)
+        
+    Notes
+    -----
+    This regridding function supports masked grids. The interpolation
+    weights are calculated once per grids and method (see ESMFRegridder).
 
-        regrid_output[:, k] = out_data.flatten()
+    """
 
-    if masked_regrid:
-        regrid_output = np.ma.masked_invalid(regrid_output)
+    if hasattr(X, 'mask'):
+        src_mask = np.ma.getmaskarray(X[:, 0])
+    else:
+        src_mask = None
 
-    # Clean up objects
-    src_field.destroy()
-    dst_field.destroy()
-    grid.destroy()
-    new_grid.destroy()
-    regridder.destroy()
+    regridder = get_esmpy_regridder(np.reshape(X_lat2D, (X_nlat, X_nlon)),
+                                    np.reshape(X_lon2D, (X_nlat, X_nlon)),
+                                    target_nlat, target_nlon,
+                                    include_poles=include_poles, method=method,
+                                    src_mask=src_mask, cache_dir=cache_dir)
 
-    return regrid_output, new_lat, new_lon
+    return regridder(X), regridder.lat_new, regridder.lon_new
 
     
+# Spharmt objects built so far, by (nlon, nlat)
+_spharmt_objects = collections.OrderedDict()
+_spharmt_objects_max = 4
+
+
+def get_spharmt(nlon, nlat):
+    """
+    Returns the Spharmt object (regular grid, Legendre functions
+    precomputed and stored) of a nlat x nlon grid, built once and cached
+    (up to the 4 most recently used).
+    """
+    key = (int(nlon), int(nlat))
+    specob = _spharmt_objects.pop(key, None)
+    if specob is None:
+        specob = Spharmt(key[0],key[1],gridtype='regular',legfunc='stored')
+    _spharmt_objects[key] = specob
+    while len(_spharmt_objects) > _spharmt_objects_max:
+        _spharmt_objects.popitem(last=False)
+
+    return specob
+
+
 def regrid_sphere(nlat,nlon,Nens,X,ntrunc):
     """
     Truncate lat,lon grid to another resolution in spherical harmonic space. Triangular truncation
@@ -1181,19 +1820,23 @@ def regrid_sphere(nlat,nlon,Nens,X,ntrunc):
     Originator: Greg Hakim
                 University of Washington
                 May 2015
+
+    Revised October 2026: Spharmt objects (with stored Legendre functions)
+                          cached per grid, and all members transformed in
+                          a single call.
     """
 
     
-    # create the spectral object on the original grid
-    specob_lmr = Spharmt(nlon,nlat,gridtype='regular',legfunc='computed')
+    # spectral object on the original grid (cached)
+    specob_lmr = get_spharmt(nlon,nlat)
 
     # truncate to a lower resolution grid (triangular truncation)
     ifix = np.remainder(ntrunc,2.0).astype(int)
     nlat_new = ntrunc + ifix
     nlon_new = int(nlat_new*1.5)
 
-    # create the spectral object on the new grid
-    specob_new = Spharmt(nlon_new,nlat_new,gridtype='regular',legfunc='computed')
+    # spectral object on the new grid (cached)
+    specob_new = get_spharmt(nlon_new,nlat_new)
 
     # create new lat,lon grid arrays
     # Note: AP - According to github.com/jswhit/pyspharm documentation the
@@ -1206,13 +1849,10 @@ def regrid_sphere(nlat,nlon,Nens,X,ntrunc):
     lat_new, lon_new, _, _ = generate_latlon(nlat_new, nlon_new,
                                              include_endpts=include_poles)
 
-    # transform each ensemble member, one at a time
-    X_new = np.zeros([nlat_new*nlon_new,Nens])
-    for k in range(Nens):
-        X_lalo = np.reshape(X[:,k],(nlat,nlon))
-        Xbtrunc = regrid(specob_lmr, specob_new, X_lalo, ntrunc=nlat_new-1, smooth=None)
-        vectmp = Xbtrunc.flatten()
-        X_new[:,k] = vectmp
+    # transform all ensemble members at once: (nlat,nlon,Nens) stack
+    X_lalo = np.reshape(X[:,:Nens],(nlat,nlon,Nens))
+    Xbtrunc = regrid(specob_lmr, specob_new, X_lalo, ntrunc=nlat_new-1, smooth=None)
+    X_new = np.reshape(Xbtrunc,(nlat_new*nlon_new,Nens)).astype(np.float64)
 
     return X_new,lat_new,lon_new
 
@@ -16,8 +16,22 @@ Revisions:
           - Includes new parameter space search into iterations [A. Perkins, UW, Feb 2017]
           - Added flag to control whether or not the analysis_Ye.pckl is generated. [G. Hakim, UW, Aug 2017]
           - Added flag to control whether or not the full ensemble is output. [M. Erb, G. Hakim port, Aug 2017]
+          - Iterations can be performed concurrently by a pool of worker processes
+            (wrapper.max_workers) sharing the prior and proxy data loaded once, and
+            output files are now moved using python file operations. [Oct 2026]
+          - Full-ensemble netcdf files (core.save_archive_ens_full_format) are archived
+            along with the other output files. [Oct 2026]
+          - Ensemble percentiles over all the MC iterations merged from the iterations'
+            quantile sketches (core.save_archive_quantile_sketch). [Oct 2026]
+          - Iterations performed by the pool of worker processes read the prior and
+            reconstruct the years sequentially (core.recon_workers and
+            prior.load_workers set to 1): the daemonic workers cannot have
+            child processes. [Oct 2026]
 """
 import os
+import glob
+import shutil
+import multiprocessing
 import numpy as np
 import sys
 import yaml
@@ -25,6 +39,8 @@ import itertools
 import datetime
 import LMR_driver_callable as LMR
 import LMR_config
+import LMR_prior
+import load_data
 
 from LMR_utils import validate_config, ensemble_stats
 import LMR_utils as Utils
@@ -64,7 +80,7 @@ arc_dir = os.path.join(LMR_config.core.archive_dir, LMR_config.core.nexp)
 
 # Check if it exists, if not, create it
 if not os.path.isdir(expdir):
-    os.system('mkdir {}'.format(expdir))
+    os.makedirs(expdir)
 
 # Monte-Carlo approach: loop over iterations (range of iterations defined in
 # namelist)
@@ -80,8 +96,52 @@ if param_search is not None:
     param_values = [param_search[key] for key in sort_params]
     param_iterables = param_values + [MCiters]
 
-for iter_and_params in itertools.product(*param_iterables):
 
+def _move_files(pattern, dest_dir):
+    # equivalent of "mv -f pattern dest_dir/"
+    for filen in glob.glob(pattern):
+        dest = os.path.join(dest_dir, os.path.basename(filen))
+        print('moving ' + filen + ' to ' + dest_dir)
+        if os.path.isdir(dest):
+            shutil.rmtree(dest)
+        shutil.move(filen, dest)
+
+
+def _merge_mc_percentiles(mc_arc_dirs):
+    # ensemble percentiles over the Monte-Carlo iterations of this run
+    # (mc_arc_dirs) of each experiment (or parameter search) directory, merged
+    # from the quantile sketches of the iterations' ensemble_percentiles_*
+    # files. Iteration directories of earlier runs are not included.
+    files_by_exp = {}
+    for mc_arc_dir in mc_arc_dirs:
+        files_by_var = files_by_exp.setdefault(os.path.dirname(mc_arc_dir), {})
+        pattern = os.path.join(mc_arc_dir, 'ensemble_percentiles_*.npz')
+        for filen in glob.glob(pattern):
+            files_by_var.setdefault(os.path.basename(filen), []).append(filen)
+    for exp_dir, files_by_var in sorted(files_by_exp.items()):
+        for basename, filenames in sorted(files_by_var.items()):
+            merged_file = os.path.join(exp_dir, basename)
+            print('writing ensemble percentiles over {} iterations to {}'.format(
+                len(filenames), merged_file))
+            merged = Utils.merge_ensemble_percentiles(sorted(filenames))
+            np.savez(merged_file, **merged)
+
+
+def _remove_dir_content(dirname):
+    # equivalent of "rm -f -r dirname/*"
+    for filen in glob.glob(os.path.join(dirname, '*')):
+        if os.path.isdir(filen) and not os.path.islink(filen):
+            shutil.rmtree(filen)
+        else:
+            os.remove(filen)
+
+
+def iteration_config(iter_and_params):
+    """
+    Returns the configuration object, working directory and archive
+    directory of the Monte-Carlo iteration & parameter search values in
+    iter_and_params (an element of itertools.product(*param_iterables)).
+    """
     iter_num = iter_and_params[-1]
     cfg_dict = Utils.param_cfg_update('core.curr_iter', iter_num)
 
@@ -116,6 +176,21 @@ for iter_and_params in itertools.product(*param_iterables):
 
     cfg = LMR_config.Config(**cfg_params)
 
+    return cfg, working_dir, mc_arc_dir
+
+
+def run_iteration(iter_and_params, in_pool=False):
+    """
+    Performs the reconstruction for one Monte-Carlo iteration & parameter
+    search values, and moves the output to the archive directory.
+    With in_pool True (iteration performed by a worker of the iterations'
+    pool), the prior is read and the years are reconstructed sequentially.
+    """
+
+    cfg, working_dir, mc_arc_dir = iteration_config(iter_and_params)
+    if in_pool:
+        _sequential_iteration_config(cfg)
+
     proceed = validate_config(cfg)
     if not proceed:
         raise SystemExit()
@@ -129,7 +204,9 @@ for iter_and_params in itertools.product(*param_iterables):
     elif os.path.isdir(core.datadir_output) and core.clean_start:
         print (' **** clean start --- removing existing files in iteration'
                ' output directory')
-        os.system('rm -f {}'.format(core.datadir_output + '/*'))
+        for filen in glob.glob(os.path.join(core.datadir_output, '*')):
+            if not os.path.isdir(filen):
+                os.remove(filen)
 
     # Call the driver
     assim_proxy_objs, eval_proxy_objs = LMR.LMR_driver_callable(cfg)
@@ -147,52 +224,131 @@ for iter_and_params in itertools.product(*param_iterables):
         if core.clean_start:
             print (' **** clean start --- removing existing files in'
                    ' iteration output directory')
-            os.system('rm -f -r {}'.format(mc_arc_dir + '/*'))
+            _remove_dir_content(mc_arc_dir)
     else:
         os.makedirs(mc_arc_dir)
 
-    # remove the individual years
-    # cmd = 'rm -f ' + core.datadir_output + '/year* '
-    # option to move the whole directory
-    # cmd = 'mv -f ' + loc_dir + ' ' + mc_dir
-    # print cmd
-    # os.system(cmd)
-
-    # or just move select files and delete the rest
-
-    cmd = 'mv -f ' + working_dir + '/*.npz' + ' ' + mc_arc_dir + '/'
-    print(cmd)
-    os.system(cmd)
-    cmd = 'mv -f ' + working_dir + '/*.pckl' + ' ' + mc_arc_dir + '/'
-    print(cmd)
-    os.system(cmd)
-    cmd = 'mv -f ' + working_dir + '/assim*' + ' ' + mc_arc_dir + '/'
-    print(cmd)
-    os.system(cmd)
-    cmd = 'mv -f ' + working_dir + '/nonassim*' + ' ' + mc_arc_dir + '/'
-    print(cmd)
-    os.system(cmd)
+    # move select files and delete the rest
+    _move_files(os.path.join(working_dir, '*.npz'), mc_arc_dir)
+    _move_files(os.path.join(working_dir, '*.pckl'), mc_arc_dir)
+    _move_files(os.path.join(working_dir, '*.nc'), mc_arc_dir)
+    _move_files(os.path.join(working_dir, 'assim*'), mc_arc_dir)
+    _move_files(os.path.join(working_dir, 'nonassim*'), mc_arc_dir)
     # copy file containing info on samples defining the prior ensemble 
-    cmd = 'mv -f ' + working_dir + '/prior_sampling_info.txt' + ' ' + mc_arc_dir + '/'
-    print(cmd)
-    os.system(cmd)
-    
+    _move_files(os.path.join(working_dir, 'prior_sampling_info.txt'), mc_arc_dir)
     
     # removing the work output directory once selected files have been moved
-    cmd = 'rm -f -r ' + working_dir
-    print(cmd)
-    os.system(cmd)
+    print('removing ' + working_dir)
+    shutil.rmtree(working_dir, ignore_errors=True)
 
     # copy the configuration file to archive directory
     if LMR_config.LEGACY_CONFIG:
-        cmd = 'cp ./LMR_config.py ' + mc_arc_dir + '/'
+        config_file = './LMR_config.py'
     else:
-        cmd = 'cp ' + yaml_file + ' ' + mc_arc_dir + '/'
-    print(cmd)
-    os.system(cmd)
+        config_file = yaml_file
+    print('copying ' + config_file + ' to ' + mc_arc_dir)
+    shutil.copy(config_file, mc_arc_dir)
 
     print('\n' + str(datetime.datetime.now()) + '\n')
 
     #   end: DO NOT DELETE
-    
+
+    return mc_arc_dir
+
+
+def _sequential_iteration_config(cfg):
+    # the workers of the iterations' pool are daemonic processes, which are
+    # not allowed to have children: no pool of processes within an iteration
+    for section, attr in (('core', 'recon_workers'), ('prior', 'load_workers')):
+        nworkers = getattr(getattr(cfg, section), attr)
+        if nworkers is not None and nworkers > 1:
+            print('WARNING: {}.{} = {} ignored in iterations performed by'
+                  ' concurrent workers (wrapper.max_workers); set to 1.'.format(
+                      section, attr, nworkers))
+            setattr(getattr(cfg, section), attr, 1)
+
+
+def _run_iteration_job(iter_and_params):
+    # run_iteration in a worker process: errors (including SystemExit) are
+    # returned rather than raised, so the pool keeps running other iterations
+    try:
+        return iter_and_params, run_iteration(iter_and_params, in_pool=True), None
+    except (Exception, SystemExit) as e:
+        return iter_and_params, None, repr(e)
+
+
+def _iteration_memory_estimate(cfg, prior_dict):
+    """
+    Rough estimate (in GB) of the memory used by one iteration, from the
+    size of the state vector of the prior data: full and truncated prior
+    ensemble plus the update arrays, in the data type of the state vector.
+    """
+    Nx = sum(int(np.prod(prior_dict[var]['value'].shape[1:]))
+             for var in prior_dict.keys())
+    nens = cfg.core.nens
+    if nens is None:
+        nens = len(prior_dict[list(prior_dict.keys())[0]]['years'])
+    itemsize = np.dtype(cfg.core.state_dtype).itemsize
+    return 4. * Nx * nens * itemsize / 1024.**3
+
+
+iterations = list(itertools.product(*param_iterables))
+max_workers = LMR_config.wrapper.max_workers
+
+if max_workers is None or max_workers <= 1 or len(iterations) == 1:
+    # iterations performed sequentially
+    mc_arc_dirs = [run_iteration(iter_and_params) for iter_and_params in iterations]
+else:
+    # iterations performed concurrently by a pool of worker processes,
+    # forked after the prior and proxy data have been loaded once so
+    # they are shared by all iterations that use them
+    LMR_prior.share_prior_data()
+    load_data.share_data_frames()
+
+    first_cfg, _, _ = iteration_config(iterations[0])
+    X = LMR.setup_prior(first_cfg)
+    X.load_prior()
+    for proxy_database in first_cfg.proxies.use_from:
+        proxy_cfg = getattr(first_cfg.proxies, proxy_database)
+        load_data.load_data_frame(proxy_cfg.metafile_proxy)
+        load_data.load_data_frame(proxy_cfg.datafile_proxy)
+
+    nworkers = min(max_workers, len(iterations))
+    memory_budget = LMR_config.wrapper.memory_budget
+    if memory_budget is not None:
+        iter_memory = LMR_config.wrapper.iter_memory
+        if iter_memory is None:
+            iter_memory = _iteration_memory_estimate(first_cfg, X.prior_dict)
+        print('Estimated memory per iteration: {:.2f} GB'.format(iter_memory))
+        nworkers = max(1, min(nworkers, int(memory_budget // max(iter_memory, 1e-6))))
+
+    print('Performing {} iterations with {} worker processes'.format(
+        len(iterations), nworkers))
+
+    failed = []
+    mc_arc_dirs = []
+    pool = multiprocessing.get_context('fork').Pool(processes=nworkers,
+                                                    maxtasksperchild=1)
+    try:
+        for iter_and_params, mc_arc_dir, error in pool.imap_unordered(_run_iteration_job,
+                                                                      iterations):
+            if error is None:
+                print('Completed iteration {} -> {}'.format(iter_and_params, mc_arc_dir))
+                mc_arc_dirs.append(mc_arc_dir)
+            else:
+                print('ERROR in iteration {}: {}'.format(iter_and_params, error))
+                failed.append(iter_and_params)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if failed:
+        print('ERROR: {} iteration(s) failed: {}'.format(len(failed), failed))
+        raise SystemExit(1)
+
+if (LMR_config.core.save_archive == 'ens_percentiles' and
+        LMR_config.core.save_archive_quantile_sketch):
+    _merge_mc_percentiles(mc_arc_dirs)
+
 # ==============================================================================
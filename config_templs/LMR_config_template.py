@@ -174,6 +174,18 @@ class wrapper(ConfigGroup):
     param_search: dict{str: Iterable} or None
         Names of configuration parameters to iterate over when performing a
         reconstruction experiment
+    max_workers: int, None
+        Maximum number of iterations performed concurrently by a pool of
+        worker processes (None or 1: sequential). Prior and proxy data are
+        then loaded once and shared by the iterations using the same data.
+        The worker processes cannot start processes of their own:
+        core.recon_workers and prior.load_workers are then set to 1.
+    memory_budget: float, None
+        Total memory (in GB) available to concurrent iterations. Limits the
+        number of worker processes if not None.
+    iter_memory: float, None
+        Memory (in GB) used by one iteration, for use with memory_budget.
+        If None, a rough estimate is calculated from the prior.
 
     Example
     -------
@@ -191,6 +203,12 @@ class wrapper(ConfigGroup):
     param_search = None
     multi_seed = None
 
+    # Concurrent iterations: nb. of worker processes, total memory budget
+    # and memory per iteration (GB)
+    max_workers = None
+    memory_budget = None
+    iter_memory = None
+
     ##** END User Parameters **##
 
     def __init__(self, **kwargs):
@@ -200,6 +218,9 @@ class wrapper(ConfigGroup):
             self.multi_seed = list(self.multi_seed)
         self.iter_range = self.iter_range
         self.param_search = deepcopy(self.param_search)
+        self.max_workers = self.max_workers
+        self.memory_budget = self.memory_budget
+        self.iter_memory = self.iter_memory
 
 class core(ConfigGroup):
     """
@@ -230,8 +251,58 @@ class core(ConfigGroup):
         Ensemble size
     loc_rad: float
         Localization radius for DA (in km)
+    loc_cache_dir: str, None
+        Directory where covariance localization weights (calculated once per
+        proxy site) are persisted for reuse by other reconstructions on the
+        same grid and with the same loc_rad. None: weights are only cached
+        in memory.
+    regrid_weights_dir: str, None
+        Directory where ESMF regridding weights (of the prior truncation and
+        archived fields, calculated once per grids and method) are persisted
+        for reuse by other reconstructions. None: weights are only cached in
+        memory.
     inflation_fact : float
         Covariance inflation factor
+    da_solver: str
+        Data assimilation solver used in the driver. 'serial' (the original
+        one-proxy-at-a-time update) or 'serial_batch' (same serial EnSRF, with
+        all proxies available at a given time assimilated in one call
+        operating on the ensemble mean/perturbations in place). 'serial_batch'
+        is only used for offline reconstructions. With loc_rad set, it only
+        updates the state elements within the localization radius.
+        'etkf': ensemble transform Kalman filter, all proxies available at a
+        given time assimilated at once (offline reconstructions only). With
+        loc_rad set, the state is updated in local domains (of size
+        etkf_domain_size) using the proxies within the localization radius.
+    etkf_domain_size: float
+        Size (in degrees of lat. and lon.) of the local domains in which the
+        state is updated with the 'etkf' solver when loc_rad is set.
+    lean_update: bool
+        Memory-lean update (offline reconstructions only): the analysis is
+        computed in place in a single preallocated buffer reused for every
+        year, and the blow-up check is performed on the Kalman gain of the
+        updated rows only. Uses the serial EnSRF of the 'serial_batch' solver.
+    lean_update_dtype: str, None
+        Data type of the update buffer when lean_update is True. Set to
+        state_dtype if None; other values than state_dtype are rejected
+        (use state_dtype for a float32 reconstruction).
+    state_dtype: str
+        Data type of the state vector ('float64' or 'float32') from the
+        assembly of the prior to the update, the per-year analyses and the
+        archived statistics. 'float32' halves the memory and I/O of the
+        reconstruction; ensemble means and variances are still accumulated
+        in float64 (see tests/test_da.py for the expected accuracy).
+    recon_workers: int, None
+        Number of worker processes over which the years of an offline
+        reconstruction are distributed (None or 1: sequential). When
+        clean_start is False, years with existing output are skipped.
+        Set to 1 in iterations performed concurrently by the wrapper
+        (wrapper.max_workers > 1).
+    analysis_store: bool
+        Whether the analysis ensembles are written to a single memory-mapped
+        store (analysis_store.npy in datadir_output) instead of one
+        year*.npy file per reconstruction time. Scripts reading the
+        year*.npy files (e.g. check_ensemble.py) need the default (False).
     seed: int, None
         RNG seed.  Passed to all random function calls. (e.g. prior and proxy
         record sampling)  Overridden by wrapper.multi_seed.
@@ -272,9 +343,29 @@ class core(ConfigGroup):
     seed = None
 
     loc_rad = None
+    # directory where localization weights are cached (None: in memory only)
+    loc_cache_dir = None
+    # directory where ESMF regridding weights are cached (None: in memory only)
+    regrid_weights_dir = None
 
     inflation_fact = None
 
+    # DA solver: 'serial', 'serial_batch' or 'etkf'
+    da_solver = 'serial'
+    # size (deg.) of local domains of the localized 'etkf' solver
+    etkf_domain_size = 10.
+    # Memory-lean in-place update (offline only) & dtype of the update buffer
+    lean_update = False
+    lean_update_dtype = None
+    # data type of the state vector: 'float64' or 'float32'
+    state_dtype = 'float64'
+
+    # Nb. of processes for parallel (offline) reconstruction (None: sequential)
+    recon_workers = None
+
+    # Analyses in a single memory-mapped store (False: one file per year)
+    analysis_store = False
+
     # Reference period w.r.t. which anomalies are to be defined.
     anom_reference_period = (1951, 1980)
 
@@ -288,9 +379,16 @@ class core(ConfigGroup):
     # Ensemble archiving options: ens_full, ens_variance, ens_percentiles, ens_subsample
     save_archive = 'ens_variance'
     # if save_archive = 'ens_percentiles', which percentiles to caclulate and save
+    # (any number of them)
     save_archive_percentiles = (5,95)
+    # if save_archive = 'ens_percentiles', size of the quantile sketches also
+    # archived for merging percentiles over MC iterations (None: no sketches)
+    save_archive_quantile_sketch = None
     # if save_archive = 'ens_subsample', number of members to archive
     save_archive_ens_subsample = 10
+    # if save_archive = 'ens_full', format of the full ensemble files: 'npz'
+    # (held in memory) or 'netcdf' (streamed to chunked, compressed files)
+    save_archive_ens_full_format = 'npz'
     
     # Possibly regrid the generated reanalysis fields to archive files.
     # Options: None (no regridding) or 'esmpy'
@@ -315,7 +413,28 @@ class core(ConfigGroup):
         self.recon_period = self.recon_period
         self.nens = self.nens
         self.loc_rad = self.loc_rad
+        self.loc_cache_dir = self.loc_cache_dir
+        self.regrid_weights_dir = self.regrid_weights_dir
         self.inflation_fact = self.inflation_fact
+        self.da_solver = self.da_solver
+        if self.da_solver not in ('serial', 'serial_batch', 'etkf'):
+            raise ValueError('Unrecognized option for da_solver!'
+                             ' Only serial, serial_batch or etkf are allowed.')
+        self.etkf_domain_size = self.etkf_domain_size
+        self.lean_update = self.lean_update
+        self.state_dtype = self.state_dtype
+        if self.state_dtype not in ('float32', 'float64'):
+            raise ValueError('Unrecognized option for state_dtype!'
+                             ' Only float32 or float64 are allowed.')
+        # update buffer and analyses in the data type of the state vector
+        if self.lean_update_dtype is None:
+            self.lean_update_dtype = self.state_dtype
+        elif self.lean_update_dtype != self.state_dtype:
+            raise ValueError('lean_update_dtype ({}) differs from state_dtype'
+                             ' ({})! Set state_dtype only.'.format(
+                                 self.lean_update_dtype, self.state_dtype))
+        self.recon_workers = self.recon_workers
+        self.analysis_store = self.analysis_store
         self.seed = self.seed
         self.datadir_output = self.datadir_output
         self.archive_dir = self.archive_dir
@@ -325,7 +444,9 @@ class core(ConfigGroup):
         
         self.save_archive = self.save_archive
         self.save_archive_percentiles = self.save_archive_percentiles
+        self.save_archive_quantile_sketch = self.save_archive_quantile_sketch
         self.save_archive_ens_subsample = self.save_archive_ens_subsample
+        self.save_archive_ens_full_format = self.save_archive_ens_full_format
 
         
         if self.archive_regrid_method is not None:
@@ -1579,6 +1700,29 @@ class prior(ConfigGroup):
     state_variables_info: dict
         Defines which variables represent temperature or moisture.
         Should be modified only if a new temperature or moisture state variable is added. 
+    prior_cache_dir: str, None
+        Directory of the persistent cache of processed prior data (averaged,
+        anomalies, detrended), reused by experiments with the same prior data
+        and processing options. None: cache not used.
+    prior_cache_max_size: float, None
+        Maximum size (in GB) of the prior cache. The least recently used
+        entries are removed beyond it. None: no limit.
+    read_sampled_years: bool
+        If True, only the data of the years sampled to populate the prior
+        ensemble (and of the months needed in the seasonal averages and
+        the anomaly reference period) are read from the prior files. Only
+        for prior sources read by read_gridded_data_CMIP5_model with
+        annual averaging, and when core.nens is not None. The ensemble is
+        the same as when all data are read.
+    load_workers: int, None
+        Nb of processes reading the state variables of the prior
+        concurrently. None or 1: variables read sequentially. Set to 1 in
+        iterations performed concurrently by the wrapper
+        (wrapper.max_workers > 1).
+    load_memory_budget: float, None
+        Maximum size (in GB) of the data files of the state variables read
+        at once by the load_workers processes (estimate of the memory they
+        need). None: no limit.
     """
 
     ##** BEGIN User Parameters **##
@@ -1656,6 +1800,19 @@ class prior(ConfigGroup):
     state_variables_info = {'temperature': ['tas_sfc_Amon'],
                             'moisture': ['pr_sfc_Amon', 'scpdsi_sfc_Amon']}
 
+    # Persistent cache of processed prior data (None: not used)
+    # and its maximum size (in GB, None: no limit)
+    prior_cache_dir = None
+    prior_cache_max_size = 50.
+
+    # Read only the data of the years sampled to populate the prior ensemble
+    read_sampled_years = False
+
+    # Nb of processes reading the state variables concurrently (None: sequential)
+    # and max. size (in GB) of data files read at once (None: no limit)
+    load_workers = None
+    load_memory_budget = None
+
     
     ##** END User Parameters **##
 
@@ -1675,6 +1832,11 @@ class prior(ConfigGroup):
         self.state_variables_info = deepcopy(self.state_variables_info)
         self.detrend = self.detrend
         self.regrid_method = self.regrid_method
+        self.prior_cache_dir = self.prior_cache_dir
+        self.prior_cache_max_size = self.prior_cache_max_size
+        self.read_sampled_years = self.read_sampled_years
+        self.load_workers = self.load_workers
+        self.load_memory_budget = self.load_memory_budget
 
         # check if "anom" has been selected for any state variable
         # and set the anom_reference attribute accordingly
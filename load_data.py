@@ -14,8 +14,31 @@ def query_dataframe(filters):
 def grab_record_dataframe(columns):
     pass
 
+# Data frames kept in memory to be shared by all loads of the same file in
+# the current process (and processes forked from it). None when not
+# activated (see share_data_frames).
+_shared_data_frames = None
+
+def share_data_frames(enable=True):
+    """
+    Activate (or deactivate and clear) the in-memory store of data frames
+    loaded by load_data_frame. Loaded data frames must then be treated as
+    read-only.
+    """
+    global _shared_data_frames
+    if enable:
+        if _shared_data_frames is None:
+            _shared_data_frames = {}
+    else:
+        _shared_data_frames = None
+
 def load_data_frame(data_src):
-    return pandas.read_pickle(data_src)
+    if _shared_data_frames is None:
+        return pandas.read_pickle(data_src)
+
+    if data_src not in _shared_data_frames:
+        _shared_data_frames[data_src] = pandas.read_pickle(data_src)
+    return _shared_data_frames[data_src]
 
 @lru_cache(maxsize=64)
 def load_cpickle(file):
@@ -37,6 +37,17 @@ Revisions:
           - Reference period w.r.t. which anomalies are computed are now passed as argument
             to functions tasked with uploading instrumental-era calibration datasets. 
             [R. Tardif, U. of Washington, February 2018]
+          - Detrending of the prior (CMIP5, TraCE21ka and cGENIE readers) performed for
+            all grid points at once (detrend_linear), with trends of points with missing
+            data calculated from their valid data. [Oct 2026]
+          - Monthly climatologies, anomalies, annual and seasonal averages of monthly
+            data in the instrumental-era readers and in read_gridded_data_CMIP5_model
+            calculated from integer (year, month) arrays using the functions of the
+            time_aggregation module. [Oct 2026]
+          - read_gridded_data_CMIP5_model can read only the data needed for the yearly
+            averages of a given list of years (read_years), as hyperslabs of contiguous
+            time steps (read_time_steps). Added read_gridded_data_CMIP5_years returning
+            the available years from the time coordinate only. [Oct 2026]
 """
 from netCDF4 import Dataset, date2num, num2date
 from datetime import datetime, timedelta
@@ -48,6 +59,76 @@ import os.path
 import string
 import math
 
+from time_aggregation import (date_year_month, season_months, monthly_climatology,
+                              monthly_anomalies, annual_means, seasonal_means,
+                              season_time_steps)
+
+def detrend_linear(data, chunk_size=1000):
+#==========================================================================================
+#
+# Removes the least-squares linear trend (w.r.t. time index) from the time series at
+# every point of a gridded field, all points at once.
+#
+# The trends are obtained from the normal equations of the regression, with sums
+# accumulated only over the valid (non-NaN, non-masked) data of each point, and
+# invalid data are left as is. Points with fewer than 2 valid data are set to NaN.
+# The time axis is processed by chunks of chunk_size times to limit the size of
+# temporary arrays.
+#
+# Input:
+#      - data         : Array (or masked array) with time as first dimension
+#                       (dims: [time] or [time,...])
+#      - chunk_size   : Number of times processed at once (int)
+#
+# Output:
+#      - Detrended array, with the type (and mask) of the input array
+#
+#==========================================================================================
+
+    ntime = data.shape[0]
+    masked = np.ma.isMaskedArray(data)
+    values = np.ma.filled(data, np.nan) if masked else np.asarray(data)
+    values = values.reshape(ntime, -1)
+    npts = values.shape[1]
+
+    # centered time index (better conditioned sums)
+    t = np.arange(ntime, dtype=np.float64) - 0.5*(ntime-1)
+
+    # sums of the normal equations, over valid data of every point
+    n = np.zeros(npts)
+    St = np.zeros(npts)
+    Stt = np.zeros(npts)
+    Sy = np.zeros(npts)
+    Sty = np.zeros(npts)
+    for beg in range(0, ntime, chunk_size):
+        tc = t[beg:beg+chunk_size]
+        y = values[beg:beg+chunk_size].astype(np.float64)
+        valid = np.isfinite(y)
+        y[~valid] = 0.
+        w = valid.astype(np.float64)
+        n += w.sum(axis=0)
+        St += tc.dot(w)
+        Stt += np.square(tc).dot(w)
+        Sy += y.sum(axis=0)
+        Sty += tc.dot(y)
+
+    det = n*Stt - np.square(St)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where(n >= 2, (n*Sty - St*Sy)/det, np.nan)
+        intercept = (Sy - slope*St)/n
+
+    detrended = np.empty(values.shape, dtype=np.result_type(values.dtype, np.float32))
+    for beg in range(0, ntime, chunk_size):
+        tc = t[beg:beg+chunk_size]
+        detrended[beg:beg+chunk_size] = (values[beg:beg+chunk_size] -
+                                         (np.outer(tc, slope) + intercept))
+    detrended = detrended.reshape(data.shape)
+
+    if masked:
+        detrended = np.ma.masked_array(detrended, mask=np.ma.getmaskarray(data))
+    return detrended
+
+
 def read_gridded_data_GISTEMP(data_dir,data_file,data_vars,outfreq,ref_period):
 #==========================================================================================
 #
@@ -111,46 +192,26 @@ def read_gridded_data_GISTEMP(data_dir,data_file,data_vars,outfreq,ref_period):
     ntime = len(data.dimensions['time'])    
     daysfromdateref = data.variables['time'][:]
     dates = np.array([dateref + timedelta(days=int(i)) for i in daysfromdateref])
+    dates_years, dates_months = date_year_month(dates)
     
     fillval = np.power(2,15)-1
     value = np.copy(data.variables['tempanomaly'])
     value[value == fillval] = np.NAN
 
     if ref_period:
-        climo_month = np.zeros([12, len(lat), len(lon)], dtype=float)
-        # loop over months
-        for i in range(12):
-            m = i+1
-            indsmref = [j for j,v in enumerate(dates) if v.year >= ref_period[0] and v.year <= ref_period[1] and v.month == m]
-            indsm = [j for j,v in enumerate(dates) if v.month == m]
-            climo_month[i] = np.nanmean(value[indsmref], axis=0)
-            value[indsm] = (value[indsm] - climo_month[i])
+        climo_month = monthly_climatology(value, dates_years, dates_months,
+                                          ref_period=ref_period)
+        value = monthly_anomalies(value, dates_months, climo_month)
     else:
         print('Warning: using default reference period defining temperature anomalies for GISTEMP product.')
     
     if outfreq == 'annual':
-        # List years available in dataset and sort
-        years = list(set([d.year for d in dates])) # 'set' is used to get unique values in list
-        years.sort # sort the list
+        # Annual means from monthly data, with check of max nb of nan
+        # values allowed (nan if nb of nan's in the year above threshold)
+        years, value_annual = annual_means(value, dates_years,
+                                           max_nan=nbmaxnan)
         dates_annual = np.array([datetime(y,1,1,0,0) for y in years])
 
-        value_annual = np.empty([len(years), len(lat), len(lon)], dtype=float)
-        value_annual[:] = np.nan # initialize with nan's
-        
-        # Loop over years in dataset
-        for i in range(0,len(years)):        
-            # find indices in time array where "years[i]" appear
-            ind = [j for j, k in enumerate(dates) if k.year == years[i]]
-            # ---------------------------------------
-            # Calculate annual mean from monthly data
-            # Note: data has dims [time,lat,lon]
-            # ---------------------------------------
-            tmp = np.nanmean(value[ind],axis=0)
-            # apply check of max nb of nan values allowed
-            nancount = np.isnan(value[ind]).sum(axis=0)
-            tmp[nancount > nbmaxnan] = np.nan # put nan back if nb of nan's in current year above threshold
-            value_annual[i,:,:] = tmp
-
         dates_ret = dates_annual
         value_ret = value_annual
 
@@ -224,44 +285,24 @@ def read_gridded_data_HadCRUT(data_dir,data_file,data_vars,outfreq,ref_period):
     ntime = len(data.dimensions['time'])    
     daysfromdateref = data.variables['time'][:]
     dates = np.array([dateref + timedelta(days=int(i)) for i in daysfromdateref])
+    dates_years, dates_months = date_year_month(dates)
 
     value = np.copy(data.variables['temperature_anomaly'])
     value[value == -1e+30] = np.NAN
 
     if ref_period:
-        climo_month = np.zeros([12, len(lat), len(lon)], dtype=float)
-        # loop over months
-        for i in range(12):
-            m = i+1
-            indsmref = [j for j,v in enumerate(dates) if v.year >= ref_period[0] and v.year <= ref_period[1] and v.month == m]
-            indsm = [j for j,v in enumerate(dates) if v.month == m]
-            climo_month[i] = np.nanmean(value[indsmref], axis=0)
-            value[indsm] = (value[indsm] - climo_month[i])
+        climo_month = monthly_climatology(value, dates_years, dates_months,
+                                          ref_period=ref_period)
+        value = monthly_anomalies(value, dates_months, climo_month)
     else:
         print('Warning: using default reference period defining temperature anomalies for HadCRUT product.')
 
     if outfreq == 'annual':
-        # List years available in dataset and sort
-        years = list(set([d.year for d in dates])) # 'set' is used to get unique values in list
-        years.sort # sort the list
+        # Annual means from monthly data, with check of max nb of nan
+        # values allowed (nan if nb of nan's in the year above threshold)
+        years, value_annual = annual_means(value, dates_years,
+                                           max_nan=nbmaxnan)
         dates_annual = np.array([datetime(y,1,1,0,0) for y in years])
-
-        value_annual = np.empty([len(years), len(lat), len(lon)], dtype=float)
-        value_annual[:] = np.nan # initialize with nan's
-
-        # Loop over years in dataset
-        for i in range(0,len(years)):        
-            # find indices in time array where "years[i]" appear
-            ind = [j for j, k in enumerate(dates) if k.year == years[i]]
-            # ---------------------------------------
-            # Calculate annual mean from monthly data
-            # Note: data has dims [time,lat,lon]
-            # ---------------------------------------
-            tmp = np.nanmean(value[ind],axis=0)
-            # apply check of max nb of nan values allowed
-            nancount = np.isnan(value[ind]).sum(axis=0)
-            tmp[nancount > nbmaxnan] = np.nan # put nan back if nb of nan's in current year above threshold
-            value_annual[i,:,:] = tmp
             
         dates_ret = dates_annual
         value_ret = value_annual
@@ -344,46 +385,26 @@ def read_gridded_data_BerkeleyEarth(data_dir,data_file,data_vars,outfreq,ref_per
         time_yrs.append(base + timedelta(seconds=(base.replace(year=base.year + 1) - base).total_seconds() * rem))
 
     dates = np.array(time_yrs)
+    dates_years, dates_months = date_year_month(dates)
 
     fillval = data.variables['temperature'].missing_value
     value = np.copy(data.variables['temperature'])    
     value[value == fillval] = np.NAN
 
     if ref_period:
-        climo_month = np.zeros([12, len(lat), len(lon)], dtype=float)
-        # loop over months
-        for i in range(12):
-            m = i+1
-            indsmref = [j for j,v in enumerate(dates) if v.year >= ref_period[0] and v.year <= ref_period[1] and v.month == m]
-            indsm = [j for j,v in enumerate(dates) if v.month == m]
-            climo_month[i] = np.nanmean(value[indsmref], axis=0)
-            value[indsm] = (value[indsm] - climo_month[i])
+        climo_month = monthly_climatology(value, dates_years, dates_months,
+                                          ref_period=ref_period)
+        value = monthly_anomalies(value, dates_months, climo_month)
     else:
         print('Warning: using default reference period defining temperature anomalies for BEST product.')
     
     if outfreq == 'annual':
-        # List years available in dataset and sort
-        years = list(set([d.year for d in dates])) # 'set' is used to get unique values in list
-        years.sort # sort the list
+        # Annual means from monthly data, with check of max nb of nan
+        # values allowed (nan if nb of nan's in the year above threshold)
+        years, value_annual = annual_means(value, dates_years,
+                                           max_nan=nbmaxnan)
         dates_annual = np.array([datetime(y,1,1,0,0) for y in years])
 
-        value_annual = np.empty([len(years), len(lat), len(lon)], dtype=float)
-        value_annual[:] = np.nan # initialize with nan's
-
-        # Loop over years in dataset
-        for i in range(0,len(years)):        
-            # find indices in time array where "years[i]" appear
-            ind = [j for j, k in enumerate(dates) if k.year == years[i]]
-            # ---------------------------------------
-            # Calculate annual mean from monthly data
-            # Note: data has dims [time,lat,lon]
-            # ---------------------------------------
-            tmp = np.nanmean(value[ind],axis=0)
-            # apply check of max nb of nan values allowed
-            nancount = np.isnan(value[ind]).sum(axis=0)
-            tmp[nancount > nbmaxnan] = np.nan # put nan back if nb of nan's in current year above threshold
-            value_annual[i,:,:] = tmp
-
         dates_ret = dates_annual
         value_ret = value_annual            
 
@@ -465,46 +486,26 @@ def read_gridded_data_MLOST(data_dir,data_file,data_vars,outfreq,ref_period):
     ntime = len(data.dimensions['time']) 
     daysfromdateref = data.variables['time'][:]
     dates = np.array([dateref + timedelta(days=int(i)) for i in daysfromdateref])
+    dates_years, dates_months = date_year_month(dates)
 
     fillval = data.variables['air'].missing_value
     value = np.copy(data.variables['air'])
     value[value == fillval] = np.NAN
 
     if ref_period:
-        climo_month = np.zeros([12, len(lat), len(lon)], dtype=float)
-        # loop over months
-        for i in range(12):
-            m = i+1
-            indsmref = [j for j,v in enumerate(dates) if v.year >= ref_period[0] and v.year <= ref_period[1] and v.month == m]
-            indsm = [j for j,v in enumerate(dates) if v.month == m]
-            climo_month[i] = np.nanmean(value[indsmref], axis=0)
-            value[indsm] = (value[indsm] - climo_month[i])
+        climo_month = monthly_climatology(value, dates_years, dates_months,
+                                          ref_period=ref_period)
+        value = monthly_anomalies(value, dates_months, climo_month)
     else:
         print('Warning: using default reference period defining temperature anomalies for MLOST product.')
     
     if outfreq == 'annual':
-        # List years available in dataset and sort
-        years = list(set([d.year for d in dates])) # 'set' is used to get unique values in list
-        years.sort # sort the list
+        # Annual means from monthly data, with check of max nb of nan
+        # values allowed (nan if nb of nan's in the year above threshold)
+        years, value_annual = annual_means(value, dates_years,
+                                           max_nan=nbmaxnan)
         dates_annual = np.array([datetime(y,1,1,0,0) for y in years])
 
-        value_annual = np.empty([len(years), len(lat), len(lon)], dtype=float)
-        value_annual[:] = np.nan # initialize with nan's
-        
-        # Loop over years in dataset
-        for i in range(0,len(years)):    
-            # find indices in time array where "years[i]" appear
-            ind = [j for j, k in enumerate(dates) if k.year == years[i]]
-            # ---------------------------------------
-            # Calculate annual mean from monthly data
-            # Note: data has dims [time,lat,lon]
-            # --------------------------------------- 
-            tmp = np.nanmean(value[ind],axis=0)
-            # apply check of max nb of nan values allowed
-            nancount = np.isnan(value[ind]).sum(axis=0)
-            tmp[nancount > nbmaxnan] = np.nan # put nan back if nb of nan's in current year above threshold
-            value_annual[i,:,:] = tmp
-
         dates_ret = dates_annual
         value_ret = value_annual
 
@@ -581,6 +582,7 @@ def read_gridded_data_GPCC(data_dir,data_file,data_vars,out_anomalies,ref_period
     ntime = len(data.dimensions['time']) 
     daysfromdateref = data.variables['time'][:]
     dates = np.array([dateref + timedelta(days=int(i)) for i in daysfromdateref])
+    dates_years, dates_months = date_year_month(dates)
 
     fillval = data.variables['precip'].missing_value
     value = np.copy(data.variables['precip'])
@@ -590,41 +592,20 @@ def read_gridded_data_GPCC(data_dir,data_file,data_vars,out_anomalies,ref_period
     # class calibration_precip_GPCC() in LMR_calibrate.py
     if out_anomalies:
         if ref_period and type(ref_period) in [list,tuple] and len(ref_period) == 2:
-            climo_month = np.zeros([12, len(lat), len(lon)], dtype=float)
-            # loop over months
-            for i in range(12):
-                m = i+1
-                indsmref = [j for j,v in enumerate(dates) if v.year >= ref_period[0] and v.year <= ref_period[1] and v.month == m]
-                indsm = [j for j,v in enumerate(dates) if v.month == m]
-                climo_month[i] = np.nanmean(value[indsmref], axis=0)
-                value[indsm] = (value[indsm] - climo_month[i])
+            climo_month = monthly_climatology(value, dates_years, dates_months,
+                                              ref_period=ref_period)
+            value = monthly_anomalies(value, dates_months, climo_month)
         else:
             raise SystemExit('In read_gridded_data_GPCC: out_anomalies is set to True,'
                              ' but a reference period is not properly defined. Exiting.')
 
     if outfreq == 'annual':
-        # List years available in dataset and sort
-        years = list(set([d.year for d in dates])) # 'set' is used to get unique values in list
-        years.sort # sort the list
+        # Annual means from monthly data, with check of max nb of nan
+        # values allowed (nan if nb of nan's in the year above threshold)
+        years, value_annual = annual_means(value, dates_years,
+                                           max_nan=nbmaxnan)
         dates_annual = np.array([datetime(y,1,1,0,0) for y in years])
 
-        value_annual = np.empty([len(years), len(lat), len(lon)], dtype=float)
-        value_annual[:] = np.nan # initialize with nan's
-        
-        # Loop over years in dataset
-        for i in range(0,len(years)):        
-            # find indices in time array where "years[i]" appear
-            ind = [j for j, k in enumerate(dates) if k.year == years[i]]
-            # ---------------------------------------
-            # Calculate annual mean from monthly data
-            # Note: data has dims [time,lat,lon]
-            # ---------------------------------------
-            tmp = np.nanmean(value[ind],axis=0)
-            # apply check of max nb of nan values allowed
-            nancount = np.isnan(value[ind]).sum(axis=0)
-            tmp[nancount > nbmaxnan] = np.nan # put nan back if nb of nan's in current year above threshold
-            value_annual[i,:,:] = tmp
-
         dates_ret = dates_annual
         value_ret = value_annual
 
@@ -702,6 +683,7 @@ def read_gridded_data_DaiPDSI(data_dir,data_file,data_vars,out_anomalies,ref_per
     ntime = len(data.dimensions['time'])    
     hoursfromdateref = data.variables['time'][:]
     dates = np.array([dateref + timedelta(hours=int(i)) for i in hoursfromdateref])
+    dates_years, dates_months = date_year_month(dates)
 
     fillval = data.variables['pdsi'].missing_value
     value = np.copy(data.variables['pdsi'])
@@ -711,40 +693,19 @@ def read_gridded_data_DaiPDSI(data_dir,data_file,data_vars,out_anomalies,ref_per
     # in LMR_calibrate.py
     if out_anomalies:
         if ref_period and type(ref_period) in [list,tuple] and len(ref_period) == 2:
-            climo_month = np.zeros([12, len(lat), len(lon)], dtype=float)
-            # loop over months
-            for i in range(12):
-                m = i+1
-                indsmref = [j for j,v in enumerate(dates) if v.year >= ref_period[0] and v.year <= ref_period[1] and v.month == m]
-                indsm = [j for j,v in enumerate(dates) if v.month == m]
-                climo_month[i] = np.nanmean(value[indsmref], axis=0)
-                value[indsm] = (value[indsm] - climo_month[i])
+            climo_month = monthly_climatology(value, dates_years, dates_months,
+                                              ref_period=ref_period)
+            value = monthly_anomalies(value, dates_months, climo_month)
         else:
             raise SystemExit('In read_gridded_data_DaiPDSI: out_anomalies is set to True,'
                              ' but a reference period is not properly defined. Exiting.')
 
     if outfreq == 'annual':
-        # List years available in dataset and sort
-        years = list(set([d.year for d in dates])) # 'set' is used to get unique values in list
-        years.sort # sort the list
+        # Annual means from monthly data, with check of max nb of nan
+        # values allowed (nan if nb of nan's in the year above threshold)
+        years, value_annual = annual_means(value, dates_years,
+                                           max_nan=nbmaxnan)
         dates_annual = np.array([datetime(y,1,1,0,0) for y in years])
-
-        value_annual = np.empty([len(years), len(lat), len(lon)], dtype=float)
-        value_annual[:] = np.nan # initialize with nan's
-        
-        # Loop over years in dataset
-        for i in range(0,len(years)):        
-            # find indices in time array where "years[i]" appear
-            ind = [j for j, k in enumerate(dates) if k.year == years[i]]
-            # ---------------------------------------
-            # Calculate annual mean from monthly data
-            # Note: data has dims [time,lat,lon]
-            # ---------------------------------------
-            tmp = np.nanmean(value[ind],axis=0)
-            # apply check of max nb of nan values allowed
-            nancount = np.isnan(value[ind]).sum(axis=0)
-            tmp[nancount > nbmaxnan] = np.nan # put nan back if nb of nan's in current year above threshold
-            value_annual[i,:,:] = tmp
         
         dates_ret = dates_annual
         value_ret = value_annual
@@ -827,6 +788,7 @@ def read_gridded_data_SPEI(data_dir,data_file,data_vars,out_anomalies,ref_period
     ntime = len(data.dimensions['time'])    
     daysfromdateref = data.variables['time'][:]
     dates = np.array([dateref + timedelta(days=int(i)) for i in daysfromdateref])
+    dates_years, dates_months = date_year_month(dates)
 
     fillval = data.variables['spei']._FillValue
     value = np.copy(data.variables['spei'])
@@ -836,40 +798,19 @@ def read_gridded_data_SPEI(data_dir,data_file,data_vars,out_anomalies,ref_period
     # in LMR_calibrate.py
     if out_anomalies:
         if ref_period and type(ref_period) in [list,tuple] and len(ref_period) == 2:
-            climo_month = np.zeros([12, len(lat), len(lon)], dtype=float)
-            # loop over months
-            for i in range(12):
-                m = i+1
-                indsmref = [j for j,v in enumerate(dates) if v.year >= ref_period[0] and v.year <= ref_period[1] and v.month == m]
-                indsm = [j for j,v in enumerate(dates) if v.month == m]
-                climo_month[i] = np.nanmean(value[indsmref], axis=0)
-                value[indsm] = (value[indsm] - climo_month[i])
+            climo_month = monthly_climatology(value, dates_years, dates_months,
+                                              ref_period=ref_period)
+            value = monthly_anomalies(value, dates_months, climo_month)
         else:
             raise SystemExit('In read_gridded_data_SPEI: out_anomalies is set to True,'
                              ' but a reference period is not properly defined. Exiting.')
     
     if outfreq == 'annual':
-        # List years available in dataset and sort
-        years = list(set([d.year for d in dates])) # 'set' is used to get unique values in list
-        years.sort # sort the list
+        # Annual means from monthly data, with check of max nb of nan
+        # values allowed (nan if nb of nan's in the year above threshold)
+        years, value_annual = annual_means(value, dates_years,
+                                           max_nan=nbmaxnan)
         dates_annual = np.array([datetime(y,1,1,0,0) for y in years])
-
-        value_annual = np.empty([len(years), len(lat), len(lon)], dtype=float)
-        value_annual[:] = np.nan # initialize with nan's
-        
-        # Loop over years in dataset
-        for i in range(0,len(years)):        
-            # find indices in time array where "years[i]" appear
-            ind = [j for j, k in enumerate(dates) if k.year == years[i]]
-            # ---------------------------------------
-            # Calculate annual mean from monthly data
-            # Note: data has dims [time,lat,lon]
-            # ---------------------------------------
-            tmp = np.nanmean(value[ind],axis=0)
-            # apply check of max nb of nan values allowed
-            nancount = np.isnan(value[ind]).sum(axis=0)
-            tmp[nancount > nbmaxnan] = np.nan # put nan back if nb of nan's in current year above threshold
-            value_annual[i,:,:] = tmp
         
         dates_ret = dates_annual
         value_ret = value_annual
@@ -883,8 +824,146 @@ def read_gridded_data_SPEI(data_dir,data_file,data_vars,out_anomalies,ref_period
 anom_ref=None
 #==========================================================================================
 
+def _CMIP5_time_dates(time):
+#==========================================================================================
+#
+# Converts the time coordinate of CMIP5-formatted data files to calendar dates.
+#
+# Input:
+#      - time          : time netCDF4.Variable
+#
+# Output:
+#      - time_yrs      : Array of dates as returned by netCDF4.num2date
+#      - time_yrs_list : List of the dates (with actual years if the time units refer
+#                        to a date before year 1 C.E.)
+#
+#==========================================================================================
+
+    # Transform into calendar dates using netCDF4 variable attributes (units & calendar)
+    # TODO: may not want to depend on netcdf4.num2date...
+    try:
+        if hasattr(time, 'calendar'):
+            # if time is defined as "months since":not handled by datetime functions
+            if 'months since' in time.units:
+                new_time = np.zeros(time.shape)
+                nmonths, = time.shape
+                basedate = time.units.split('since')[1].lstrip()
+                new_time_units = "days since "+basedate        
+                start_date = pl.datestr2num(basedate)        
+                act_date = start_date*1.0
+                new_time[0] = act_date
+                for i in range(int(nmonths)): #increment months
+                    d = pl.num2date(act_date)
+                    ndays = monthrange(d.year,d.month)[1] #number of days in current month
+                    act_date += ndays
+                    new_time[i] = act_date
+
+                time_yrs = num2date(new_time[:],units=new_time_units,calendar=time.calendar)
+            else:                    
+                time_yrs = num2date(time[:],units=time.units,
+                                calendar=time.calendar)
+        else:
+            time_yrs = num2date(time[:],units=time.units)
+        time_yrs_list = time_yrs.tolist()
+    except ValueError:
+        # num2date needs calendar year start >= 0001 C.E. (bug submitted
+        # to unidata about this
+        fmt = '%Y-%d-%m %H:%M:%S'
+        tunits = time.units
+        since_yr_idx = tunits.index('since ') + 6
+        year = int(tunits[since_yr_idx:since_yr_idx+4])
+        year_diff = year - 1
+        new_start_date = datetime(1, 1, 1, 0, 0, 0)
+
+        new_units = tunits[:since_yr_idx] + '0001-01-01 00:00:00'
+        if hasattr(time, 'calendar'):
+            time_yrs = num2date(time[:], new_units, calendar=time.calendar)
+        else:
+            time_yrs = num2date(time[:], new_units)
+
+        time_yrs_list = [datetime(d.year + year_diff, d.month, d.day,
+                                  d.hour, d.minute, d.second)
+                         for d in time_yrs]
+
+    return time_yrs, time_yrs_list
+
+
+def read_gridded_data_CMIP5_years(data_dir,data_file,data_vars):
+#==========================================================================================
+#
+# Returns the years over which monthly data from a CMIP5 model are available, i.e. the
+# years of the yearly averages returned by read_gridded_data_CMIP5_model, reading only
+# the time coordinate in the data files.
+#
+# Input:
+#      - data_dir     : Full name of directory containing gridded data. (string)
+#      - data_file    : Name of file containing gridded data. (string)
+#      - data_vars    : Variables names (dict or list)
+#
+# Output:
+#      - years        : Sorted list of years (int), same for all variables.
+#
+#==========================================================================================
+
+    years = None
+    for vardef in data_vars:
+        infile = data_dir + '/' + data_file.replace('[vardef_template]', vardef)
+        if not os.path.isfile(infile):
+            print('Error in specification of gridded dataset')
+            print('File ', infile, ' does not exist! - Exiting ...')
+            raise SystemExit()
+
+        data = Dataset(infile,'r')
+        try:
+            _, time_yrs_list = _CMIP5_time_dates(data.variables['time'])
+        finally:
+            data.close()
+
+        var_years = np.unique(date_year_month(time_yrs_list)[0]).tolist()
+        if years is None:
+            years = var_years
+        elif var_years != years:
+            raise SystemExit('ERROR in read_gridded_data_CMIP5_years: years not consistent'
+                             ' across all state variables. Exiting!')
+
+    return years
+
+
+def read_time_steps(ncvar, tinds, chunk_size=120):
+#==========================================================================================
+#
+# Reads the data of a netCDF variable (with time as first dimension) at a subset of
+# time steps, as hyperslabs of contiguous time steps of at most chunk_size steps.
+#
+# Input:
+#      - ncvar        : netCDF4.Variable
+#      - tinds        : Sorted array of the indices of the time steps to read
+#      - chunk_size   : Max. nb of time steps read at once
+#
+# Output:
+#      - data         : Array (masked array if the variable has masked values) of dims
+#                       [len(tinds), ...]
+#
+#==========================================================================================
+
+    tinds = np.asarray(tinds, dtype=int)
+    # runs of contiguous time steps
+    runs = np.split(tinds, np.nonzero(np.diff(tinds) != 1)[0] + 1)
+
+    slabs = []
+    for run in runs:
+        for start in range(0, len(run), chunk_size):
+            chunk = run[start:start+chunk_size]
+            slabs.append(ncvar[chunk[0]:chunk[-1]+1])
+
+    if any(np.ma.isMaskedArray(slab) for slab in slabs):
+        return np.ma.concatenate(slabs, axis=0)
+    return np.concatenate(slabs, axis=0)
+
+
 def read_gridded_data_CMIP5_model(data_dir,data_file,data_vars,outtimeavg,
-                                  detrend=None,anom_ref=None,var_info=None):
+                                  detrend=None,anom_ref=None,var_info=None,
+                                  read_years=None):
 #==========================================================================================
 #
 # Reads the monthly data from a CMIP5 model and return yearly averaged values
@@ -924,6 +1003,13 @@ def read_gridded_data_CMIP5_model(data_dir,data_file,data_vars,outtimeavg,
 #                       represent temperature or moisture (used to extract proper 
 #                       seasonally-avg. data to be used in calculation of proxy estimates) 
 #
+#      - read_years   : List of the years (CE) for which yearly averages are to be returned.
+#                       Only the data needed for these years (months of the averaging
+#                       sequence and of the anomaly reference period) are read from the
+#                       files, unless detrending is applied (requires the entire data).
+#                       All years of the data if None. Not available with "multiyear"
+#                       averages.
+#
 # Output: 
 #      - datadict     : Master dictionary containing dictionaries, one for each state 
 #                       variable, themselves containing the following numpy arrays:
@@ -991,51 +1077,7 @@ def read_gridded_data_CMIP5_model(data_dir,data_file,data_vars,outtimeavg,
             # read in the time netCDF4.Variable
             time = data.variables['time']
 
-        # Transform into calendar dates using netCDF4 variable attributes (units & calendar)
-        # TODO: may not want to depend on netcdf4.num2date...
-        try:
-            if hasattr(time, 'calendar'):
-                # if time is defined as "months since":not handled by datetime functions
-                if 'months since' in time.units:
-                    new_time = np.zeros(time.shape)
-                    nmonths, = time.shape
-                    basedate = time.units.split('since')[1].lstrip()
-                    new_time_units = "days since "+basedate        
-                    start_date = pl.datestr2num(basedate)        
-                    act_date = start_date*1.0
-                    new_time[0] = act_date
-                    for i in range(int(nmonths)): #increment months
-                        d = pl.num2date(act_date)
-                        ndays = monthrange(d.year,d.month)[1] #number of days in current month
-                        act_date += ndays
-                        new_time[i] = act_date
-
-                    time_yrs = num2date(new_time[:],units=new_time_units,calendar=time.calendar)
-                else:                    
-                    time_yrs = num2date(time[:],units=time.units,
-                                    calendar=time.calendar)
-            else:
-                time_yrs = num2date(time[:],units=time.units)
-            time_yrs_list = time_yrs.tolist()
-        except ValueError:
-            # num2date needs calendar year start >= 0001 C.E. (bug submitted
-            # to unidata about this
-            fmt = '%Y-%d-%m %H:%M:%S'
-            tunits = time.units
-            since_yr_idx = tunits.index('since ') + 6
-            year = int(tunits[since_yr_idx:since_yr_idx+4])
-            year_diff = year - 1
-            new_start_date = datetime(1, 1, 1, 0, 0, 0)
-
-            new_units = tunits[:since_yr_idx] + '0001-01-01 00:00:00'
-            if hasattr(time, 'calendar'):
-                time_yrs = num2date(time[:], new_units, calendar=time.calendar)
-            else:
-                time_yrs = num2date(time[:], new_units)
-
-            time_yrs_list = [datetime(d.year + year_diff, d.month, d.day,
-                                      d.hour, d.minute, d.second)
-                             for d in time_yrs]
+        time_yrs, time_yrs_list = _CMIP5_time_dates(time)
 
 
         # Query info on spatial coordinates ...
@@ -1088,13 +1130,80 @@ def read_gridded_data_CMIP5_model(data_dir,data_file,data_vars,outtimeavg,
             raise SystemExit()
         
         
+        # for compatibility with new definition possibly using a dict.
+        if type(outtimeavg) is dict:
+            outtimeavg_dict = outtimeavg
+            # check key - there should be only one...
+            outtimeavg_key = list(outtimeavg_dict.keys())[0]
+            # here, it should be 'annual'. No other definition allowed.
+            if outtimeavg_key == 'annual':
+                outtimeavg_val = outtimeavg_dict['annual']
+            else:
+                # Set to calendar year first, to perform averaging over
+                # annual cycle before averaging over multiple years
+                outtimeavg_val = list(range(1,13))
+        else:
+            # not a dict, must be a list or tuple of lists providing
+            # sequence(s) of months over which to average
+            outtimeavg_key = 'annual'
+            outtimeavg_val = outtimeavg
+            
+        # outtimeavg_val is a tuple, or a list?
+        if type(outtimeavg_val) is tuple:
+            # Is var_info defined? 
+            if var_info:
+                # assign appropriate seasonality whether variable represents temperature *or* moisture
+                if vardef in var_info['temperature']:
+                    outtimeavg_var =  outtimeavg_val[0]
+                elif vardef in var_info['moisture']:
+                    outtimeavg_var =  outtimeavg_val[1]
+                else:
+                    # variable not representing temperature or moisture
+                    print('ERROR: outtimeavg is a tuple but variable is not' \
+                       ' temperature nor moisture...')
+                    raise SystemExit()
+            else:
+                print('ERROR: var_info undefined. outtimeavg is a tuple and info' \
+                       ' contained in this dict. is required to assign proper' \
+                       ' seasonality to temperature and moisture variables')
+                raise SystemExit()
+        elif type(outtimeavg_val) is list:
+            outtimeavg_var =  outtimeavg_val
+        else:
+            print('ERROR: outtimeavg has to be a list or a tuple of lists, but is:', outtimeavg)
+            raise SystemExit()
+
+        if read_years is not None and outtimeavg_key != 'annual':
+            print('ERROR: read_years only available with annual averages of monthly data. Exiting!')
+            raise SystemExit()
+
+        
         # -----------------
         # Upload data array
         # -----------------
-        data_var = data.variables[var_to_extract][:]
+        dates_years, dates_months = date_year_month(time_yrs_list)
+        if read_years is None or detrend:
+            data_var = data.variables[var_to_extract][:]
+        else:
+            # only time steps needed in the averages of the requested years, and
+            # in the monthly climatology if anomalies are calculated
+            tsteps = season_time_steps(dates_years, dates_months, outtimeavg_var, read_years)
+            if not data_vars[vardef] or data_vars[vardef] == 'anom':
+                if anom_ref and np.any((dates_years >= anom_ref[0]) & (dates_years <= anom_ref[1])):
+                    tsteps |= (dates_years >= anom_ref[0]) & (dates_years <= anom_ref[1])
+                else:
+                    tsteps[:] = True
+            tinds = np.nonzero(tsteps)[0]
+            print('Reading', len(tinds), 'of', len(tsteps), 'time steps')
+            data_var = read_time_steps(data.variables[var_to_extract], tinds)
+            dates_years = dates_years[tinds]
+            dates_months = dates_months[tinds]
 
         data_var_shape = data_var.shape
-        if vartype == '2D:horizontal' and len(data_var_shape) > 3: data_var = np.squeeze(data_var)
+        if vartype == '2D:horizontal' and len(data_var_shape) > 3:
+            # squeeze singleton dims other than time
+            data_var = np.squeeze(data_var, axis=tuple(i for i in range(1, len(data_var_shape))
+                                                       if data_var_shape[i] == 1))
         print(data_var.shape)
 
         ntime = len(data.dimensions['time'])
@@ -1325,25 +1434,15 @@ def read_gridded_data_CMIP5_model(data_dir,data_file,data_vars,outtimeavg,
             
             # prior data overlap with anomaly reference period?
             # if not, take anomalies w.r.t. to mean over entire length of the data
-            overlap = False
+            ref_period = None
             if anom_ref:
-                indsmref = [j for j,v in enumerate(dates) if ((v.year >= anom_ref[0])
-                                                              and (v.year <= anom_ref[1]))]
-                if len(indsmref) > 0: # overlap exists
-                    overlap = True
-            # loop over months
-            for i in range(12):
-                m = i+1
-                indsm = [j for j,v in enumerate(dates) if v.month == m]
-                if overlap:
-                    indsmref = [j for j,v in enumerate(dates) if ((v.year >= anom_ref[0])
-                                                                  and (v.year <= anom_ref[1])
-                                                                  and (v.month == m))]
-                else:
-                    indsmref = indsm
+                if np.any((dates_years >= anom_ref[0]) & (dates_years <= anom_ref[1])):
+                    ref_period = anom_ref # overlap exists
 
-                climo_month[i] = np.nanmean(data_var[indsmref], axis=0)
-                data_var[indsm] = (data_var[indsm] - climo_month[i])
+            climo_month[:] = np.reshape(monthly_climatology(data_var, dates_years, dates_months,
+                                                            ref_period=ref_period),
+                                        climo_month.shape)
+            data_var = monthly_anomalies(data_var, dates_months, climo_month)
                 
         elif kind == 'full':
             print('Full field provided as the prior')
@@ -1357,39 +1456,9 @@ def read_gridded_data_CMIP5_model(data_dir,data_file,data_vars,outtimeavg,
         # Possibly detrend the prior
         if detrend:
             print('Detrending the prior for variable: '+var_to_extract)
+            # all grid points at once
+            data_var = detrend_linear(data_var)
 
-            data_var_copy = np.copy(data_var)
-
-            if vartype == '0D:time series':
-                xdim = data_var.shape[0]
-                xvar = list(range(xdim))
-                slope, intercept, r_value, p_value, std_err = stats.linregress(xvar,data_var_copy)
-                trend = slope*np.squeeze(xvar) + intercept
-                data_var = data_var_copy - trend
-            elif vartype == '1D:meridional':
-                [xdim,dim1] = data_var.shape
-                xvar = list(range(xdim))
-                # loop over grid points
-                for i in range(dim1):
-                    slope, intercept, r_value, p_value, std_err = stats.linregress(xvar,data_var_copy[:,i])
-                    if np.isfinite(slope) and np.isfinite(intercept):
-                        trend = slope*np.squeeze(xvar) + intercept
-                        data_var[:,i] = data_var_copy[:,i] - trend
-                    else:
-                        data_var[:,i] = np.nan
-            elif '2D' in vartype: 
-                [xdim,dim1,dim2] = data_var.shape
-                xvar = list(range(xdim))
-                # loop over grid points
-                for i in range(dim1):
-                    for j in range(dim2):
-                        slope, intercept, r_value, p_value, std_err = stats.linregress(xvar,data_var_copy[:,i,j])
-                        if np.isfinite(slope) and np.isfinite(intercept):
-                            trend = slope*np.squeeze(xvar) + intercept
-                            data_var[:,i,j] = data_var_copy[:,i,j] - trend
-                        else:
-                            data_var[:,i,j] = np.nan
-                        
             print(var_to_extract, ': Global(monthly/detrend): mean=', np.nanmean(data_var), ' , std-dev=', np.nanstd(data_var))
 
 
@@ -1399,63 +1468,18 @@ def read_gridded_data_CMIP5_model(data_dir,data_file,data_vars,outtimeavg,
         #       sequence of months.
         # ----------------------------------------------------------------
 
-        # for compatibility with new definition possibly using a dict.
-        if type(outtimeavg) is dict:
-            outtimeavg_dict = outtimeavg
-            # check key - there should be only one...
-            outtimeavg_key = list(outtimeavg_dict.keys())[0]
-            # here, it should be 'annual'. No other definition allowed.
-            if outtimeavg_key == 'annual':
-                outtimeavg_val = outtimeavg_dict['annual']
-            else:
-                # Set to calendar year first, to perform averaging over
-                # annual cycle before averaging over multiple years
-                outtimeavg_val = list(range(1,13))
-        else:
-            # not a dict, must be a list or tuple of lists providing
-            # sequence(s) of months over which to average
-            outtimeavg_key = 'annual'
-            outtimeavg_val = outtimeavg
-            
-        # outtimeavg_val is a tuple, or a list?
-        if type(outtimeavg_val) is tuple:
-            # Is var_info defined? 
-            if var_info:
-                # assign appropriate seasonality whether variable represents temperature *or* moisture
-                if vardef in var_info['temperature']:
-                    outtimeavg_var =  outtimeavg_val[0]
-                elif vardef in var_info['moisture']:
-                    outtimeavg_var =  outtimeavg_val[1]
-                else:
-                    # variable not representing temperature or moisture
-                    print('ERROR: outtimeavg is a tuple but variable is not' \
-                       ' temperature nor moisture...')
-                    raise SystemExit()
-            else:
-                print('ERROR: var_info undefined. outtimeavg is a tuple and info' \
-                       ' contained in this dict. is required to assign proper' \
-                       ' seasonality to temperature and moisture variables')
-                raise SystemExit()
-        elif type(outtimeavg_val) is list:
-            outtimeavg_var =  outtimeavg_val
-        else:
-            print('ERROR: outtimeavg has to be a list or a tuple of lists, but is:', outtimeavg)
-            raise SystemExit()
-
-
         print('Averaging over month sequence:', outtimeavg_var)
         
-        year_current = [m for m in outtimeavg_var if m>0 and m<=12]
-        year_before  = [abs(m) for m in outtimeavg_var if m < 0]        
-        year_follow  = [m-12 for m in outtimeavg_var if m > 12]
+        year_before, year_current, year_follow = season_months(outtimeavg_var)
         
         avgmonths = year_before + year_current + year_follow
         indsclimo = sorted([item-1 for item in avgmonths])
         
-        # List years available in dataset and sort
-        years_all = [d.year for d in time_yrs_list]
-        years     = list(set(years_all)) # 'set' used to retain unique values in list
-        years.sort() # sort the list
+        # List years available in dataset (or requested) and sort
+        if read_years is None:
+            years = np.unique(dates_years).tolist()
+        else:
+            years = sorted(set(read_years))
         ntime = len(years)
         datesYears = np.array([datetime(y,1,1,0,0) for y in years])
         
@@ -1466,23 +1490,10 @@ def read_gridded_data_CMIP5_model(data_dir,data_file,data_vars,outtimeavg,
         elif '2D' in vartype:
             value = np.zeros([ntime, vardims[1], vardims[2]], dtype=float)
 
-
-        # Loop over years in dataset (less memory intensive...otherwise need to deal with large arrays) 
-        for i in range(ntime):
-            tindsyr   = [k for k,d in enumerate(dates) if d.year == years[i]    and d.month in year_current]
-            tindsyrm1 = [k for k,d in enumerate(dates) if d.year == years[i]-1. and d.month in year_before]
-            tindsyrp1 = [k for k,d in enumerate(dates) if d.year == years[i]+1. and d.month in year_follow]
-            indsyr = tindsyrm1+tindsyr+tindsyrp1
-
-            if vartype == '0D:time series':
-                value[i] = np.nanmean(data_var[indsyr],axis=0)
-            elif vartype == '1D:meridional':
-                value[i,:] = np.nanmean(data_var[indsyr],axis=0)
-            elif '2D' in vartype: 
-                if nbdims > 3:
-                    value[i,:,:] = np.nanmean(np.squeeze(data_var[indsyr]),axis=0)
-                else:
-                    value[i,:,:] = np.nanmean(data_var[indsyr],axis=0)
+        # Average over the sequence of months, for all years in dataset at once
+        _, value_avg = seasonal_means(data_var, dates_years, dates_months,
+                                      outtimeavg_var, out_years=years)
+        value[:] = value_avg.reshape(value.shape)
 
         
         print(var_to_extract, ': Global(time-averaged): mean=', np.nanmean(value), ' , std-dev=', np.nanstd(value))
@@ -2569,38 +2580,9 @@ def read_gridded_data_TraCE21ka(data_dir,data_file,data_vars,outtimeavg,detrend=
         # --------------------------
         if detrend:
             print('Detrending the prior for variable: '+var_to_extract)
-            if vartype == '0D:time series':
-                xdim = data_var.shape[0]
-                xvar = list(range(xdim))
-                data_var_copy = np.copy(data_var)
-                slope, intercept, r_value, p_value, std_err = stats.linregress(xvar,data_var_copy)
-                trend = slope*np.squeeze(xvar) + intercept
-                data_var = data_var_copy - trend
-            elif vartype == '1D:meridional':
-                [xdim,dim1] = data_var.shape
-                xvar = list(range(xdim))
-                # loop over grid points
-                for i in range(dim1):
-                    slope, intercept, r_value, p_value, std_err = stats.linregress(xvar,data_var_copy[:,i])
-                    if np.isfinite(slope) and np.isfinite(intercept):
-                        trend = slope*np.squeeze(xvar) + intercept
-                        data_var[:,i] = data_var_copy[:,i] - trend
-                    else:
-                        data_var[:,i] = np.nan
-            elif '2D' in vartype: 
-                data_var_copy = np.copy(data_var)
-                [xdim,dim1,dim2] = data_var.shape
-                xvar = list(range(xdim))
-                # loop over grid points
-                for i in range(dim1):
-                    for j in range(dim2):
-                        slope, intercept, r_value, p_value, std_err = stats.linregress(xvar,data_var_copy[:,i,j])
-                        if np.isfinite(slope) and np.isfinite(intercept):
-                            trend = slope*np.squeeze(xvar) + intercept
-                            data_var[:,i,j] = data_var_copy[:,i,j] - trend
-                        else:
-                            data_var[:,i,j] = np.nan
-                            
+            # all grid points at once
+            data_var = detrend_linear(data_var)
+
             print(var_to_extract, ': Global(detrended): mean=', np.nanmean(data_var), ' , std-dev=', np.nanstd(data_var))
 
 
@@ -3176,38 +3158,9 @@ def read_gridded_data_cGENIE_model(data_dir,data_file,data_vars,outtimeavg,detre
         # --------------------------
         if detrend:
             print('Detrending the prior for variable: '+var_to_extract)
-            if vartype == '0D:time series':
-                xdim = data_var.shape[0]
-                xvar = list(range(xdim))
-                data_var_copy = np.copy(data_var)
-                slope, intercept, r_value, p_value, std_err = stats.linregress(xvar,data_var_copy)
-                trend = slope*np.squeeze(xvar) + intercept
-                data_var = data_var_copy - trend
-            elif vartype == '1D:meridional':
-                [xdim,dim1] = data_var.shape
-                xvar = list(range(xdim))
-                # loop over grid points
-                for i in range(dim1):
-                    slope, intercept, r_value, p_value, std_err = stats.linregress(xvar,data_var_copy[:,i])
-                    if np.isfinite(slope) and np.isfinite(intercept):
-                        trend = slope*np.squeeze(xvar) + intercept
-                        data_var[:,i] = data_var_copy[:,i] - trend
-                    else:
-                        data_var[:,i] = np.nan
-            elif '2D' in vartype: 
-                data_var_copy = np.copy(data_var)
-                [xdim,dim1,dim2] = data_var.shape
-                xvar = list(range(xdim))
-                # loop over grid points
-                for i in range(dim1):
-                    for j in range(dim2):
-                        slope, intercept, r_value, p_value, std_err = stats.linregress(xvar,data_var_copy[:,i,j])
-                        if np.isfinite(slope) and np.isfinite(intercept):
-                            trend = slope*np.squeeze(xvar) + intercept
-                            data_var[:,i,j] = data_var_copy[:,i,j] - trend
-                        else:
-                            data_var[:,i,j] = np.nan
-                            
+            # all grid points at once
+            data_var = detrend_linear(data_var)
+
             print(var_to_extract, ': Global(detrended): mean=', np.nanmean(data_var), ' , std-dev=', np.nanstd(data_var))
 
 
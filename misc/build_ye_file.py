@@ -297,6 +297,10 @@ for psm_key in unique_psm_keys:
         X.Nens = None  # None => Load entire prior
         X.statevars = statevars
         X.statevars_info = cfg.prior.state_variables_info
+        X.prior_cache_dir = cfg.prior.prior_cache_dir
+        X.prior_cache_max_size = cfg.prior.prior_cache_max_size
+        X.load_workers = cfg.prior.load_workers
+        X.load_memory_budget = cfg.prior.load_memory_budget
 
         
         # Load the prior data, averaged over interval corresponding
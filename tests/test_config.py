@@ -190,6 +190,22 @@ def test_config_update_with_kwarg():
     assert cfg.psm.linear.datatag_calib != 'BerkeleyEarth'
 
 
+def test_core_state_dtype():
+
+    tmp = cfg.Config(core={'state_dtype': 'float32'})
+    assert tmp.core.lean_update_dtype == 'float32'
+
+    tmp = cfg.Config(core={'state_dtype': 'float32',
+                           'lean_update_dtype': 'float32'})
+    assert tmp.core.state_dtype == 'float32'
+
+    with pytest.raises(ValueError):
+        cfg.Config(core={'state_dtype': 'float16'})
+
+    with pytest.raises(ValueError):
+        cfg.Config(core={'lean_update_dtype': 'float32'})
+
+
 # DatasetDescriptor Tests #
 def test_datadescr_initialize():
     tmp = cfg._DatasetDescriptors()
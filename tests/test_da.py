@@ -0,0 +1,322 @@
+import sys
+sys.path.append('../')
+
+import os
+from os.path import join
+
+import pytest
+import numpy as np
+import LMR_DA
+
+
+def _random_aug_state(nx=50, nobs=8, nens=20, seed=0):
+    rng = np.random.RandomState(seed)
+    Xb = rng.randn(nx, nens)
+    # Ye's as noisy linear functions of some state elements
+    Ye = Xb[rng.randint(0, nx, size=nobs)] + 0.1*rng.randn(nobs, nens)
+    Xb_aug = np.append(Xb, Ye, axis=0)
+    obvalues = rng.randn(nobs)
+    ob_errs = 0.5 + rng.rand(nobs)
+    ye_rows = np.arange(nx, nx+nobs)
+    return Xb_aug, obvalues, ye_rows, ob_errs
+
+
+def _serial_reference(Xb, obvalues, ye_rows, ob_errs, locs=None):
+    for k in range(len(obvalues)):
+        loc = None if locs is None else locs[k]
+        Xb = LMR_DA.enkf_update_array(Xb, obvalues[k], Xb[ye_rows[k]],
+                                      ob_errs[k], loc=loc)
+    return Xb
+
+
+def test_enkf_batch_matches_serial():
+    Xb, obvalues, ye_rows, ob_errs = _random_aug_state()
+
+    Xa_ref = _serial_reference(Xb, obvalues, ye_rows, ob_errs)
+    Xa = LMR_DA.enkf_update_array_batch(Xb, obvalues, ye_rows, ob_errs)
+
+    np.testing.assert_allclose(Xa, Xa_ref, rtol=1e-10, atol=1e-12)
+
+
+def test_enkf_batch_matches_serial_localized():
+    Xb, obvalues, ye_rows, ob_errs = _random_aug_state()
+    rng = np.random.RandomState(1)
+    locs = [rng.rand(Xb.shape[0]) for _ in obvalues]
+    locs[2] = None
+
+    Xa_ref = _serial_reference(Xb, obvalues, ye_rows, ob_errs, locs=locs)
+    Xa = LMR_DA.enkf_update_array_batch(Xb, obvalues, ye_rows, ob_errs,
+                                        locs=lambda k: locs[k])
+
+    np.testing.assert_allclose(Xa, Xa_ref, rtol=1e-10, atol=1e-12)
+
+
+def test_enkf_batch_masked_state():
+    Xb, obvalues, ye_rows, ob_errs = _random_aug_state()
+    Xb[[3, 7], :] = np.nan
+    Xb = np.ma.masked_invalid(Xb)
+
+    Xa = LMR_DA.enkf_update_array_batch(Xb, obvalues, ye_rows, ob_errs)
+
+    assert np.ma.isMaskedArray(Xa)
+    assert Xa.mask[[3, 7]].all()
+    assert np.isfinite(Xa.compressed()).all()
+
+
+def test_enkf_batch_callback():
+    Xb, obvalues, ye_rows, ob_errs = _random_aug_state()
+    calls = []
+
+    Xa = LMR_DA.enkf_update_array_batch(
+        Xb, obvalues, ye_rows, ob_errs,
+        callback=lambda k, xam: calls.append((k, xam.copy())))
+
+    assert [k for k, _ in calls] == list(range(len(obvalues)))
+    np.testing.assert_allclose(calls[-1][1], Xa.mean(axis=1), atol=1e-12)
+
+
+def test_enkf_inplace_rowblock_float32():
+    Xb, obvalues, ye_rows, ob_errs = _random_aug_state()
+    Xa_ref = LMR_DA.enkf_update_array_batch(Xb, obvalues, ye_rows, ob_errs)
+
+    Xbuf = Xb.astype(np.float32)
+    xbm = Xbuf.mean(axis=1, dtype=np.float64)
+    Xbuf -= xbm[:, None]
+    LMR_DA.enkf_update_serial_inplace(xbm, Xbuf, obvalues, ye_rows, ob_errs,
+                                      rowblock=7, check_finite=True)
+    Xbuf += xbm[:, None]
+
+    assert Xbuf.dtype == np.float32
+    np.testing.assert_allclose(Xbuf, Xa_ref, rtol=1e-3, atol=1e-4)
+
+
+@pytest.mark.parametrize('solver', ['serial', 'serial_batch', 'etkf'])
+@pytest.mark.parametrize('offset, atol', [(0., 1e-5), (280., 1e-3)])
+def test_enkf_float32_state_accuracy(solver, offset, atol):
+    # Accuracy of a float32 state (core.state_dtype) w.r.t. float64, for
+    # anomalies and for absolute values (e.g. temperature in K) with 100
+    # members and 50 obs.: ensemble means, spreads and members within 1e-5
+    # for anomalies, and within 1e-3 (i.e. ~4e-6 relative) for absolute
+    # values, the round-off of float32 for values of that magnitude.
+    Xb, obvalues, ye_rows, ob_errs = _random_aug_state(nx=2000, nobs=50,
+                                                       nens=100)
+    Xb += offset
+    obvalues += offset
+
+    def update(Xb):
+        if solver == 'serial':
+            return _serial_reference(Xb, obvalues, ye_rows, ob_errs)
+        elif solver == 'serial_batch':
+            return LMR_DA.enkf_update_array_batch(Xb, obvalues, ye_rows,
+                                                  ob_errs)
+        return LMR_DA.enkf_update_etkf(Xb, obvalues, ye_rows, ob_errs)
+
+    Xa_ref = update(Xb)
+    Xa = update(Xb.astype(np.float32))
+
+    assert Xa.dtype == np.float32
+    np.testing.assert_allclose(Xa.mean(axis=1, dtype=np.float64),
+                               Xa_ref.mean(axis=1), rtol=0, atol=atol)
+    np.testing.assert_allclose(Xa.std(axis=1, dtype=np.float64),
+                               Xa_ref.std(axis=1), rtol=0, atol=atol)
+    np.testing.assert_allclose(Xa, Xa_ref, rtol=0, atol=atol)
+
+
+def test_enkf_inplace_blowup_check():
+    Xb, obvalues, ye_rows, ob_errs = _random_aug_state()
+    xbm = Xb.mean(axis=1)
+    Xbp = Xb - xbm[:, None]
+    # zero ob. error & zero Ye variance: infinite gain
+    Xbp[ye_rows[0]] = 0.
+    ob_errs[0] = 0.
+
+    with pytest.raises(ValueError):
+        LMR_DA.enkf_update_serial_inplace(xbm, Xbp, obvalues, ye_rows, ob_errs,
+                                          check_finite=True)
+
+
+class _DummySite(object):
+    def __init__(self, lat, lon):
+        self.lat = lat
+        self.lon = lon
+
+
+class _DummyPrior(object):
+    def __init__(self, nlat, nlon):
+        self.trunc_state_info = {
+            'tas_sfc_Amon': {'pos': (0, nlat*nlon-1),
+                             'spacecoords': ('lat', 'lon')},
+            'AMOCindex_Omon': {'pos': (nlat*nlon, nlat*nlon),
+                               'spacecoords': None}}
+
+
+@pytest.fixture()
+def loc_grid():
+    lat, lon = np.meshgrid(np.linspace(-87.5, 87.5, 36),
+                           np.arange(0., 360., 10.), indexing='ij')
+    coords = np.column_stack((lat.ravel(), lon.ravel()))
+    # one 0D variable and two appended Ye's
+    coords = np.append(coords, [[np.nan, np.nan], [45., 10.], [-20., 150.]],
+                       axis=0)
+    return _DummyPrior(36, 36), coords
+
+
+def test_loc_cache_matches_cov_localization(loc_grid):
+    X, coords = loc_grid
+    cache = LMR_DA.LocalizationCache(2000., X, coords)
+    site = _DummySite(40., 20.)
+
+    ref = LMR_DA.cov_localization(2000., site, X, coords)
+    inds, weights = cache.get(site)
+
+    assert inds.size < coords.shape[0]
+    assert (weights > 0.).all()
+    np.testing.assert_array_equal(cache.dense(site), ref)
+    # non-localizeable 0D variable keeps unit weight
+    assert ref[36*36] == 1.
+    assert cache.get(site) is cache.get(_DummySite(40., 20.))
+
+
+def test_loc_cache_persistence(loc_grid, tmpdir):
+    X, coords = loc_grid
+    sites = [_DummySite(40., 20.), _DummySite(-60., 300.)]
+    cache = LMR_DA.LocalizationCache(5000., X, coords, cache_dir=str(tmpdir))
+    ref = [cache.dense(site) for site in sites]
+    cache.save()
+
+    cache2 = LMR_DA.LocalizationCache(5000., X, coords, cache_dir=str(tmpdir))
+    assert cache2.filename == cache.filename
+    for site, site_ref in zip(sites, ref):
+        np.testing.assert_array_equal(cache2.dense(site), site_ref)
+
+    # different radius: different cache file
+    cache3 = LMR_DA.LocalizationCache(1000., X, coords, cache_dir=str(tmpdir))
+    assert cache3.filename != cache.filename
+
+
+def test_loc_cache_unreadable_file(loc_grid, tmpdir):
+    X, coords = loc_grid
+    site = _DummySite(40., 20.)
+    cache_dir = join(str(tmpdir), 'cache')
+    cache = LMR_DA.LocalizationCache(5000., X, coords, cache_dir=cache_dir)
+    ref = cache.dense(site)
+    cache.save()
+    assert os.listdir(cache_dir) == [os.path.basename(cache.filename)]
+
+    # partially written file: cache miss
+    with open(cache.filename, 'r+b') as f:
+        f.truncate(100)
+    cache2 = LMR_DA.LocalizationCache(5000., X, coords, cache_dir=cache_dir)
+    np.testing.assert_array_equal(cache2.dense(site), ref)
+    cache2.save()
+    cache3 = LMR_DA.LocalizationCache(5000., X, coords, cache_dir=cache_dir)
+    assert cache3._state_sites.keys() == cache2._state_sites.keys()
+
+
+def test_loc_cache_persistence_other_ye(loc_grid, tmpdir):
+    # another Monte-Carlo draw of proxies: different Ye's appended to the
+    # same state grid
+    X, coords = loc_grid
+    site = _DummySite(40., 20.)
+    cache = LMR_DA.LocalizationCache(5000., X, coords, cache_dir=str(tmpdir))
+    cache.get(site)
+    cache.save()
+
+    coords_draw = np.append(coords[:-2], [[30., 30.], [-10., 60.], [70., 200.]],
+                            axis=0)
+    cache2 = LMR_DA.LocalizationCache(5000., X, coords_draw,
+                                      cache_dir=str(tmpdir))
+    assert cache2.filename == cache.filename
+    np.testing.assert_array_equal(
+        cache2.dense(site), LMR_DA.cov_localization(5000., site, X, coords_draw))
+
+
+def test_enkf_batch_sparse_localization(loc_grid):
+    X, coords = loc_grid
+    nx = coords.shape[0]
+    rng = np.random.RandomState(2)
+    Xb = rng.randn(nx, 10)
+    sites = [_DummySite(45., 10.), _DummySite(-20., 150.)]
+    ye_rows = [nx-2, nx-1]
+    obvalues = [0.5, -0.3]
+    ob_errs = [0.4, 0.6]
+    cache = LMR_DA.LocalizationCache(3000., X, coords)
+
+    Xa_ref = LMR_DA.enkf_update_array_batch(
+        Xb, obvalues, ye_rows, ob_errs, locs=[cache.dense(s) for s in sites])
+    Xa = LMR_DA.enkf_update_array_batch(
+        Xb, obvalues, ye_rows, ob_errs, locs=lambda k: cache.get(sites[k]))
+
+    np.testing.assert_allclose(Xa, Xa_ref, rtol=1e-12, atol=1e-12)
+
+
+def test_enkf_sparse_localization_rows_untouched(loc_grid):
+    X, coords = loc_grid
+    nx = coords.shape[0]
+    rng = np.random.RandomState(3)
+    Xb = rng.randn(nx, 10)
+    site = _DummySite(45., 10.)
+    cache = LMR_DA.LocalizationCache(1500., X, coords)
+    rows, _ = cache.get(site)
+
+    xbm = Xb.mean(axis=1)
+    Xbp = Xb - xbm[:, None]
+    xbm_in, Xbp_in = xbm.copy(), Xbp.copy()
+    LMR_DA.enkf_update_serial_inplace(xbm, Xbp, [1.], [nx-2], [0.5],
+                                      locs=[cache.get(site)], rowblock=16,
+                                      check_finite=True)
+
+    outside = np.ones(nx, dtype=bool)
+    outside[rows] = False
+    assert outside.any()
+    np.testing.assert_array_equal(xbm[outside], xbm_in[outside])
+    np.testing.assert_array_equal(Xbp[outside], Xbp_in[outside])
+    assert not np.allclose(xbm[rows], xbm_in[rows])
+
+
+def test_etkf_matches_serial_mean_and_covariance():
+    Xb, obvalues, ye_rows, ob_errs = _random_aug_state(nens=30)
+
+    Xa_ref = LMR_DA.enkf_update_array_batch(Xb, obvalues, ye_rows, ob_errs)
+    Xa = LMR_DA.enkf_update_etkf(Xb, obvalues, ye_rows, ob_errs)
+
+    np.testing.assert_allclose(Xa.mean(axis=1), Xa_ref.mean(axis=1),
+                               rtol=1e-8, atol=1e-10)
+    np.testing.assert_allclose(np.cov(Xa), np.cov(Xa_ref),
+                               rtol=1e-8, atol=1e-10)
+
+
+def test_etkf_localized_domains(loc_grid):
+    X, coords = loc_grid
+    nx = coords.shape[0]
+    rng = np.random.RandomState(4)
+    Xb = rng.randn(nx, 20)
+    Xb[5] = np.nan
+    Xb = np.ma.masked_invalid(Xb)
+    ye_rows = [nx-2, nx-1]
+    obvalues = [0.5, -0.3]
+    ob_errs = [0.4, 0.6]
+    ob_coords = coords[ye_rows]
+    localizeable = LMR_DA.localizeable_mask(X, nx)
+    domains = LMR_DA.etkf_domains(coords, localizeable, 20.)
+
+    rows = np.sort(np.concatenate([d[0] for d in domains]))
+    np.testing.assert_array_equal(rows, np.arange(nx))
+
+    Xa = LMR_DA.enkf_update_etkf(Xb, obvalues, ye_rows, ob_errs, locRad=2000.,
+                                 domains=domains, ob_coords=ob_coords)
+    assert Xa.mask[5].all()
+
+    # domains far from both sites are unchanged
+    dists = np.min([_haversine(c, coords[:36*36]) for c in ob_coords],
+                   axis=0)
+    far = np.flatnonzero(dists > 4000.)
+    np.testing.assert_allclose(Xa[far], Xb[far])
+
+
+def _haversine(site, coords):
+    lat1, lon1 = np.radians(site)
+    lat2, lon2 = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    a = (np.sin((lat2-lat1)/2.)**2 +
+         np.cos(lat1)*np.cos(lat2)*np.sin((lon2-lon1)/2.)**2)
+    return 6367.*2.*np.arcsin(np.sqrt(a))
@@ -0,0 +1,100 @@
+import sys
+sys.path.append('../')
+
+import multiprocessing
+from os.path import join
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import LMR_driver_callable as driver
+import LMR_utils
+from LMR_DA import enkf_update_array_batch
+
+
+@pytest.fixture()
+def recon_case(tmpdir):
+    rng = np.random.RandomState(0)
+    nx, nens, nproxies = 40, 15, 6
+    recon_times = np.arange(1900, 1912)
+
+    Xb = rng.randn(nx, nens)
+    Ye = Xb[rng.randint(0, nx, size=nproxies)] + 0.1*rng.randn(nproxies, nens)
+    Xb_one_aug = np.append(Xb, Ye, axis=0)
+
+    proxies = []
+    for i in range(nproxies):
+        # records with gaps, some starting after the first year
+        years = np.arange(1900 + i, 1912)
+        years = years[rng.rand(len(years)) < 0.7]
+        values = pd.Series(rng.randn(len(years)), index=years)
+        proxies.append(SimpleNamespace(values=values,
+                                       psm_obj=SimpleNamespace(R=0.5 + rng.rand())))
+
+    prior_file = join(str(tmpdir), 'Xb_one_aug.npy')
+    np.save(prior_file, Xb_one_aug)
+
+    return Xb_one_aug, nx, proxies, recon_times, prior_file, str(tmpdir)
+
+
+@pytest.mark.parametrize('analysis_store', [False, True])
+def test_parallel_recon_matches_sequential(recon_case, analysis_store):
+    Xb_one_aug, state_dim, proxies, recon_times, prior_file, workdir = recon_case
+    if analysis_store:
+        LMR_utils.AnalysisStore.create(workdir, recon_times, Xb_one_aug.shape,
+                                       Xb_one_aug.dtype)
+
+    # proxies passed as a generator, as by ProxyManager.sites_assim_proxy_objs
+    ob_means, ob_counts, ob_R, loc_weights = \
+        driver._recon_obs_by_interval((Y for Y in proxies), recon_times, 1)
+    assert ob_R.shape == (len(proxies),)
+    assert ob_counts.sum() > 0
+
+    ctx = {'prior_file': prior_file,
+           'workdir': workdir,
+           'analysis_store': analysis_store,
+           'clean_start': True,
+           'state_dim': state_dim,
+           'dtype': np.float64,
+           'rowblock': 7,
+           'ob_means': ob_means,
+           'ob_counts': ob_counts,
+           'ob_R': ob_R,
+           'loc_weights': loc_weights,
+           'gmt_info': None}
+    year_chunks = [[(int(i), int(recon_times[i])) for i in chunk]
+                   for chunk in np.array_split(np.arange(len(recon_times)), 3)]
+
+    pool = multiprocessing.get_context('fork').Pool(
+        processes=2, initializer=driver._init_recon_worker, initargs=(ctx,))
+    try:
+        nyears = sum(res[1] for res in pool.imap_unordered(
+            driver._recon_years_worker, year_chunks))
+    finally:
+        pool.terminate()
+        pool.join()
+    assert nyears == len(recon_times)
+
+    if analysis_store:
+        store = LMR_utils.AnalysisStore(workdir)
+        assert store.done.all()
+
+    # sequential reconstruction (serial_batch solver)
+    for yr_idx, t in enumerate(recon_times):
+        obvalues, ye_rows, ob_errs = [], [], []
+        for proxy_idx, Y in enumerate(proxies):
+            ob = driver._proxy_ob_for_interval(Y, t, t, 1)
+            if ob is None:
+                continue
+            obvalues.append(ob[0])
+            ye_rows.append(state_dim + proxy_idx)
+            ob_errs.append(Y.psm_obj.R/float(ob[1]))
+        Xa_ref = enkf_update_array_batch(Xb_one_aug, obvalues, ye_rows, ob_errs)
+
+        if analysis_store:
+            Xa = store.data[yr_idx]
+        else:
+            Xa = np.load(join(workdir, 'year{:07d}.npy'.format(t)))
+        np.testing.assert_allclose(Xa, Xa_ref, rtol=1e-10, atol=1e-12)
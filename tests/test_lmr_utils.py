@@ -1,6 +1,8 @@
 import sys
 sys.path.append('../')
 
+import os
+
 import pytest
 import LMR_utils as Utils
 import numpy as np
@@ -168,3 +170,436 @@ def test_calc_latlon_bnd_bounds_half_shift():
     np.testing.assert_equal(lat_bnds, [-90, -75, -45, -15, 15, 45, 75, 90])
     np.testing.assert_equal(lon_bnds, [-45, 45, 135, 225, 315])
   
+
+
+def test_spatial_index_nearest_within():
+    lats, lons, _, _ = Utils.generate_latlon(46, 72)
+    rng = np.random.RandomState(0)
+    site_lats = rng.uniform(-90, 90, 20)
+    site_lons = rng.uniform(-180, 180, 20)
+
+    index = Utils.get_spatial_index(lats, lons)
+    assert Utils.get_spatial_index(lats, lons) is index
+
+    dist, inds = index.nearest(site_lats, site_lons)
+    for k in range(20):
+        ref = Utils.haversine(site_lons[k], site_lats[k], lons, lats)
+        np.testing.assert_allclose(dist[k], ref.min(), atol=1e-6)
+        assert inds[k] == ref.argmin()
+
+        d, i = index.within(site_lats[k], site_lons[k], 1000.)
+        np.testing.assert_array_equal(np.sort(i),
+                                      np.where(ref.ravel() <= 1000.)[0])
+        assert np.all(np.diff(d) >= 0)
+
+    # lat/lon axes of a regular grid
+    axes_index = Utils.get_spatial_index(lats[:, 0], lons[0], axes=True)
+    assert axes_index.shape == lats.shape
+    jind, kind = axes_index.unravel(axes_index.nearest(site_lats[0],
+                                                       site_lons[0])[1])
+    assert (jind, kind) == np.unravel_index(inds[0], lats.shape)
+    assert Utils.get_spatial_index(lats[:, 0], lons[0], axes=True) is axes_index
+
+
+def test_spatial_index_cache_keys():
+    lats, lons, _, _ = Utils.generate_latlon(46, 72)
+    coords = np.column_stack((lats.ravel(), lons.ravel()))
+
+    # new slices of the same coordinates (as of the state vector)
+    index = Utils.get_spatial_index(coords[:, 0], coords[:, 1])
+    assert Utils.get_spatial_index(coords[:, 0], coords[:, 1]) is index
+    assert Utils.get_spatial_index(coords[:10, 0], coords[:10, 1]) is not index
+
+    # other arrays of coordinates, possibly at the memory location of
+    # arrays freed since
+    for shift in (10., 20.):
+        del coords, index
+        coords = np.column_stack((lats.ravel(), (lons.ravel() + shift) % 360.))
+        index = Utils.get_spatial_index(coords[:, 0], coords[:, 1])
+        np.testing.assert_array_equal(index.lons, coords[:, 1])
+
+    # lists hashed
+    index = Utils.get_spatial_index([10., 20.], [30., 40.])
+    assert Utils.get_spatial_index([10., 20.], [30., 40.]) is index
+
+
+def test_analysis_store(tmpdir):
+    workdir = str(tmpdir)
+    times = np.arange(1850, 1860)
+    rng = np.random.RandomState(0)
+    Xa = rng.randn(len(times), 12, 4)
+
+    store = Utils.AnalysisStore.create(workdir, times, (12, 4), np.float64)
+    assert Utils.AnalysisStore.exists(workdir)
+    for k in (0, 3, 5):
+        store.write(k, Xa[k])
+    store.flush()
+
+    # only the analyses written so far
+    store = Utils.AnalysisStore(workdir)
+    assert store.years() == ['0001850', '0001853', '0001855']
+    np.testing.assert_array_equal(store.data[store.done], Xa[[0, 3, 5]])
+
+    # restart keeps the analyses already written
+    store = Utils.AnalysisStore.create(workdir, times, (12, 4), np.float64,
+                                       restart=True)
+    assert store.done.sum() == 3
+    for k in range(len(times)):
+        store.write(k, Xa[k])
+    store.flush()
+    store = Utils.AnalysisStore(workdir)
+    assert isinstance(store.data, np.memmap)
+    assert store.done.all()
+    np.testing.assert_array_equal(store.data, Xa)
+
+    # new store if the reconstruction differs
+    store = Utils.AnalysisStore.create(workdir, times, (12, 5), np.float64,
+                                       restart=True)
+    assert not store.done.any()
+
+
+def test_prefetch_order():
+    loaded = []
+
+    def load(k):
+        loaded.append(k)
+        return k*10
+
+    assert list(Utils._prefetch(load, 5)) == [0, 10, 20, 30, 40]
+    assert loaded == list(range(5))
+    assert list(Utils._prefetch(load, 0)) == []
+
+
+def test_ens_full_archive_netcdf(tmpdir):
+    from netCDF4 import Dataset
+
+    class CfgCore(object):
+        save_archive_ens_full_format = 'netcdf'
+
+    filen = str(tmpdir.join('ensemble_full_tas'))
+    rng = np.random.RandomState(0)
+    xa = rng.randn(3, 4, 6, 5)
+    xa_ens = Utils._ens_full_archive(CfgCore(), filen, xa.shape, ('lat', 'lon'))
+    for k in range(3):
+        xa_ens[k] = xa[k]
+    lat = rng.randn(4, 6)
+    Utils._close_ens_full_archive({'nens': 5, 'years': ['0001850', '0001851',
+                                                         '0001852'],
+                                   'lat': lat, 'xb_ens': xa[0],
+                                   'xa_ens': xa_ens})
+
+    ds = Dataset(filen + '.nc')
+    assert ds.variables['xa_ens'].chunking() == [1, 4, 6, 5]
+    np.testing.assert_array_equal(ds.variables['xa_ens'][:], xa)
+    np.testing.assert_array_equal(ds.variables['lat'][:], lat)
+    np.testing.assert_array_equal(ds.variables['xb_ens'][:], xa[0])
+    assert list(ds.variables['years'][:]) == ['0001850', '0001851', '0001852']
+    assert ds.getncattr('nens') == 5
+    ds.close()
+
+
+def test_ensemble_quantiles_and_sketch_merge():
+    rng = np.random.RandomState(0)
+    pctls = (2.5, 5, 50, 95, 97.5)
+    X = rng.randn(3, 4, 101)
+    np.testing.assert_allclose(Utils.ensemble_quantiles(X, pctls),
+                               np.moveaxis(np.percentile(X, pctls, axis=-1), 0, -1))
+
+    # percentiles over several ensembles merged from their sketches
+    ensembles = [rng.randn(3, 500) + shift for shift in (0., 0.5, 1.)]
+    sketches = [Utils.quantile_sketch(ens, 100) for ens in ensembles]
+    merged = Utils.merge_quantile_sketches(sketches, [500]*3, pctls)
+    expected = np.moveaxis(np.percentile(np.concatenate(ensembles, axis=-1),
+                                         pctls, axis=-1), 0, -1)
+    assert merged.shape == (3, len(pctls))
+    np.testing.assert_allclose(merged, expected, atol=0.1)
+
+
+def test_regrid_simple_members_independent():
+    lat = np.linspace(-87.5, 87.5, 36)
+    lon = np.arange(0, 360, 5.)
+    lon2, lat2 = np.meshgrid(lon, lat)
+    coords = np.column_stack((lat2.ravel(), lon2.ravel()))
+    rng = np.random.RandomState(0)
+    X = rng.randn(coords.shape[0], 4)
+    X[:800, 1] = np.nan
+
+    X_new, lat_new, lon_new = Utils.regrid_simple(4, X, coords, 0, 1, 10)
+    assert X_new.shape == (lat_new.size, 4)
+    assert np.ma.count_masked(X_new[:, 1]) > 0
+    assert np.ma.count_masked(X_new[:, [0, 2, 3]]) == 0
+    for k in range(4):
+        Xk_new, _, _ = Utils.regrid_simple(1, X[:, k:k+1], coords, 0, 1, 10)
+        np.testing.assert_allclose(np.ma.filled(X_new[:, k:k+1], -99.),
+                                   np.ma.filled(Xk_new, -99.))
+
+
+def _fake_regrid_factors(calls):
+    # stands in for _esmpy_regrid_factors (ESMF): each target point is a
+    # weighted sum of 3 random source points, except the unmapped ones
+    def regrid_factors(X_lat2D, X_lon2D, target_nlat, target_nlon,
+                       include_poles=False, method='bilinear', src_mask=None):
+        calls.append(method)
+        rng = np.random.RandomState(target_nlat*target_nlon)
+        ntarget = target_nlat*target_nlon
+        dst_inds = np.repeat(np.arange(ntarget), 3)
+        src_inds = rng.randint(0, X_lat2D.size, size=dst_inds.size)
+        factors = rng.rand(dst_inds.size)
+        mapped = dst_inds % 7 != 0
+        lat_new, lon_new, _, _ = Utils.generate_latlon(
+            target_nlat, target_nlon, include_endpts=include_poles)
+        return (src_inds[mapped], dst_inds[mapped], factors[mapped],
+                lat_new, lon_new)
+    return regrid_factors
+
+
+@pytest.fixture()
+def src_grid():
+    lat2, lon2, _, _ = Utils.generate_latlon(18, 36)
+    return lat2, lon2
+
+
+def test_esmpy_regridder_unreadable_file(src_grid, tmpdir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(Utils, '_esmpy_regrid_factors',
+                        _fake_regrid_factors(calls))
+    lat2, lon2 = src_grid
+    cache_dir = str(tmpdir.join('weights'))
+
+    regridder = Utils.ESMFRegridder(lat2, lon2, 9, 12, cache_dir=cache_dir)
+    assert os.listdir(cache_dir) == [os.path.basename(regridder.filename)]
+
+    # partially written file: weights calculated again
+    with open(regridder.filename, 'r+b') as f:
+        f.truncate(100)
+    regridder2 = Utils.ESMFRegridder(lat2, lon2, 9, 12, cache_dir=cache_dir)
+    assert len(calls) == 2
+    assert (regridder2.weights != regridder.weights).nnz == 0
+
+    regridder3 = Utils.ESMFRegridder(lat2, lon2, 9, 12, cache_dir=cache_dir)
+    assert len(calls) == 2
+    assert (regridder3.weights != regridder.weights).nnz == 0
+
+
+def test_esmpy_regridder_matches_member_loop(src_grid, monkeypatch):
+    calls = []
+    monkeypatch.setattr(Utils, '_esmpy_regrid_factors',
+                        _fake_regrid_factors(calls))
+    lat2, lon2 = src_grid
+    src_inds, dst_inds, factors, _, _ = _fake_regrid_factors([])(lat2, lon2,
+                                                                 9, 12)
+    regridder = Utils.ESMFRegridder(lat2, lon2, 9, 12)
+    assert regridder.lat_new.shape == (9, 12)
+
+    rng = np.random.RandomState(0)
+    X = rng.randn(lat2.size, 5)
+    X_new = regridder(X)
+    assert X_new.shape == (9*12, 5)
+    for k in range(X.shape[1]):
+        ref = np.zeros(9*12)
+        np.add.at(ref, dst_inds, factors*X[src_inds, k])
+        np.testing.assert_allclose(X_new[:, k], ref, rtol=1e-12, atol=1e-12)
+
+    # masked input: output masked at the target points without weights
+    unmapped = np.ones(9*12, dtype=bool)
+    unmapped[dst_inds] = False
+    assert unmapped.any()
+    np.testing.assert_array_equal(regridder.unmapped, unmapped)
+    X_new = regridder(np.ma.masked_invalid(X))
+    assert np.ma.isMaskedArray(X_new)
+    np.testing.assert_array_equal(np.ma.getmaskarray(X_new),
+                                  np.repeat(unmapped[:, None], 5, axis=1))
+    np.testing.assert_allclose(X_new.compressed(),
+                               regridder(X)[~unmapped].ravel())
+
+
+def test_esmpy_regridder_save_load(src_grid, tmpdir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(Utils, '_esmpy_regrid_factors',
+                        _fake_regrid_factors(calls))
+    lat2, lon2 = src_grid
+    cache_dir = str(tmpdir)
+
+    regridder = Utils.ESMFRegridder(lat2, lon2, 9, 12, cache_dir=cache_dir)
+    regridder2 = Utils.ESMFRegridder(lat2, lon2, 9, 12, cache_dir=cache_dir)
+    assert calls == ['bilinear']
+    assert regridder2.filename == regridder.filename
+    assert (regridder2.weights != regridder.weights).nnz == 0
+    np.testing.assert_array_equal(regridder2.unmapped, regridder.unmapped)
+    np.testing.assert_array_equal(regridder2.lat_new, regridder.lat_new)
+    np.testing.assert_array_equal(regridder2.lon_new, regridder.lon_new)
+
+    # different definition: different file
+    regridder3 = Utils.ESMFRegridder(lat2, lon2, 9, 12, method='patch',
+                                     cache_dir=cache_dir)
+    assert calls == ['bilinear', 'patch']
+    assert regridder3.filename != regridder.filename
+
+
+def test_get_esmpy_regridder_cached(src_grid, monkeypatch):
+    calls = []
+    monkeypatch.setattr(Utils, '_esmpy_regrid_factors',
+                        _fake_regrid_factors(calls))
+    monkeypatch.setattr(Utils, '_esmpy_regridders',
+                        Utils.collections.OrderedDict())
+    lat2, lon2 = src_grid
+    mask = np.zeros(lat2.shape, dtype=bool)
+    mask[0] = True
+
+    key = Utils.esmpy_regridder_key(lat2, lon2, 9, 12)
+    assert key == Utils.esmpy_regridder_key(lat2.copy(), lon2.copy(), 9, 12)
+    assert key != Utils.esmpy_regridder_key(lat2, lon2, 9, 12, src_mask=mask)
+    assert key != Utils.esmpy_regridder_key(lat2, lon2, 9, 12,
+                                            include_poles=True)
+
+    regridder = Utils.get_esmpy_regridder(lat2, lon2, 9, 12)
+    assert Utils.get_esmpy_regridder(lat2.copy(), lon2, 9, 12) is regridder
+    assert Utils.get_esmpy_regridder(lat2, lon2, 9, 12,
+                                     src_mask=mask) is not regridder
+    assert len(calls) == 2
+
+
+class _FakeESMFGrid(object):
+    def __init__(self, max_index, **kwargs):
+        nlon, nlat = max_index
+        self.centers = [np.zeros((nlon, nlat)), np.zeros((nlon, nlat))]
+        self.mask = np.zeros((nlon, nlat), dtype=np.int16)
+
+    def get_coords(self, coord, staggerloc=None):
+        if staggerloc == 'corner':
+            return np.zeros((self.mask.shape[0], self.mask.shape[1]+1))
+        return self.centers[coord]
+
+    def add_coords(self, staggerloc=None):
+        pass
+
+    def add_item(self, item):
+        return self.mask
+
+    def destroy(self):
+        pass
+
+
+class _FakeESMFRegrid(object):
+    # nearest neighbour, with factors between 1-based sequence indices of
+    # the (lon, lat) grids (lon varying fastest), as ESMF.Regrid
+    def __init__(self, src_field, dst_field, **kwargs):
+        src_lon, src_lat = [c.T.ravel() for c in src_field.grid.centers]
+        dst_lon, dst_lat = [c.T.ravel() for c in dst_field.grid.centers]
+        dlon = (dst_lon[:, None] - src_lon[None, :] + 180.) % 360. - 180.
+        dlat = dst_lat[:, None] - src_lat[None, :]
+        src_inds = np.argmin(dlon**2 + dlat**2, axis=1)
+        self.factor_inds = np.column_stack((src_inds + 1,
+                                            np.arange(dst_lon.size) + 1))
+
+    def get_factors(self):
+        return self.factor_inds, np.ones(self.factor_inds.shape[0])
+
+    def destroy(self):
+        pass
+
+
+def _fake_esmf():
+    from types import SimpleNamespace
+
+    class Field(object):
+        def __init__(self, grid, **kwargs):
+            self.grid = grid
+
+        def destroy(self):
+            pass
+
+    return SimpleNamespace(
+        Grid=_FakeESMFGrid, Field=Field, Regrid=_FakeESMFRegrid,
+        CoordSys=SimpleNamespace(SPH_DEG='sph_deg'),
+        TypeKind=SimpleNamespace(R8='r8'),
+        StaggerLoc=SimpleNamespace(CENTER='center', CORNER='corner'),
+        GridItem=SimpleNamespace(MASK='mask'),
+        RegridMethod=SimpleNamespace(BILINEAR='bilinear', PATCH='patch'),
+        UnmappedAction=SimpleNamespace(IGNORE='ignore'))
+
+
+@pytest.mark.parametrize('first_lon', [0., 180., 350.])
+def test_esmpy_regrid_factors_lon_shift(first_lon, monkeypatch):
+    monkeypatch.setattr(Utils, 'ESMF', _fake_esmf())
+    # source grid with longitudes starting at first_lon (cyclic point
+    # within the grid if not 0), same points as the target grid
+    lat2, lon2, _, _ = Utils.generate_latlon(18, 36)
+    lon2 = (lon2 + first_lon) % 360.
+
+    src_inds, dst_inds, factors, lat_new, lon_new = \
+        Utils._esmpy_regrid_factors(lat2, lon2, 18, 36)
+
+    # source indices are those of the grid given as input
+    np.testing.assert_array_equal(lat2.ravel()[src_inds],
+                                  lat_new.ravel()[dst_inds])
+    np.testing.assert_array_equal(lon2.ravel()[src_inds],
+                                  lon_new.ravel()[dst_inds])
+
+
+class _FakeSpharmt(object):
+    created = []
+
+    def __init__(self, nlon, nlat, gridtype='regular', legfunc='stored'):
+        self.nlon = nlon
+        self.nlat = nlat
+        self.created.append((nlon, nlat))
+
+
+def _fake_spharm_regrid(grdin, grdout, datagrid, ntrunc=None, smooth=None):
+    # linear transform of each (nlat, nlon) field, in float32 as spharm
+    npts_in = grdin.nlat*grdin.nlon
+    npts_out = grdout.nlat*grdout.nlon
+    M = np.random.RandomState(npts_in + npts_out).randn(npts_out, npts_in)
+    fields = datagrid.reshape((npts_in, -1))
+    out = M.dot(fields).astype(np.float32)
+    return out.reshape((grdout.nlat, grdout.nlon) + datagrid.shape[2:])
+
+
+@pytest.fixture()
+def fake_spharm(monkeypatch):
+    monkeypatch.setattr(Utils, 'Spharmt', _FakeSpharmt)
+    monkeypatch.setattr(Utils, 'regrid', _fake_spharm_regrid)
+    monkeypatch.setattr(Utils, '_spharmt_objects',
+                        Utils.collections.OrderedDict())
+    monkeypatch.setattr(_FakeSpharmt, 'created', [])
+
+
+def test_regrid_sphere_matches_member_loop(fake_spharm):
+    nlat, nlon, nens, ntrunc = 12, 18, 5, 5
+    X = np.random.RandomState(0).randn(nlat*nlon, nens)
+
+    X_new, lat_new, lon_new = Utils.regrid_sphere(nlat, nlon, nens, X, ntrunc)
+
+    nlat_new, nlon_new = 6, 9
+    assert lat_new.shape == lon_new.shape == (nlat_new, nlon_new)
+    assert X_new.shape == (nlat_new*nlon_new, nens)
+    assert X_new.dtype == np.float64
+
+    # transform of each ensemble member, one at a time
+    specob_lmr = Utils.get_spharmt(nlon, nlat)
+    specob_new = Utils.get_spharmt(nlon_new, nlat_new)
+    for k in range(nens):
+        Xbtrunc = _fake_spharm_regrid(specob_lmr, specob_new,
+                                      np.reshape(X[:, k], (nlat, nlon)),
+                                      ntrunc=nlat_new-1)
+        np.testing.assert_allclose(X_new[:, k], Xbtrunc.flatten(),
+                                   rtol=1e-6, atol=1e-5)
+
+
+def test_get_spharmt_cached(fake_spharm):
+    specob = Utils.get_spharmt(18, 12)
+    assert Utils.get_spharmt(18, 12) is specob
+    assert _FakeSpharmt.created == [(18, 12)]
+
+    # the 4 most recently used kept
+    for nlat in range(2, 6):
+        Utils.get_spharmt(2*nlat, nlat)
+    assert len(Utils._spharmt_objects) == 4
+    assert Utils.get_spharmt(18, 12) is not specob
+    assert _FakeSpharmt.created[-1] == (18, 12)
+
+    Utils.get_spharmt(10, 5)
+    nb_created = len(_FakeSpharmt.created)
+    Utils.get_spharmt(10, 5)
+    assert len(_FakeSpharmt.created) == nb_created
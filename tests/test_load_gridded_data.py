@@ -0,0 +1,111 @@
+import sys
+sys.path.append('../')
+
+import numpy as np
+import pytest
+from scipy import stats
+
+import load_gridded_data as lgd
+
+
+def _linregress_detrend(y):
+    # reference: trend of the valid data of the time series from
+    # scipy.stats.linregress, removed from all its data
+    t = np.arange(len(y), dtype=np.float64)
+    valid = np.isfinite(y)
+    slope, intercept, _, _, _ = stats.linregress(t[valid], y[valid])
+    return y - (slope*t + intercept)
+
+
+@pytest.fixture()
+def trend_field():
+    rng = np.random.RandomState(0)
+    ntime, nlat, nlon = 150, 4, 5
+    t = np.arange(ntime)[:, None, None]
+    slopes = rng.randn(1, nlat, nlon)
+    return 280. + slopes*0.01*t + rng.randn(ntime, nlat, nlon)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 150, 1000])
+def test_detrend_linear_matches_linregress(trend_field, chunk_size):
+    detrended = lgd.detrend_linear(trend_field, chunk_size=chunk_size)
+
+    assert detrended.shape == trend_field.shape
+    assert detrended.dtype == np.float64
+    for j in range(trend_field.shape[1]):
+        for k in range(trend_field.shape[2]):
+            np.testing.assert_allclose(detrended[:, j, k],
+                                       _linregress_detrend(trend_field[:, j, k]),
+                                       rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1000])
+def test_detrend_linear_missing_values(trend_field, chunk_size):
+    data = trend_field.copy()
+    data[10:40, 0, 0] = np.nan
+    data[::3, 1, 2] = np.nan
+    # fewer than 2 valid data
+    data[:, 2, 3] = np.nan
+    data[1:, 3, 4] = np.nan
+
+    detrended = lgd.detrend_linear(data, chunk_size=chunk_size)
+
+    # invalid data kept invalid, trends from the valid data
+    np.testing.assert_array_equal(np.isnan(detrended[:, 0, 0]),
+                                  np.isnan(data[:, 0, 0]))
+    for j, k in [(0, 0), (1, 2), (0, 1)]:
+        np.testing.assert_allclose(detrended[:, j, k],
+                                   _linregress_detrend(data[:, j, k]),
+                                   rtol=0, atol=1e-9)
+    assert np.isnan(detrended[:, 2, 3]).all()
+    assert np.isnan(detrended[:, 3, 4]).all()
+
+
+def test_detrend_linear_masked(trend_field):
+    mask = np.zeros(trend_field.shape, dtype=bool)
+    mask[:20, 0, 1] = True
+    mask[:, 1, 1] = True
+    data = np.ma.masked_array(trend_field, mask=mask)
+
+    detrended = lgd.detrend_linear(data, chunk_size=16)
+
+    assert np.ma.isMaskedArray(detrended)
+    np.testing.assert_array_equal(np.ma.getmaskarray(detrended), mask)
+    ref = trend_field.copy()
+    ref[mask] = np.nan
+    np.testing.assert_allclose(detrended[20:, 0, 1].filled(np.nan),
+                               _linregress_detrend(ref[:, 0, 1])[20:],
+                               rtol=0, atol=1e-9)
+    np.testing.assert_allclose(detrended[:, 2, 2].filled(np.nan),
+                               _linregress_detrend(trend_field[:, 2, 2]),
+                               rtol=0, atol=1e-9)
+
+
+def test_detrend_linear_shapes_dtype(trend_field):
+    # 0D (time series) and 1D (e.g. latitudinally-averaged) fields
+    series = trend_field[:, 0, 0]
+    detrended = lgd.detrend_linear(series, chunk_size=16)
+    assert detrended.shape == series.shape
+    np.testing.assert_allclose(detrended, _linregress_detrend(series),
+                               rtol=0, atol=1e-9)
+
+    field_1d = trend_field[:, :, 0]
+    detrended = lgd.detrend_linear(field_1d, chunk_size=16)
+    assert detrended.shape == field_1d.shape
+    for j in range(field_1d.shape[1]):
+        np.testing.assert_allclose(detrended[:, j],
+                                   _linregress_detrend(field_1d[:, j]),
+                                   rtol=0, atol=1e-9)
+
+    # float32 data detrended in float32 (sums in float64)
+    data32 = trend_field.astype(np.float32)
+    detrended = lgd.detrend_linear(data32)
+    assert detrended.dtype == np.float32
+    np.testing.assert_allclose(detrended[:, 1, 1],
+                               _linregress_detrend(trend_field[:, 1, 1]),
+                               rtol=0, atol=1e-3)
+
+    data32 = np.ma.masked_array(data32, mask=np.zeros(data32.shape, dtype=bool))
+    detrended = lgd.detrend_linear(data32)
+    assert np.ma.isMaskedArray(detrended)
+    assert detrended.dtype == np.float32
@@ -1,3 +1,4 @@
+import os
 import sys
 
 sys.path.append('../')
@@ -85,5 +86,100 @@ def test_prior_use_full_prior():
     np.testing.assert_equal(X.ens, prior_vals)
 
 
-
-
+def test_populate_ensemble_blocks():
+    class PriorCfg(object):
+        seed = 3
+
+    rng = np.random.RandomState(0)
+    tas = rng.randn(50, 4, 6)
+    tas[:, 0, :] = np.nan
+    gm = rng.randn(50)
+    lat = np.linspace(-60, 60, 4)
+    lon = np.arange(0, 360, 60.)
+
+    X = LMR_prior.prior_generic()
+    X.prior_dict = {'tas': {'vartype': '2D:horizontal', 'years': np.arange(50),
+                            'spacecoords': ('lat', 'lon'), 'lat': lat,
+                            'lon': lon, 'value': tas},
+                    'gm': {'vartype': '0D:time series', 'years': np.arange(50),
+                           'spacecoords': None, 'value': gm}}
+    X.read_prior = lambda: None
+    X.statevars = {'tas': 'anom', 'gm': 'anom'}
+    X.Nens = 10
+    X.populate_ensemble('generic', PriorCfg(), dtype=np.float32)
+
+    inds = X.prior_sample_indices
+    assert X.ens.dtype == np.float32
+    ibeg, iend = X.full_state_info['tas']['pos']
+    np.testing.assert_array_equal(np.ma.filled(X.ens[ibeg:iend+1], np.nan),
+                                  tas[inds].reshape(10, -1).T.astype(np.float32))
+    np.testing.assert_array_equal(X.ens.mask[ibeg:iend+1],
+                                  np.isnan(tas[inds].reshape(10, -1).T))
+    ibeg, _ = X.full_state_info['gm']['pos']
+    np.testing.assert_array_equal(X.ens[ibeg], gm[inds].astype(np.float32))
+    lon2d, lat2d = np.meshgrid(lon, lat)
+    np.testing.assert_array_equal(X.coords[:24, 0], lat2d.ravel())
+    np.testing.assert_array_equal(X.coords[:24, 1], lon2d.ravel())
+
+
+def test_prior_cache(tmpdir):
+    nreads = []
+
+    class PriorCounted(LMR_prior.prior_master):
+        def read_prior(self):
+            nreads.append(sorted(self.statevars))
+            self.prior_dict = dict((var, {'value': np.arange(4.) + len(var)})
+                                   for var in self.statevars)
+
+    def prior_obj(statevars):
+        X = PriorCounted()
+        X.prior_datadir = str(tmpdir)
+        X.prior_datafile = '[vardef_template]_dat.nc'
+        X.statevars = statevars
+        X.avgInterval = {'annual': [1,2,3,4,5,6,7,8,9,10,11,12]}
+        X.detrend = False
+        X.anom_reference = None
+        X.prior_cache_dir = str(tmpdir.join('cache'))
+        return X
+
+    X = prior_obj({'tas': 'anom'})
+    X.load_prior()
+    X = prior_obj({'psl': 'anom', 'tas': 'anom'})
+    X.load_prior()
+    assert nreads == [['tas'], ['psl']]
+    assert list(X.prior_dict.keys()) == ['psl', 'tas']
+    np.testing.assert_equal(X.prior_dict['tas']['value'], np.arange(4.) + 3)
+
+    # different processing options: read again
+    X = prior_obj({'tas': 'anom'})
+    X.detrend = True
+    X.load_prior()
+    assert nreads[-1] == ['tas']
+
+    # size limit: least recently used entries removed
+    cache = LMR_prior.PriorCache(str(tmpdir.join('cache')), max_size=0.)
+    cache.evict()
+    assert len(tmpdir.join('cache').listdir()) == 0
+
+
+class PriorPerVar(LMR_prior.prior_master):
+    def read_prior(self):
+        self.prior_dict = dict((var, {'value': np.arange(4.) + len(var),
+                                      'pid': os.getpid()})
+                               for var in self.statevars)
+
+
+def test_read_prior_vars_concurrent(tmpdir):
+    X = PriorPerVar()
+    X.prior_datadir = str(tmpdir)
+    X.prior_datafile = '[vardef_template]_dat.nc'
+    X.statevars = {'tas': 'anom', 'psl': 'anom', 'zg500': 'anom'}
+    X.load_workers = 2
+    X.load_memory_budget = 1.
+    X.load_prior()
+
+    assert list(X.prior_dict.keys()) == ['tas', 'psl', 'zg500']
+    for var in X.statevars:
+        np.testing.assert_equal(X.prior_dict[var]['value'],
+                                np.arange(4.) + len(var))
+        assert X.prior_dict[var]['pid'] != os.getpid()
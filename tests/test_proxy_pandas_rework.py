@@ -0,0 +1,144 @@
+import sys
+sys.path.append('../')
+
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import LMR_proxy_pandas_rework as proxy
+
+
+def _lmrdb_source(nsites=60, seed=0):
+    rng = np.random.RandomState(seed)
+    years = np.arange(1000, 2001)
+    archives = ['Tree Rings', 'Corals and Sclerosponges']
+    measures = {'Tree Rings': ['trsgi', 'MXD'],
+                'Corals and Sclerosponges': ['d18O']}
+    dbases = [['LMR'], ['PAGES2kv2'], ['LMR', 'PAGES2kv2'], []]
+
+    rows = []
+    data = {}
+    for i in range(nsites):
+        pid = '{}:site{:03d}'.format('NAm' if i % 3 else 'Asi', i)
+        archive = archives[i % 2]
+        first = int(rng.randint(1000, 1700))
+        last = int(rng.randint(1850, 2001))
+        rows.append({'Proxy ID': pid, 'Archive type': archive,
+                     'Proxy measurement': measures[archive][(i // 2) % len(measures[archive])],
+                     'Youngest (C.E.)': last, 'Oldest (C.E.)': first,
+                     'Lat (N)': rng.uniform(-60., 70.),
+                     'Lon (E)': rng.uniform(-180., 180.),
+                     'Elev': rng.uniform(0., 3000.),
+                     'Seasonality': str(list(range(1, 13))),
+                     'Resolution (yr)': 1.0,
+                     'Databases': dbases[(i // 3) % len(dbases)]})
+        series = pd.Series(np.nan, index=years)
+        valid = (years >= first) & (years <= last)
+        series[valid] = rng.randn(valid.sum())
+        # gaps in the records
+        series[rng.rand(len(years)) < 0.2] = np.nan
+        data[pid] = series
+
+    return pd.DataFrame(rows), pd.DataFrame(data)
+
+
+def _config():
+    mapping = {('Tree Rings', 'trsgi'): 'Tree Rings_WidthPages2',
+               ('Tree Rings', 'MXD'): 'Tree Rings_WoodDensity',
+               ('Corals and Sclerosponges', 'd18O'): 'Corals and Sclerosponges_d18O'}
+    lmrdb = SimpleNamespace(
+        simple_filters={'Resolution (yr)': [1.0]},
+        proxy_order=['Tree Rings_WidthPages2', 'Tree Rings_WoodDensity',
+                     'Corals and Sclerosponges_d18O'],
+        proxy_assim2={'Tree Rings_WidthPages2': ['trsgi'],
+                      'Tree Rings_WoodDensity': ['MXD'],
+                      'Corals and Sclerosponges_d18O': ['d18O']},
+        proxy_type_mapping=mapping,
+        database_filter=['LMR'],
+        proxy_blacklist=['Asi:site00'],
+        proxy_availability_filter=True,
+        proxy_availability_fraction=0.5,
+        proxy_timeseries_kind='asis')
+    return SimpleNamespace(core=SimpleNamespace(load_psmobj=False),
+                           proxies=SimpleNamespace(LMRdb=lmrdb))
+
+
+def test_site_meta_table():
+    meta, _ = _lmrdb_source()
+    # duplicated site: first row used, as in a selection of the DataFrame
+    meta = pd.concat([meta, meta.iloc[[4]].assign(Elev=-1.)],
+                     ignore_index=True)
+
+    table = proxy.site_meta_table(meta)
+
+    assert len(table) == len(meta) - 1
+    for site, site_meta in table.items():
+        ref = meta[meta['Proxy ID'] == site].iloc[0]
+        assert site_meta == ref.to_dict()
+
+
+def test_lmrdb_load_site_meta_table():
+    meta, data = _lmrdb_source()
+    config = _config()
+    table = proxy.site_meta_table(meta)
+    site = meta['Proxy ID'].iloc[7]
+
+    ref = proxy.ProxyLMRdb.load_site(config, site, [1500, 1900],
+                                     meta_src=meta, data_src=data)
+    pobj = proxy.ProxyLMRdb.load_site(config, site, [1500, 1900],
+                                      data_src=data, meta_table=table)
+
+    for attr in ('id', 'type', 'start_yr', 'end_yr', 'lat', 'lon', 'elev',
+                 'seasonality'):
+        assert getattr(pobj, attr) == getattr(ref, attr)
+    pd.testing.assert_series_equal(pobj.values, ref.values)
+    np.testing.assert_array_equal(pobj.time, ref.time)
+
+    with pytest.raises(KeyError):
+        proxy.ProxyLMRdb.load_site(config, 'missing', [1500, 1900],
+                                   data_src=data, meta_table=table)
+
+
+@pytest.mark.parametrize('fraction', [0.5, 0.8])
+def test_lmrdb_load_all(fraction):
+    meta, data = _lmrdb_source()
+    config = _config()
+    cfg = config.proxies.LMRdb
+    cfg.proxy_availability_fraction = fraction
+    cfg.proxy_blacklist = ['Asi:site00', 'NAm:site4']
+    start, finish = 1500, 1900
+    # sites with metadata but no data
+    no_data = ['NAm:site{:03d}'.format(i) for i in (8, 20, 29)]
+    data = data.drop(columns=no_data)
+
+    ids_by_type, proxies = proxy.ProxyLMRdb.load_all(config, [start, finish],
+                                                     meta_src=meta,
+                                                     data_src=data)
+
+    # reference selection, site by site
+    expected = {}
+    for _, row in meta.iterrows():
+        pid = row['Proxy ID']
+        if pid in data:
+            values = data[pid].loc[start:finish]
+        else:
+            values = pd.Series([], dtype=float)
+        if not (set(row['Databases']) & set(cfg.database_filter)):
+            continue
+        if any(pid.startswith(pbl) for pbl in cfg.proxy_blacklist):
+            continue
+        if not (row['Oldest (C.E.)'] <= start and
+                row['Youngest (C.E.)'] >= finish):
+            continue
+        if values.notnull().sum() / float(finish - start + 1) < \
+                cfg.proxy_availability_fraction:
+            continue
+        ptype = cfg.proxy_type_mapping[(row['Archive type'],
+                                        row['Proxy measurement'])]
+        expected.setdefault(ptype, []).append(pid)
+
+    assert ids_by_type == expected
+    assert [p.id for p in proxies] == [pid for name in cfg.proxy_order
+                                       for pid in expected.get(name, [])]
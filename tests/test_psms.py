@@ -173,5 +173,68 @@ def test_get_close_grid_point_data(psm_dat):
     np.testing.assert_equal(ref_data, func_data)
 
 
+def _gridded_state(nens=5):
+    # tas and pr on the same grid (lat, lon coords) in the state vector
+    lats = np.linspace(-87.5, 87.5, 36)
+    lons = np.linspace(0, 360, 72, endpoint=False)
+    lon_grid, lat_grid = np.meshgrid(lons, lats)
+    coords = np.column_stack((lat_grid.ravel(), lon_grid.ravel()))
+    npts = coords.shape[0]
+    state_info = {}
+    for i, var in enumerate(['tas_sfc_Amon', 'pr_sfc_Amon', 'd18O_sfc_Amon']):
+        state_info[var] = {'pos': (i*npts, (i+1)*npts - 1),
+                           'spacecoords': ('lat', 'lon')}
+    X_coords = np.tile(coords, (3, 1))
+    Xb = np.random.RandomState(0).randn(3*npts, nens)
+    return Xb, state_info, X_coords
+
+
+def test_psm_batch():
+    Xb, state_info, X_coords = _gridded_state()
+    rng = np.random.RandomState(1)
+
+    objs = []
+    for k in range(30):
+        lat = rng.uniform(-90, 90)
+        lon = rng.uniform(-180, 180)
+        if k % 3 == 0:
+            obj = object.__new__(psms.LinearPSM)
+            obj.datatag_calib = 'GISTEMP'
+            obj.slope, obj.intercept = rng.randn(2)
+        elif k % 3 == 1:
+            obj = object.__new__(psms.BilinearPSM)
+            obj.calib_moisture = 'GPCC'
+            obj.slope_temperature, obj.slope_moisture, obj.intercept = rng.randn(3)
+        else:
+            obj = object.__new__(psms.h_interpPSM)
+            obj.RadiusInfluence = 500. if k % 2 else None
+        obj.lat, obj.lon = lat, lon
+        objs.append(obj)
+
+    ref = np.array([obj.psm(Xb, state_info, X_coords) for obj in objs])
+    Ye = psms.psm_batch(objs, Xb, state_info, X_coords)
+    np.testing.assert_allclose(Ye, ref)
+
+
+def test_h_interp_no_grid_point_in_radius():
+    # 10 deg. grid: no grid pt. within 6 x 50 km of the site
+    lats = np.arange(-85., 90., 10.)
+    lons = np.arange(0., 360., 10.)
+    lon_grid, lat_grid = np.meshgrid(lons, lats)
+    X_coords = np.column_stack((lat_grid.ravel(), lon_grid.ravel()))
+    state_info = {'d18O_sfc_Amon': {'pos': (0, X_coords.shape[0] - 1),
+                                    'spacecoords': ('lat', 'lon')}}
+    Xb = np.random.RandomState(0).randn(X_coords.shape[0], 5)
+
+    obj = object.__new__(psms.h_interpPSM)
+    obj.RadiusInfluence = 50.
+    obj.lat, obj.lon = 3., 3.
+    Ye = obj.psm(Xb, state_info, X_coords)
+
+    # value at the nearest grid pt. (5N, 0E)
+    kind = np.flatnonzero((X_coords[:, 0] == 5.) & (X_coords[:, 1] == 0.))[0]
+    np.testing.assert_allclose(Ye, Xb[kind])
+
+
 if __name__ == '__main__':
     test_linear_corr_below_rcrit(psm_dat(None))
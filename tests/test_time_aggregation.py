@@ -0,0 +1,138 @@
+import sys
+import warnings
+
+sys.path.append('../')
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import time_aggregation as tagg
+
+
+@pytest.fixture()
+def monthly_data():
+    dates = [datetime(y, m, 1) for y in range(1950, 1960)
+             for m in range(1, 13)]
+    # incomplete last year
+    dates = dates[:-5]
+    rng = np.random.RandomState(42)
+    data = rng.randn(len(dates), 4, 5)
+    data[rng.rand(*data.shape) < 0.1] = np.nan
+    data[:, 0, 0] = np.nan
+    return dates, data
+
+
+def test_date_year_month(monthly_data):
+    dates, _ = monthly_data
+    years, months = tagg.date_year_month(dates)
+
+    np.testing.assert_array_equal(years, [d.year for d in dates])
+    np.testing.assert_array_equal(months, [d.month for d in dates])
+
+
+def test_monthly_climatology_anomalies(monthly_data):
+    dates, data = monthly_data
+    years, months = tagg.date_year_month(dates)
+    ref_period = [1952, 1956]
+
+    climo = tagg.monthly_climatology(data, years, months,
+                                     ref_period=ref_period)
+    anom = tagg.monthly_anomalies(data.copy(), months, climo)
+
+    ref_anom = data.copy()
+    for i in range(12):
+        m = i+1
+        indsmref = [j for j, v in enumerate(dates)
+                    if ref_period[0] <= v.year <= ref_period[1]
+                    and v.month == m]
+        indsm = [j for j, v in enumerate(dates) if v.month == m]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            ref_climo = np.nanmean(data[indsmref], axis=0)
+        np.testing.assert_allclose(climo[i], ref_climo)
+        ref_anom[indsm] = data[indsm] - ref_climo
+
+    np.testing.assert_allclose(anom, ref_anom)
+
+
+def test_annual_means_max_nan(monthly_data):
+    dates, data = monthly_data
+    years, _ = tagg.date_year_month(dates)
+
+    out_years, means = tagg.annual_means(data, years, max_nan=0)
+
+    np.testing.assert_array_equal(out_years, np.arange(1950, 1960))
+    for i, yr in enumerate(out_years):
+        ind = [j for j, k in enumerate(dates) if k.year == yr]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            ref = np.nanmean(data[ind], axis=0)
+        ref[np.isnan(data[ind]).sum(axis=0) > 0] = np.nan
+        np.testing.assert_allclose(means[i], ref)
+
+
+@pytest.mark.parametrize('avg_months', [list(range(1, 13)),
+                                        [-12, 1, 2],
+                                        [6, 7, 8, 9, 10, 11, 12, 13, 14]])
+def test_seasonal_means(monthly_data, avg_months):
+    dates, data = monthly_data
+    years, months = tagg.date_year_month(dates)
+    year_before, year_current, year_follow = tagg.season_months(avg_months)
+
+    out_years, means = tagg.seasonal_means(data, years, months, avg_months)
+    _, complete = tagg.seasonal_means(data[:, 1, 1], years, months,
+                                      avg_months, max_nan=0,
+                                      min_steps=len(avg_months))
+
+    for i, yr in enumerate(out_years):
+        inds = ([k for k, d in enumerate(dates)
+                 if d.year == yr-1 and d.month in year_before] +
+                [k for k, d in enumerate(dates)
+                 if d.year == yr and d.month in year_current] +
+                [k for k, d in enumerate(dates)
+                 if d.year == yr+1 and d.month in year_follow])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            ref = np.nanmean(data[inds], axis=0)
+        np.testing.assert_allclose(means[i], ref)
+
+        vals = data[inds, 1, 1]
+        if len(inds) == len(avg_months) and not np.isnan(vals).any():
+            np.testing.assert_allclose(complete[i], vals.mean())
+        else:
+            assert np.isnan(complete[i])
+
+
+def test_seasonal_means_masked():
+    dates = [datetime(y, m, 1) for y in range(2000, 2003)
+             for m in range(1, 13)]
+    years, months = tagg.date_year_month(dates)
+    data = np.ma.masked_array(np.arange(36.), mask=False)
+    data[:6] = np.ma.masked
+
+    out_years, means = tagg.seasonal_means(data, years, months, [1, 2, 3, 4,
+                                                                 5, 6, 7])
+
+    np.testing.assert_array_equal(out_years, [2000, 2001, 2002])
+    np.testing.assert_allclose(means, [6., 15., 27.])
+
+
+def test_season_time_steps(monthly_data):
+    dates, data = monthly_data
+    years, months = tagg.date_year_month(dates)
+    avg_months = [-12, 1, 2]
+    out_years = [1951, 1955]
+
+    steps = tagg.season_time_steps(years, months, avg_months, out_years)
+
+    np.testing.assert_array_equal(
+        [(d.year, d.month) for d, s in zip(dates, steps) if s],
+        [(1950, 12), (1951, 1), (1951, 2), (1954, 12), (1955, 1), (1955, 2)])
+    _, means = tagg.seasonal_means(data, years, months, avg_months,
+                                   out_years=out_years)
+    _, means_steps = tagg.seasonal_means(data[steps], years[steps],
+                                         months[steps], avg_months,
+                                         out_years=out_years)
+    np.testing.assert_allclose(means_steps, means)
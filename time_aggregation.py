@@ -0,0 +1,296 @@
+"""
+Module: time_aggregation.py
+
+Purpose: Time aggregation of monthly data (monthly climatologies, anomalies,
+         annual and seasonal averages) shared by the gridded data readers
+         and the calibration of the proxy system models.
+
+         Calendar dates are converted once to integer (year, month) arrays
+         and every average is obtained from a single sparse reduction of the
+         time axis, instead of building lists of time indices for every
+         month and every output year. Seasonal windows follow the LMR
+         convention for sequences of months: values in [1,12] are months of
+         the current year, negative values (-12 to -1) are months of the
+         previous year and values > 12 (13 to 24) are months of the
+         following year.
+
+         Missing values (NaNs or masked elements) are ignored in all the
+         averages, as with np.nanmean.
+
+Originator: October 2026
+"""
+import numpy as np
+from scipy import sparse
+
+
+# Max nb of elements of the (time x space) data processed at once
+_CHUNK_ELEMENTS = 2**24
+
+
+def date_year_month(dates):
+    """
+    Integer years and months of a sequence of dates.
+
+    Parameters
+    ----------
+    dates: sequence
+        datetime-like objects (datetime, netCDF4/cftime dates) with year and
+        month attributes.
+
+    Returns
+    -------
+    years: ndarray
+        Years of the dates (int)
+    months: ndarray
+        Months of the dates (int, 1-12)
+    """
+    ndates = len(dates)
+    years = np.fromiter((d.year for d in dates), dtype=int, count=ndates)
+    months = np.fromiter((d.month for d in dates), dtype=int, count=ndates)
+    return years, months
+
+
+def season_months(avg_months):
+    """
+    Split a sequence of months into the months (1-12) taken from the
+    previous, current and following years.
+
+    Parameters
+    ----------
+    avg_months: list(int)
+        Sequence of months, possibly including months of the previous year
+        (negative values) and of the following year (values > 12).
+
+    Returns
+    -------
+    year_before, year_current, year_follow: list(int)
+    """
+    year_current = [m for m in avg_months if m > 0 and m <= 12]
+    year_before = [abs(m) for m in avg_months if m < 0]
+    year_follow = [m-12 for m in avg_months if m > 12]
+    return year_before, year_current, year_follow
+
+
+def _nan_filled(data):
+    """Data as a float ndarray, with masked elements set to NaN."""
+    if np.ma.isMaskedArray(data):
+        return np.ma.filled(data.astype(np.float64), np.nan)
+    return np.asarray(data, dtype=np.float64)
+
+
+def _group_means(data, rows, cols, ngroups, max_nan=None, min_steps=None):
+    """
+    Means of the data over groups of time steps, ignoring NaNs.
+
+    Time step cols[i] contributes to the mean of group rows[i]. Groups with
+    no valid data are set to NaN, as are groups with more than max_nan
+    missing values or fewer than min_steps time steps (when provided).
+    """
+    data = _nan_filled(data)
+    ntime = data.shape[0]
+    flat = data.reshape(ntime, -1)
+    npts = flat.shape[1]
+
+    # group x time indicator matrix
+    indicator = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                  shape=(ngroups, ntime))
+    nsteps = np.asarray(indicator.sum(axis=1)).ravel()
+
+    means = np.empty((ngroups, npts), dtype=np.float64)
+    chunk = max(1, _CHUNK_ELEMENTS // max(ntime, 1))
+    for start in range(0, npts, chunk):
+        block = flat[:, start:start+chunk]
+        valid = ~np.isnan(block)
+        sums = indicator.dot(np.where(valid, block, 0.))
+        counts = indicator.dot(valid.astype(np.float64))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            block_means = sums / counts
+        if max_nan is not None:
+            block_means[(nsteps[:, None] - counts) > max_nan] = np.nan
+        means[:, start:start+chunk] = block_means
+
+    if min_steps is not None:
+        means[nsteps < min_steps] = np.nan
+
+    return means.reshape((ngroups,) + data.shape[1:])
+
+
+def monthly_climatology(data, years, months, ref_period=None):
+    """
+    Monthly climatology of monthly data.
+
+    Parameters
+    ----------
+    data: ndarray
+        Data with time as the first dimension.
+    years, months: ndarray
+        Year and month of every time step (see date_year_month).
+    ref_period: list(int), optional
+        First and last years of the reference period over which the
+        climatology is calculated. Entire period of the data if None.
+
+    Returns
+    -------
+    climo_month: ndarray
+        Climatology of every calendar month, with dims [12,...].
+    """
+    years = np.asarray(years)
+    months = np.asarray(months)
+    sel = np.ones(len(months), dtype=bool)
+    if ref_period:
+        sel &= (years >= ref_period[0]) & (years <= ref_period[1])
+    cols = np.nonzero(sel)[0]
+    return _group_means(data, months[cols] - 1, cols, 12)
+
+
+def monthly_anomalies(data, months, climo_month):
+    """
+    Remove a monthly climatology from monthly data, in place.
+
+    Parameters
+    ----------
+    data: ndarray
+        Data with time as the first dimension. Modified in place.
+    months: ndarray
+        Month of every time step.
+    climo_month: ndarray
+        Climatology of every calendar month, with dims [12,...].
+
+    Returns
+    -------
+    data: ndarray
+        Data anomalies.
+    """
+    months = np.asarray(months)
+    for i in range(12):
+        indsm = months == i+1
+        if np.any(indsm):
+            data[indsm] = data[indsm] - climo_month[i]
+    return data
+
+
+def annual_means(data, years, max_nan=None):
+    """
+    Calendar-year averages of monthly data.
+
+    Parameters
+    ----------
+    data: ndarray
+        Data with time as the first dimension.
+    years: ndarray
+        Year of every time step.
+    max_nan: int, optional
+        Max. nb of missing values allowed in the average of a year.
+        Averages with more missing values are set to NaN.
+
+    Returns
+    -------
+    out_years: ndarray
+        Years of the data, sorted.
+    means: ndarray
+        Annual averages, with dims [len(out_years),...].
+    """
+    out_years, rows = np.unique(years, return_inverse=True)
+    means = _group_means(data, rows.ravel(), np.arange(len(rows)),
+                         len(out_years), max_nan=max_nan)
+    return out_years, means
+
+
+def seasonal_means(data, years, months, avg_months, out_years=None,
+                   max_nan=None, min_steps=None):
+    """
+    Averages of monthly data over a sequence of months, one per year.
+
+    Parameters
+    ----------
+    data: ndarray
+        Data with time as the first dimension.
+    years, months: ndarray
+        Year and month of every time step (see date_year_month).
+    avg_months: list(int)
+        Sequence of months over which to average. Months of the previous
+        year are negative (e.g. -12 for December of the previous year) and
+        months of the following year are > 12 (e.g. 13 for January of the
+        following year).
+    out_years: ndarray, optional
+        Years for which the averages are calculated. Years of the data if
+        None.
+    max_nan: int, optional
+        Max. nb of missing values allowed in an average. Averages with more
+        missing values are set to NaN.
+    min_steps: int, optional
+        Min. nb of time steps (available months) required in an average.
+        Averages over fewer time steps are set to NaN.
+
+    Returns
+    -------
+    out_years: ndarray
+        Years of the averages, sorted.
+    means: ndarray
+        Seasonal averages, with dims [len(out_years),...].
+    """
+    years = np.asarray(years)
+    if out_years is None:
+        out_years = np.unique(years)
+    else:
+        out_years = np.unique(np.asarray(out_years, dtype=int))
+
+    rows, cols = _season_groups(years, months, avg_months, out_years)
+    means = _group_means(data, rows, cols, len(out_years), max_nan=max_nan,
+                         min_steps=min_steps)
+    return out_years, means
+
+
+def season_time_steps(years, months, avg_months, out_years):
+    """
+    Time steps entering the averages over a sequence of months of the given
+    years (see seasonal_means).
+
+    Parameters
+    ----------
+    years, months: ndarray
+        Year and month of every time step (see date_year_month).
+    avg_months: list(int)
+        Sequence of months over which to average.
+    out_years: ndarray
+        Years of the averages.
+
+    Returns
+    -------
+    steps: ndarray
+        Boolean array, True for the time steps needed in the averages.
+    """
+    out_years = np.unique(np.asarray(out_years, dtype=int))
+    _, cols = _season_groups(years, months, avg_months, out_years)
+    steps = np.zeros(len(months), dtype=bool)
+    steps[cols] = True
+    return steps
+
+
+def _season_groups(years, months, avg_months, out_years):
+    """
+    Indices of the average (rows, in sorted out_years) to which each time
+    step (cols) contributes, for averages over a sequence of months.
+    """
+    years = np.asarray(years)
+    months = np.asarray(months)
+    year_before, year_current, year_follow = season_months(avg_months)
+
+    rows = []
+    cols = []
+    # year of the average to which each time step contributes
+    for mths, year_offset in ((year_before, 1), (year_current, 0),
+                              (year_follow, -1)):
+        if not mths or len(out_years) == 0:
+            continue
+        tinds = np.nonzero(np.isin(months, mths))[0]
+        target = years[tinds] + year_offset
+        yinds = np.searchsorted(out_years, target)
+        yinds[yinds == len(out_years)] = 0
+        found = out_years[yinds] == target
+        rows.append(yinds[found])
+        cols.append(tinds[found])
+
+    if rows:
+        return np.concatenate(rows), np.concatenate(cols)
+    return np.array([], dtype=int), np.array([], dtype=int)